@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+A view do chat (/api/ask/) é assíncrona: sirva com um servidor ASGI, por exemplo
+``uvicorn config.asgi:application --workers 2``, para que poucas workers atendam muitas
+conversas sem bloquear as páginas de cadastro.
 """
 
 import os
@@ -14,3 +18,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+# Varredura periódica de contas em atraso, se OVERDUE_SWEEP_INTERVAL estiver definido. Cada worker
+# inicia a sua thread, mas só uma varre por dia (referência única em VarreduraAtrasos); com cron
+# rodando ``manage.py sweep_overdue``, deixe OVERDUE_SWEEP_INTERVAL em 0.
+from core.overdue import iniciar_agendador  # noqa: E402
+
+iniciar_agendador()
@@ -93,6 +93,78 @@ DATABASES = {
 }
 
 
+# Cache
+# O alias 'metricas' guarda os KPIs do dashboard e as métricas do analista (ver core/cache.py),
+# invalidados por contadores de versão dos dados. Com vários workers, use um backend
+# compartilhado, por exemplo METRICS_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# e METRICS_CACHE_LOCATION=/var/tmp/tcc_gestao_cache.
+
+METRICS_CACHE_ALIAS = 'metricas'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'metricas': {
+        'BACKEND': os.environ.get('METRICS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('METRICS_CACHE_LOCATION', 'metricas'),
+        'TIMEOUT': None,
+    },
+}
+
+# Snapshots do assistente (ver core/snapshots.py): amostra e métricas por versão dos dados, em LRU
+# na memória de cada processo. Com ANALYTICS_SNAPSHOT_DIR e pyarrow instalado, também vão para Parquet.
+ANALYTICS_SNAPSHOT_MAX_ENTRIES = 4
+ANALYTICS_SNAPSHOT_MAX_MB = 256
+ANALYTICS_SNAPSHOT_DIR = os.environ.get('ANALYTICS_SNAPSHOT_DIR') or None
+
+# Modelo de linguagem (ver core/llm.py): 'gemini' ou 'local' (determinístico, sem rede, para testes de
+# carga). Cada chamada tem LLM_TIMEOUT segundos e até LLM_ATTEMPTS tentativas; após LLM_BREAKER_FAILURES
+# falhas seguidas o disjuntor recusa chamadas por LLM_BREAKER_SECONDS.
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gemini-2.0-flash')
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 30))
+LLM_ATTEMPTS = int(os.environ.get('LLM_ATTEMPTS', 3))
+LLM_BACKOFF = float(os.environ.get('LLM_BACKOFF', 0.5))
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))
+LLM_BREAKER_FAILURES = int(os.environ.get('LLM_BREAKER_FAILURES', 5))
+LLM_BREAKER_SECONDS = float(os.environ.get('LLM_BREAKER_SECONDS', 30))
+LLM_STUB_LATENCY = float(os.environ.get('LLM_STUB_LATENCY', 0))
+LLM_STUB_RESPONSE = os.environ.get('LLM_STUB_RESPONSE', '')
+
+# Analista (ver core/analyst.py): 'prompt' manda amostra e métricas a cada pergunta; 'ferramentas'
+# deixa o modelo pedir agregações executadas localmente. O corpo de /api/ask/ pode trocar com "modo".
+ANALYST_MODE = os.environ.get('ANALYST_MODE', 'prompt')
+# /api/ask/ é assíncrona: o modelo é aguardado e o acesso ao banco vai para um pool de ANALYST_THREADS
+# threads (0 usa a thread das views síncronas); ANALYST_TIMEOUT (segundos) limita a resposta inteira.
+ANALYST_THREADS = int(os.environ.get('ANALYST_THREADS', 4))
+ANALYST_TIMEOUT = float(os.environ.get('ANALYST_TIMEOUT', 60))
+
+# Cache de respostas do analista (ver core/answers.py): pergunta normalizada + modo + versão dos dados.
+# TTL em segundos (0 desliga); "sem_cache": true no corpo da pergunta ignora o cache.
+ANALYST_ANSWER_CACHE_TTL = int(os.environ.get('ANALYST_ANSWER_CACHE_TTL', 15 * 60))
+ANALYST_ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYST_ANSWER_CACHE_MAX_ENTRIES', 256))
+
+# Histórico do chat (ver core/history.py): as últimas CHAT_HISTORY_TURNS trocas vão na íntegra e o resto
+# num resumo; CHAT_HISTORY_MAX_TOKENS limita os dois juntos e CHAT_HISTORY_SUMMARY_TOKENS só o resumo.
+CHAT_HISTORY_TURNS = int(os.environ.get('CHAT_HISTORY_TURNS', 6))
+CHAT_HISTORY_MAX_TOKENS = int(os.environ.get('CHAT_HISTORY_MAX_TOKENS', 3000))
+CHAT_HISTORY_SUMMARY_TOKENS = int(os.environ.get('CHAT_HISTORY_SUMMARY_TOKENS', 600))
+
+# Varredura de atrasos (ver core/overdue.py): intervalo em segundos da thread que roda junto com a
+# aplicação (asgi/wsgi, uma por worker, uma varredura por dia entre todas); 0 desliga e fica só o
+# comando sweep_overdue, agendado no cron - o recomendado com várias workers.
+OVERDUE_SWEEP_INTERVAL = int(os.environ.get('OVERDUE_SWEEP_INTERVAL', 0))
+
+# Contas a pagar recorrentes (ver core/recurring.py): dias à frente gerados pelo comando
+# generate_recurring_payables e ao salvar uma recorrência.
+RECURRING_PAYABLES_HORIZON = int(os.environ.get('RECURRING_PAYABLES_HORIZON', 90))
+
+# Motor analítico (ver core/analytics.py): threads do DuckDB usadas por consulta.
+ANALYTICS_DUCKDB_THREADS = int(os.environ.get('ANALYTICS_DUCKDB_THREADS', 1))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
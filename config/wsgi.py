@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Varredura periódica de contas em atraso, se OVERDUE_SWEEP_INTERVAL estiver definido. Cada worker
+# inicia a sua thread, mas só uma varre por dia (referência única em VarreduraAtrasos); com cron
+# rodando ``manage.py sweep_overdue``, deixe OVERDUE_SWEEP_INTERVAL em 0.
+from core.overdue import iniciar_agendador  # noqa: E402
+
+iniciar_agendador()
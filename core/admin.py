@@ -1,25 +1,53 @@
 from django.contrib import admin
-from .models import Produto, Venda, Cliente, Fornecedor, ContaPagar, ContaReceber
+from django.db.models import Q
+from . import search
+from .models import Produto, Venda, VendaItem, Cliente, Fornecedor, ContaPagar, ContaPagarRecorrente, ContaReceber, ResumoFinanceiroDiario, MovimentoEstoque, SaldoEstoque
+
+class BuscaTextualMixin:
+    """Admin search through the FTS5 index instead of ``LIKE '%termo%'`` over ``search_fields``."""
+
+    busca_tipo = None
+
+    def condicao_busca(self, termo):
+        return Q(pk__in=search.correspondencias(self.busca_tipo, termo))
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search.disponivel() or not search.termos(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(self.condicao_busca(search_term)), False
 
 @admin.register(Produto)
-class ProdutoAdmin(admin.ModelAdmin):
+class ProdutoAdmin(BuscaTextualMixin, admin.ModelAdmin):
     list_display = ('nome', 'fornecedor', 'preco_venda', 'quantidade_estoque')
     search_fields = ('nome', 'fornecedor__nome_empresa')
+    busca_tipo = 'produtos'
+
+    def condicao_busca(self, termo):
+        return super().condicao_busca(termo) | Q(fornecedor__in=search.correspondencias('fornecedores', termo))
+
+class VendaItemInline(admin.TabularInline):
+    model = VendaItem
+    extra = 0
+    raw_id_fields = ('produto',)
+    readonly_fields = ('valor_total',)
 
 @admin.register(Venda)
 class VendaAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'valor_total', 'data_venda')
-    list_filter = ('data_venda', 'produto', 'cliente')
+    list_filter = ('data_venda', 'status', 'cliente')
+    inlines = [VendaItemInline]
 
 @admin.register(Cliente)
-class ClienteAdmin(admin.ModelAdmin):
+class ClienteAdmin(BuscaTextualMixin, admin.ModelAdmin):
     list_display = ('nome', 'telefone', 'email')
     search_fields = ('nome', 'email')
+    busca_tipo = 'clientes'
 
 @admin.register(Fornecedor)
-class FornecedorAdmin(admin.ModelAdmin):
+class FornecedorAdmin(BuscaTextualMixin, admin.ModelAdmin):
     list_display = ('nome_empresa', 'contato_nome', 'telefone')
     search_fields = ('nome_empresa', 'contato_nome')
+    busca_tipo = 'fornecedores'
 
 @admin.register(ContaPagar)
 class ContaPagarAdmin(admin.ModelAdmin):
@@ -28,9 +56,46 @@ class ContaPagarAdmin(admin.ModelAdmin):
     search_fields = ('descricao', 'fornecedor__nome_empresa')
     date_hierarchy = 'data_vencimento'
 
+@admin.register(ContaPagarRecorrente)
+class ContaPagarRecorrenteAdmin(admin.ModelAdmin):
+    list_display = ('descricao', 'fornecedor', 'valor', 'frequencia', 'dia_vencimento', 'inicio', 'fim', 'ativa', 'gerada_ate')
+    list_filter = ('frequencia', 'ativa', 'fornecedor')
+    search_fields = ('descricao', 'fornecedor__nome_empresa')
+    readonly_fields = ('gerada_ate',)
+
 @admin.register(ContaReceber)
 class ContaReceberAdmin(admin.ModelAdmin):
     list_display = ('descricao','cliente','valor', 'data_vencimento', 'status', 'data_recebimento')
     list_filter = ('status','cliente', 'venda', 'data_vencimento')
-    search_fields = ('descricao', 'cliente__nome', 'venda__produto__nome')
-    date_hierarchy = 'data_vencimento'
\ No newline at end of file
+    search_fields = ('descricao', 'cliente__nome', 'venda__itens__produto__nome')
+    date_hierarchy = 'data_vencimento'
+
+@admin.register(ResumoFinanceiroDiario)
+class ResumoFinanceiroDiarioAdmin(admin.ModelAdmin):
+    list_display = ('dia', 'origem', 'status', 'forma_pagamento', 'registros', 'valor')
+    list_filter = ('origem', 'status', 'forma_pagamento')
+    date_hierarchy = 'dia'
+
+class SomenteLeituraAdmin(admin.ModelAdmin):
+    # Razão e saldos só são gravados pelo serviço de estoque.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(MovimentoEstoque)
+class MovimentoEstoqueAdmin(SomenteLeituraAdmin):
+    list_display = ('data', 'produto', 'motivo', 'quantidade', 'venda')
+    list_filter = ('motivo',)
+    raw_id_fields = ('produto', 'venda')
+    date_hierarchy = 'data'
+
+@admin.register(SaldoEstoque)
+class SaldoEstoqueAdmin(SomenteLeituraAdmin):
+    list_display = ('data', 'produto', 'quantidade')
+    raw_id_fields = ('produto',)
+    date_hierarchy = 'data'
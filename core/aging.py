@@ -0,0 +1,127 @@
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, When
+from django.utils import timezone
+
+from . import cache, rollups
+from .models import Cliente, ContaPagar, ContaReceber, Fornecedor
+
+# Relatório de vencimentos (aging): as contas em aberto de cada cliente ou fornecedor somadas por faixa
+# de atraso numa única consulta agrupada por lado. As faixas viram CASE sobre data_vencimento com datas
+# fixas (hoje - N dias), então o banco não faz aritmética de datas por linha.
+
+ZERO = Decimal('0.00')
+
+# (nome, rótulo, menor atraso, maior atraso) em dias; None deixa o lado aberto.
+FAIXAS = [
+    ('a_vencer', 'À vencer', None, 0),
+    ('ate_30', '1–30 dias', 1, 30),
+    ('ate_60', '31–60 dias', 31, 60),
+    ('ate_90', '61–90 dias', 61, 90),
+    ('acima_90', 'Mais de 90 dias', 91, None),
+]
+NOMES_FAIXAS = [nome for nome, *_ in FAIXAS]
+
+
+@dataclass(frozen=True)
+class Lado:
+    model: type
+    contraparte_model: type
+    contraparte: str        # campo da FK na conta
+    nome: str               # nome da contraparte, visto da conta
+    rotulo: str
+    rotulo_contraparte: str
+    listagem: str           # URL da listagem de contas, usada no detalhamento
+
+
+LADOS = {
+    'receber': Lado(ContaReceber, Cliente, 'cliente', 'cliente__nome', 'Contas a Receber', 'Cliente',
+                    'lista_contas_receber'),
+    'pagar': Lado(ContaPagar, Fornecedor, 'fornecedor', 'fornecedor__nome_empresa', 'Contas a Pagar', 'Fornecedor',
+                  'lista_contas_pagar'),
+}
+
+
+def intervalo(faixa, hoje):
+    """Inclusive ``(primeiro, ultimo)`` due dates of ``faixa`` on ``hoje``; None leaves that end open."""
+    _, _, menor, maior = next(item for item in FAIXAS if item[0] == faixa)
+    primeiro = hoje - timedelta(days=maior) if maior is not None else None
+    ultimo = hoje - timedelta(days=menor) if menor is not None else None
+    return primeiro, ultimo
+
+
+def condicao(faixa, hoje):
+    primeiro, ultimo = intervalo(faixa, hoje)
+    filtro = Q()
+    if primeiro is not None:
+        filtro &= Q(data_vencimento__gte=primeiro)
+    if ultimo is not None:
+        filtro &= Q(data_vencimento__lte=ultimo)
+    return filtro
+
+
+def em_aberto(lado):
+    return LADOS[lado].model.objects.filter(status__in=rollups.STATUS_EM_ABERTO)
+
+
+def relatorio(lado, hoje=None):
+    """Open amounts per counterparty and aging bracket, most overdue first.
+
+    Each row is ``{'contraparte_id', 'contraparte', 'registros', 'total', 'vencido', 'faixas': {nome: valor}}``;
+    accounts without a counterparty come together under ``contraparte_id`` None.
+    """
+    hoje = hoje or timezone.localdate()
+    configuracao = LADOS[lado]
+    valor = DecimalField(max_digits=14, decimal_places=2)
+    somas = {
+        nome: Sum(Case(When(condicao(nome, hoje), then=F('valor')), default=Value(ZERO), output_field=valor))
+        for nome in NOMES_FAIXAS
+    }
+    linhas = (em_aberto(lado).order_by()
+              .values(f'{configuracao.contraparte}_id', configuracao.nome)
+              .annotate(registros=Count('id'), total=Sum('valor'), **somas))
+
+    resultado = []
+    for linha in linhas:
+        faixas = {nome: linha[nome] or ZERO for nome in NOMES_FAIXAS}
+        resultado.append({
+            'contraparte_id': linha[f'{configuracao.contraparte}_id'],
+            'contraparte': linha[configuracao.nome],
+            'registros': linha['registros'],
+            'total': linha['total'] or ZERO,
+            'vencido': sum(faixas.values(), ZERO) - faixas['a_vencer'],
+            'faixas': faixas,
+        })
+    resultado.sort(key=lambda linha: (-linha['vencido'], -linha['total'], linha['contraparte'] or ''))
+    return resultado
+
+
+def relatorio_em_cache(lado):
+    """Today's report for ``lado``, cached until its accounts or counterparties change."""
+    hoje = timezone.localdate()
+    configuracao = LADOS[lado]
+    return cache.cached(f'aging:{lado}:{hoje.isoformat()}', (configuracao.model, configuracao.contraparte_model),
+                        lambda: relatorio(lado, hoje))
+
+
+def totais(linhas):
+    """Column totals of a report (or of one page of it)."""
+    return {
+        'registros': sum(linha['registros'] for linha in linhas),
+        'total': sum((linha['total'] for linha in linhas), ZERO),
+        'vencido': sum((linha['vencido'] for linha in linhas), ZERO),
+        'faixas': {nome: sum((linha['faixas'][nome] for linha in linhas), ZERO) for nome in NOMES_FAIXAS},
+    }
+
+
+def detalhamento(lado, contraparte_id, faixa, hoje):
+    """Query string of the accounts listing showing the open accounts behind one cell of the report."""
+    primeiro, ultimo = intervalo(faixa, hoje) if faixa else (None, None)
+    parametros = {'situacao': 'em_aberto', LADOS[lado].contraparte: contraparte_id or 'nenhum'}
+    if primeiro is not None:
+        parametros['data_inicio'] = primeiro.isoformat()
+    if ultimo is not None:
+        parametros['data_fim'] = ultimo.isoformat()
+    return parametros
@@ -0,0 +1,572 @@
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import llm, rollups, snapshots
+from .models import ContaPagar, ContaReceber, Venda, VendaItem
+
+logger = logging.getLogger(__name__)
+
+# Analista de negócios. Dois modos:
+#   prompt      - o legado: amostra do DataFrame e todas as métricas vão no prompt de cada pergunta;
+#   ferramentas - o modelo pede agregações de uma lista fechada, executadas aqui no banco, e só os
+#                 resultados compactos voltam para ele.
+
+MODO_PROMPT = 'prompt'
+MODO_FERRAMENTAS = 'ferramentas'
+MODOS = [MODO_PROMPT, MODO_FERRAMENTAS]
+
+MAXIMO_RODADAS = 4
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+CONFIGURACAO = {'temperature': 0.0, 'max_output_tokens': 1000}
+
+COLUNAS_PROMPT = [
+    'tipo_registro', 'id_origem', 'produto_nome', 'cliente_nome', 'quantidade_vendida', 'valor_total_venda',
+    'data_transacao', 'status_venda_code', 'valor_conta_receber', 'valor_conta_pagar', 'data_vencimento_pagar',
+    'status_conta_receber', 'data_vencimento_receber', 'data_recebimento',
+]
+
+
+class ErroDeFerramenta(Exception):
+    pass
+
+
+@dataclass
+class Medicao:
+    """Prompt size and latency of one answer, comparable across modes."""
+    modo: str
+    caracteres_prompt: int = 0
+    rodadas: int = 0
+    chamadas_ferramenta: int = 0
+    segundos_dados: float = 0.0
+    segundos_modelo: float = 0.0
+    segundos_total: float = 0.0
+
+    @property
+    def tokens_estimados(self):
+        # Aproximação usual de ~4 caracteres por token.
+        return self.caracteres_prompt // 4
+
+    def as_dict(self):
+        return {
+            'modo': self.modo,
+            'caracteres_prompt': self.caracteres_prompt,
+            'tokens_estimados': self.tokens_estimados,
+            'rodadas': self.rodadas,
+            'chamadas_ferramenta': self.chamadas_ferramenta,
+            'segundos_dados': round(self.segundos_dados, 4),
+            'segundos_modelo': round(self.segundos_modelo, 4),
+            'segundos_total': round(self.segundos_total, 4),
+        }
+
+
+def extrair_json(texto):
+    """The JSON object in a model reply (bare or inside a ```json fence), or None."""
+    texto = (texto or '').strip()
+    inicio = texto.find('```json')
+    fim = texto.rfind('```')
+    if inicio != -1 and fim > inicio:
+        texto = texto[inicio + len('```json'):fim].strip()
+    try:
+        valor = json.loads(texto)
+    except ValueError:
+        return None
+    return valor if isinstance(valor, dict) else None
+
+
+def campo_parcial(texto, campo):
+    """Text received so far of the string field ``campo`` in a JSON reply still arriving, or None."""
+    inicio = re.search(rf'"{re.escape(campo)}"\s*:\s*"', texto or '')
+    if inicio is None:
+        return None
+    # Até a aspa que fecha o valor ou até onde o texto chegou, sem escape pela metade no fim.
+    valor = re.match(r'(?:[^"\\]|\\.)*', texto[inicio.end():], re.S).group()
+    valor = re.sub(r'\\u[0-9a-fA-F]{0,3}$', '', valor)
+    try:
+        return json.loads(f'"{valor}"', strict=False)
+    except ValueError:
+        return None
+
+
+# --- Ferramentas ------------------------------------------------------------------
+
+def _data(argumentos, nome):
+    valor = argumentos.get(nome)
+    if valor in (None, ''):
+        return None
+    try:
+        data = parse_date(str(valor))
+    except ValueError:
+        # Bem formada, mas fora do calendário (ex.: 2024-02-30).
+        data = None
+    if data is None:
+        raise ErroDeFerramenta(f"{nome} inválido: {valor!r} (use AAAA-MM-DD)")
+    return data
+
+
+def _escolha(argumentos, nome, opcoes, padrao=None):
+    valor = argumentos.get(nome) or padrao
+    if valor is not None and valor not in opcoes:
+        raise ErroDeFerramenta(f"{nome} inválido: {valor!r} (opções: {', '.join(opcoes)})")
+    return valor
+
+
+def _limite(argumentos):
+    try:
+        limite = int(argumentos.get('limite') or LIMITE_PADRAO)
+    except (TypeError, ValueError):
+        raise ErroDeFerramenta("limite deve ser um número inteiro")
+    return max(1, min(limite, LIMITE_MAXIMO))
+
+
+def _reais(valor):
+    return round(float(valor or 0), 2)
+
+
+def _vendas(argumentos, prefixo=''):
+    filtros = {}
+    inicio, fim = _data(argumentos, 'inicio'), _data(argumentos, 'fim')
+    if inicio:
+        filtros[f'{prefixo}data_venda__date__gte'] = inicio
+    if fim:
+        filtros[f'{prefixo}data_venda__date__lte'] = fim
+    status = _escolha(argumentos, 'status', [codigo for codigo, _ in Venda.STATUS_CHOICES])
+    if status:
+        filtros[f'{prefixo}status'] = status
+    return filtros
+
+
+def vendas_por_periodo(argumentos):
+    agrupamento = _escolha(argumentos, 'agrupamento', ['dia', 'mes'], 'mes')
+    truncar = TruncDate if agrupamento == 'dia' else TruncMonth
+    linhas = Venda.objects.filter(**_vendas(argumentos)).annotate(periodo=truncar('data_venda')).order_by(
+        'periodo').values('periodo').annotate(vendas=Count('id'), valor=Sum('valor_total'))
+    formato = '%Y-%m-%d' if agrupamento == 'dia' else '%Y-%m'
+    return [{'periodo': linha['periodo'].strftime(formato), 'vendas': linha['vendas'], 'valor': _reais(linha['valor'])}
+            for linha in linhas[:LIMITE_MAXIMO * 8]]
+
+
+def vendas_por_produto(argumentos):
+    linhas = VendaItem.objects.filter(**_vendas(argumentos, 'venda__')).values('produto__nome').annotate(
+        quantidade=Sum('quantidade'), valor=Sum('valor_total')).order_by('-quantidade', 'produto__nome')
+    return [{'produto': linha['produto__nome'], 'quantidade': linha['quantidade'], 'valor': _reais(linha['valor'])}
+            for linha in linhas[:_limite(argumentos)]]
+
+
+def vendas_por_cliente(argumentos):
+    linhas = Venda.objects.filter(**_vendas(argumentos)).values('cliente__nome').annotate(
+        vendas=Count('id'), valor=Sum('valor_total')).order_by('-valor', 'cliente__nome')
+    return [{'cliente': linha['cliente__nome'] or 'Consumidor Final', 'vendas': linha['vendas'],
+             'valor': _reais(linha['valor'])}
+            for linha in linhas[:_limite(argumentos)]]
+
+
+def _contas(model, argumentos):
+    filtros = {}
+    inicio, fim = _data(argumentos, 'inicio'), _data(argumentos, 'fim')
+    if inicio:
+        filtros['data_vencimento__gte'] = inicio
+    if fim:
+        filtros['data_vencimento__lte'] = fim
+    status = _escolha(argumentos, 'status', [codigo for codigo, _ in model.STATUS_CHOICES])
+    if status:
+        filtros['status'] = status
+    return model.objects.filter(**filtros)
+
+
+def contas_por_fornecedor(argumentos):
+    linhas = _contas(ContaPagar, argumentos).values('fornecedor__nome_empresa').annotate(
+        contas=Count('id'), valor=Sum('valor')).order_by('-valor', 'fornecedor__nome_empresa')
+    return [{'fornecedor': linha['fornecedor__nome_empresa'] or 'N/A', 'contas': linha['contas'],
+             'valor': _reais(linha['valor'])}
+            for linha in linhas[:_limite(argumentos)]]
+
+
+def contas_por_status(argumentos):
+    tipo = _escolha(argumentos, 'tipo', ['receber', 'pagar'], 'receber')
+    model = ContaReceber if tipo == 'receber' else ContaPagar
+    linhas = _contas(model, argumentos).order_by('status').values('status').annotate(
+        contas=Count('id'), valor=Sum('valor'))
+    return [{'status': linha['status'], 'contas': linha['contas'], 'valor': _reais(linha['valor'])} for linha in linhas]
+
+
+def metricas_gerais(argumentos):
+    return rollups.aggregated_metrics()
+
+
+PERIODO = {'inicio': 'data inicial AAAA-MM-DD (opcional)', 'fim': 'data final AAAA-MM-DD (opcional)'}
+STATUS_VENDA = {'status': 'CONCLUIDA ou PENDENTE (opcional)'}
+LIMITE = {'limite': f'quantidade de linhas, até {LIMITE_MAXIMO} (padrão {LIMITE_PADRAO})'}
+
+
+@dataclass(frozen=True)
+class Ferramenta:
+    nome: str
+    descricao: str
+    funcao: object
+    parametros: dict = field(default_factory=dict)
+
+
+FERRAMENTAS = {ferramenta.nome: ferramenta for ferramenta in [
+    Ferramenta('metricas_gerais', 'Totais gerais de vendas, contas e estoque, e receita por mês.', metricas_gerais),
+    Ferramenta('vendas_por_periodo', 'Quantidade e valor das vendas por dia ou mês.', vendas_por_periodo,
+               {**PERIODO, **STATUS_VENDA, 'agrupamento': 'dia ou mes (padrão mes)'}),
+    Ferramenta('vendas_por_produto', 'Produtos mais vendidos: unidades e valor.', vendas_por_produto,
+               {**PERIODO, **STATUS_VENDA, **LIMITE}),
+    Ferramenta('vendas_por_cliente', 'Clientes que mais compraram: vendas e valor.', vendas_por_cliente,
+               {**PERIODO, **STATUS_VENDA, **LIMITE}),
+    Ferramenta('contas_por_fornecedor', 'Contas a pagar por fornecedor (vencimento no período).',
+               contas_por_fornecedor, {**PERIODO, 'status': 'ABERTO, PAGO ou ATRASADO (opcional)', **LIMITE}),
+    Ferramenta('contas_por_status', 'Contas a receber ou a pagar por status (vencimento no período).',
+               contas_por_status, {**PERIODO, 'tipo': 'receber ou pagar (padrão receber)',
+                                   'status': 'filtra um status (opcional)'}),
+]}
+
+
+def executar(chamada):
+    """Run one ``{"ferramenta": ..., "argumentos": {...}}`` call; errors become part of the result."""
+    nome = chamada.get('ferramenta') if isinstance(chamada, dict) else None
+    argumentos = chamada.get('argumentos') or {} if isinstance(chamada, dict) else {}
+    ferramenta = FERRAMENTAS.get(nome)
+    if ferramenta is None:
+        return {'ferramenta': nome, 'erro': f"Ferramenta desconhecida. Use uma de: {', '.join(FERRAMENTAS)}"}
+    if not isinstance(argumentos, dict):
+        return {'ferramenta': nome, 'erro': 'argumentos deve ser um objeto JSON'}
+    try:
+        return {'ferramenta': nome, 'argumentos': argumentos, 'resultado': ferramenta.funcao(argumentos)}
+    except ErroDeFerramenta as exc:
+        return {'ferramenta': nome, 'erro': str(exc)}
+
+
+# --- Prompts ------------------------------------------------------------------------
+
+FORMATO_RESPOSTA = """
+    Sempre retorne sua resposta final como um objeto JSON com as chaves:
+    -   `resposta_final`: (String) Resposta direta e conversacional. Inclua números formatados (R$ X,XX, Y unidades).
+    -   `diagnostico`: (String) Diagnóstico factual, APENAS se o usuário pedir análise ou insights; senão "".
+    -   `plano_de_acao`: (String) Ações práticas, APENAS se o usuário pedir recomendações; senão "".
+    -   `dados_analisados`: (Objeto JSON) Resumo dos números usados; {} se a pergunta não exigir dados.
+"""
+
+
+def create_unified_agent_prompt(question, df_json_str, aggregated_metrics):
+    aggregated_metrics_str = json.dumps(aggregated_metrics, indent=2)
+
+    return f"""
+    Você é um assistente de negócios especializado em analisar dados de Vendas, Contas a Receber e Contas a Pagar e Produtos de uma empresa.
+    Seu objetivo é responder às perguntas do usuário de forma precisa, com insights relevantes, diagnósticos e, quando apropriado, planos de ação.
+    Você tem acesso a dados detalhados no formato JSON, representando um DataFrame pandas.
+
+    **REGRAS CRÍTICAS (LEIA ATENTAMENTE E SIGA RIGOROSAMENTE):**
+    1.  **FOCO RESTRITO:** Sua análise deve se concentrar **EXCLUSIVAMENTE em Vendas, Contas a Receber e Contas a Pagar e Produtos**.
+    2.  **DADOS REAIS:** Use **SOMENTE** os dados fornecidos no JSON. **NÃO INVENTE, ADIVINHE OU FABRIQUE DADOS, NOMES (clientes, produtos, fornecedores), VALORES, OU CENÁRIOS QUE NÃO ESTEJAM NO JSON OU IMPLÍCITOS NELE.**
+    3.  **FORMULAÇÃO DA RESPOSTA:** Sempre retorne sua resposta como um objeto JSON. Este JSON DEVE ter as seguintes chaves:
+        -   `resposta_final`: (String) Uma resposta direta e conversacional à pergunta do usuário. Inclua números formatados (R$ X,XX, Y unidades).
+        -   `diagnostico`: (String) Um diagnóstico conciso e factual baseado nos dados analisados, identificando pontos fortes, fracos, ou tendências. **Preencha este campo APENAS se a pergunta do usuário solicitar explicitamente uma análise, diagnóstico, ou insights aprofundados.** Caso contrário, deve ser uma string vazia ("").
+        -   `plano_de_acao`: (String) Sugestões de ações práticas e acionáveis que o gestor pode tomar com base na análise. Seja específico e use os dados (nomes de produtos, clientes, fornecedores) do `dados_analisados` se relevante. Se o resultado indicar falta de dados para uma ação, mencione isso. **Preencha este campo APENAS se a pergunta do usuário solicitar explicitamente um plano de ação, recomendações, ou "o que devo fazer?".** Caso contrário, deve ser uma string vazia ("").
+        -   `dados_analisados`: (Objeto JSON) Um resumo dos cálculos e métricas chave que você usou na sua análise. **Se a pergunta for de natureza conversacional ou não exigir análise de dados, este campo deve ser um objeto JSON vazio ({{}}).**
+    4.  **CONDICIONALIDADE DE ANÁLISE/AÇÃO:** `diagnostico` e `plano_de_acao` SÃO OPCIONAIS e devem ser preenchidos APENAS quando a INTENÇÃO do usuário indicar uma solicitação de análise profunda ou recomendação de ação. Para perguntas simples de dados (ex: "Quantas vendas tivemos?", "Qual o valor da Conta a Pagar X?", "Quantos produtos temos em estoque?"), deixe `diagnostico` e `plano_de_acao` vazios.
+    5.  **SEMPRE UM JSON VÁLIDO:** O retorno DEVE ser um JSON válido.
+    6. **PRIORIZE FATOS AGREGADOS:** Para perguntas sobre **valores totais, quantidades totais ou somas de categorias específicas**, você **DEVE** utilizar os `Fatos Agregados` fornecidos abaixo. **NÃO tente somar os dados brutos do `DataFrame JSON` para essas perguntas, pois os `Fatos Agregados` já são os valores precisos e finais.**
+    ---
+
+    **Fatos Agregados Pré-Calculados (Sempre use para perguntas de totalização):**
+    ```json
+    {aggregated_metrics_str}
+    ```
+
+    ---
+
+    **Dados Detalhados Disponíveis (DataFrame JSON - para análises mais profundas, se os fatos agregados não forem suficientes):**
+    ```json
+    {df_json_str}
+    ```
+
+    **Colunas Disponíveis no DataFrame e Seus Tipos/Valores Importantes (para referência em análises detalhadas):**
+    -   `tipo_registro`: "Venda", "ContaReceber", "ContaPagar", **"Produto"** (use capitalização exata)
+    -   `id_origem`: ID único do registro (Venda, Conta, Produto).
+    -   `produto_nome`: Nome do produto; em Venda e ContaReceber, os produtos do pedido separados por vírgula. (Presente em Venda, ContaReceber, Produto)
+    -   `cliente_nome`: Nome do cliente. (Presente em Venda, ContaReceber)
+    -   `fornecedor_nome`: Nome do fornecedor. (Presente em ContaPagar, Produto)
+    -   `categoria_nome`: Nome da categoria do produto. (Presente em Produto)
+    -   `descricao_produto`: Descrição detalhada do produto. (Presente em Produto)
+    -   `quantidade_vendida`: Quantidade total de unidades em uma venda (soma dos itens). (Presente em Venda, ContaReceber)
+    -   `valor_total_venda`: Valor monetário total de uma venda. (Presente em Venda, ContaReceber)
+    -   `data_transacao`: Data da venda ou transação. (Presente em Venda, ContaReceber)
+    -   `status_venda_code`: Status da venda (e.g., "CONCLUIDA", "PENDENTE" - use capitalização exata). (Presente em Venda, ContaReceber)
+    -   `status_conta_receber`: Status da conta a receber (e.g., "ABERTO", "RECEBIDO", "ATRASADO" - use capitalização exata). (Presente em ContaReceber)
+    -   `valor_conta_receber`: Valor monetário de uma conta a receber. (Presente em ContaReceber)
+    -   `data_vencimento_receber`: Data de vencimento da conta a receber. (Presente em ContaReceber)
+    -   `data_recebimento`: Data de recebimento da conta a receber. (Presente em ContaReceber)
+    -   `valor_conta_pagar`: Valor monetário de uma conta a pagar. (Presente em ContaPagar)
+    -   `status_conta_pagar`: Status da conta a pagar (e.g., "ABERTO", "PAGO", "ATRASADO" - use capitalização exata). (Presente em ContaPagar)
+    -   `data_vencimento_pagar`: Data de vencimento da conta a pagar. (Presente em ContaPagar)
+    -   `data_pagamento`: Data de pagamento da conta a pagar. (Presente em ContaPagar)
+    -   `estoque_atual`: Quantidade de unidades em estoque do produto. (Presente em Produto)
+    -   `preco_compra`: Preço de custo unitário do produto. (Presente em Produto)
+    -   `preco_venda_unitario`: Preço de venda unitário do produto. (Presente em Produto)
+    -   `data_cadastro_produto`: Data de cadastro do produto. (Presente em Produto)
+
+    ---
+
+    **Pergunta do Usuário:** "{question}"
+
+    ---
+
+    **Seu retorno JSON:**
+    ```json
+    {{
+        "resposta_final": "[Resposta direta para o usuário]",
+        "diagnostico": "[Diagnóstico com base nos dados]",
+        "plano_de_acao": "[Plano de ação específico]",
+        "dados_analisados": {{
+            "metrica_1": "valor",
+            "metrica_2": "valor"
+        }}
+    }}
+    ```
+    """
+
+
+def amostra_json(df):
+    """The prompt-mode sample: the relevant columns of the first rows, dates as text."""
+    if df.empty:
+        return ""
+    df_relevant = df[COLUNAS_PROMPT].head(50).copy()
+    for col in ['data_transacao', 'data_vencimento_receber', 'data_recebimento', 'data_vencimento_pagar']:
+        df_relevant[col] = df_relevant[col].dt.strftime('%Y-%m-%d %H:%M:%S').fillna('N/A')
+    return df_relevant.to_json(orient="records", date_format="iso")
+
+
+def prompt_ferramentas(question):
+    catalogo = [
+        {'ferramenta': ferramenta.nome, 'descricao': ferramenta.descricao, 'argumentos': ferramenta.parametros}
+        for ferramenta in FERRAMENTAS.values()
+    ]
+    return f"""
+    Você é um assistente de negócios que analisa Vendas, Contas a Receber, Contas a Pagar e Produtos de uma empresa.
+    Hoje é {timezone.localdate():%Y-%m-%d}. Você não recebe os dados brutos: peça o que precisar às ferramentas abaixo.
+    Use SOMENTE números vindos das ferramentas; não invente nomes nem valores.
+
+    Para chamar ferramentas, responda APENAS com JSON:
+    {{"chamadas": [{{"ferramenta": "<nome>", "argumentos": {{...}}}}]}}
+    Os resultados voltam na mensagem seguinte. Você pode fazer até {MAXIMO_RODADAS - 1} rodadas de chamadas.
+
+    Ferramentas:
+    ```json
+    {json.dumps(catalogo, ensure_ascii=False)}
+    ```
+    {FORMATO_RESPOSTA}
+    **Pergunta do Usuário:** "{question}"
+    """
+
+
+def _chamadas(resposta):
+    """Tool calls requested by a parsed reply, or None when it is the final answer."""
+    if resposta is None or 'resposta_final' in resposta:
+        return None
+    if isinstance(resposta.get('chamadas'), list):
+        return resposta['chamadas']
+    if 'ferramenta' in resposta:
+        return [resposta]
+    return None
+
+
+# --- Conversa -----------------------------------------------------------------------
+# A conversa é um gerador que pede passos ('dados', função) ou ('modelo', texto) e recebe o
+# resultado de cada um; ``responder`` os executa em sequência e ``responder_async`` aguarda o
+# modelo e leva o acesso ao banco para um pool de threads limitado.
+
+DADOS = 'dados'
+MODELO = 'modelo'
+
+
+def _prompt_legado(question):
+    snapshot = snapshots.atual()
+    return create_unified_agent_prompt(question, amostra_json(snapshot.frames['amostra']), snapshot.metricas)
+
+
+def _executar_todas(chamadas):
+    return [executar(chamada) for chamada in chamadas[:LIMITE_PADRAO]]
+
+
+def _conversa(question, modo, medicao):
+    if modo != MODO_FERRAMENTAS:
+        prompt = yield DADOS, partial(_prompt_legado, question)
+        return (yield MODELO, prompt)
+
+    resposta = yield MODELO, prompt_ferramentas(question)
+    for _ in range(MAXIMO_RODADAS - 1):
+        chamadas = _chamadas(extrair_json(resposta))
+        if not chamadas:
+            return resposta
+        resultados = yield DADOS, partial(_executar_todas, chamadas)
+        medicao.chamadas_ferramenta += len(resultados)
+        texto = json.dumps({'resultados': resultados}, ensure_ascii=False, default=str)
+        resposta = yield MODELO, f"Resultados das ferramentas:\n```json\n{texto}\n```"
+
+    if _chamadas(extrair_json(resposta)):
+        resposta = yield MODELO, "Limite de ferramentas atingido. Responda agora, só com o JSON final."
+    return resposta
+
+
+def _iniciar(modo):
+    if modo not in MODOS:
+        raise ValueError(f"Modo desconhecido: {modo}")
+    return Medicao(modo=modo), time.perf_counter()
+
+
+def _registrar(medicao, tipo, valor, segundos):
+    if tipo == MODELO:
+        medicao.caracteres_prompt += len(valor)
+        medicao.rodadas += 1
+        medicao.segundos_modelo += segundos
+    else:
+        medicao.segundos_dados += segundos
+
+
+def _concluir(medicao, inicio):
+    medicao.segundos_total = time.perf_counter() - inicio
+    logger.info("analista (%s): %s", medicao.modo, medicao.as_dict())
+
+
+def responder(chat, question, modo=MODO_PROMPT):
+    """Raw text of the model's final answer to ``question`` in ``chat``, plus its :class:`Medicao`."""
+    medicao, inicio = _iniciar(modo)
+    passos = _conversa(question, modo, medicao)
+    resultado = None
+    while True:
+        try:
+            tipo, valor = passos.send(resultado)
+        except StopIteration as fim:
+            _concluir(medicao, inicio)
+            return fim.value, medicao
+        comeco = time.perf_counter()
+        try:
+            resultado = valor() if tipo == DADOS else chat.send_message(valor, generation_config=CONFIGURACAO).text
+        finally:
+            _registrar(medicao, tipo, valor, time.perf_counter() - comeco)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    """Bounded thread pool for the analyst's database work, apart from the threads serving sync views."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=getattr(settings, 'ANALYST_THREADS', 4),
+                                       thread_name_prefix='analista')
+        return _pool
+
+
+def _no_pool(funcao):
+    if not getattr(settings, 'ANALYST_THREADS', 4):
+        # Sem pool: a thread única das views síncronas, que enxerga a transação da requisição (testes).
+        return sync_to_async(funcao)
+    return sync_to_async(funcao, thread_sensitive=False, executor=pool())
+
+
+async def _enviar_async(chat, texto, ao_receber=None):
+    if ao_receber is not None and hasattr(chat, 'send_message_async'):
+        resposta = await chat.send_message_async(texto, generation_config=CONFIGURACAO, stream=True)
+        recebido = ''
+        async for trecho in resposta:
+            recebido += llm.texto_do_trecho(trecho)
+            await ao_receber(recebido)
+        return recebido
+    if hasattr(chat, 'send_message_async'):
+        resposta = await chat.send_message_async(texto, generation_config=CONFIGURACAO)
+    else:
+        resposta = await _no_pool(partial(chat.send_message, texto, generation_config=CONFIGURACAO))()
+    return resposta.text
+
+
+async def responder_async(chat, question, modo=MODO_PROMPT, ao_receber=None):
+    """Async :func:`responder`: awaits the model and runs the database steps in :func:`pool`.
+
+    With ``ao_receber``, each model reply is streamed and the coroutine is awaited with the text
+    received so far of the current round after every chunk.
+    """
+    medicao, inicio = _iniciar(modo)
+    passos = _conversa(question, modo, medicao)
+    resultado = None
+    while True:
+        try:
+            tipo, valor = passos.send(resultado)
+        except StopIteration as fim:
+            _concluir(medicao, inicio)
+            return fim.value, medicao
+        comeco = time.perf_counter()
+        try:
+            resultado = await (_no_pool(valor)() if tipo == DADOS else _enviar_async(chat, valor, ao_receber))
+        finally:
+            _registrar(medicao, tipo, valor, time.perf_counter() - comeco)
+
+
+# --- Modelo roteirizado -------------------------------------------------------------
+
+class ModeloRoteirizado:
+    """Stand-in for ``GenerativeModel`` replying from a script, for tests and benchmarks.
+
+    Each script entry is a reply text or a callable taking the message sent and returning it.
+    Every chat shares the script and records what was sent in ``enviadas``; ``atraso`` simulates
+    the model's latency in seconds. Streamed replies come in chunks of ``trecho`` characters,
+    ``intervalo`` seconds apart.
+    """
+
+    def __init__(self, roteiro, atraso=0, trecho=16, intervalo=0):
+        self.roteiro = list(roteiro)
+        self.atraso = atraso
+        self.trecho = trecho
+        self.intervalo = intervalo
+        self.enviadas = []
+
+    def start_chat(self, history=None):
+        return self
+
+    def _proxima(self, texto):
+        self.enviadas.append(texto)
+        if not self.roteiro:
+            raise RuntimeError("roteiro do modelo esgotado")
+        passo = self.roteiro.pop(0)
+        return llm.Resposta(passo(texto) if callable(passo) else passo)
+
+    def _espera(self, timeout):
+        # Como um backend de core/llm.py: passando do tempo limite, a chamada falha.
+        if timeout is not None and self.atraso > timeout:
+            return timeout, llm.TempoEsgotado(f"O modelo não respondeu em {timeout}s")
+        return self.atraso, None
+
+    def send_message(self, texto, generation_config=None, timeout=None):
+        segundos, erro = self._espera(timeout)
+        time.sleep(segundos)
+        if erro is not None:
+            raise erro
+        return self._proxima(texto)
+
+    async def send_message_async(self, texto, generation_config=None, stream=False, timeout=None):
+        segundos, erro = self._espera(timeout)
+        await asyncio.sleep(segundos)
+        if erro is not None:
+            raise erro
+        resposta = self._proxima(texto)
+        if stream:
+            return llm.RespostaEmTrechos(resposta.text, self.trecho, self.intervalo)
+        return resposta
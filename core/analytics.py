@@ -0,0 +1,256 @@
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+from django.conf import settings
+from django.db import connection
+
+from .models import Cliente, ContaPagar, ContaReceber, Fornecedor, Produto, Venda, VendaItem
+from .rollups import ORIGEM_PAGAR, ORIGEM_RECEBER, ORIGEM_VENDA, STATUS_EM_ABERTO
+
+logger = logging.getLogger(__name__)
+
+# Motor analítico: as tabelas de negócio são expostas ao DuckDB, que agrega em colunas fora do ORM.
+# Três fontes produzem as mesmas relações (e as mesmas colunas):
+#   sqlite  - o db.sqlite3 anexado somente leitura (precisa da extensão sqlite do DuckDB instalada);
+#   parquet - um diretório exportado por ``exportar``;
+#   banco   - as linhas lidas pelo cursor do Django, em blocos (qualquer backend).
+
+TABELAS = {
+    'vendas': (Venda, ['id', 'cliente_id', 'status', 'forma_pagamento', 'condicao_prazo', 'valor_total', 'data_venda']),
+    'itens': (VendaItem, ['id', 'venda_id', 'produto_id', 'quantidade', 'preco_unitario', 'valor_total']),
+    'produtos': (Produto, ['id', 'nome', 'categoria_id', 'fornecedor_id', 'preco_compra', 'preco_venda',
+                           'quantidade_estoque']),
+    'clientes': (Cliente, ['id', 'nome']),
+    'fornecedores': (Fornecedor, ['id', 'nome_empresa']),
+    'contas_receber': (ContaReceber, ['id', 'venda_id', 'cliente_id', 'descricao', 'valor', 'status',
+                                      'data_vencimento', 'data_recebimento']),
+    'contas_pagar': (ContaPagar, ['id', 'fornecedor_id', 'descricao', 'valor', 'status', 'data_vencimento',
+                                  'data_pagamento']),
+}
+FONTES = ['sqlite', 'parquet', 'banco']
+TAMANHO_BLOCO = 100000
+
+TIPOS = {'DecimalField': 'DOUBLE', 'DateTimeField': 'TIMESTAMP', 'DateField': 'DATE'}
+INTEIROS = {'AutoField', 'BigAutoField', 'ForeignKey', 'OneToOneField', 'IntegerField', 'PositiveIntegerField'}
+
+
+class FonteIndisponivel(Exception):
+    pass
+
+
+def _literal(texto):
+    return "'" + str(texto).replace("'", "''") + "'"
+
+
+def _tipo(campo):
+    tipo = campo.get_internal_type()
+    return TIPOS.get(tipo) or ('BIGINT' if tipo in INTEIROS else 'VARCHAR')
+
+
+def _selecao(tabela):
+    """SELECT list that casts the stored columns of ``tabela`` to fixed DuckDB types."""
+    model, campos = TABELAS[tabela]
+    colunas = []
+    for nome in campos:
+        campo = model._meta.get_field(nome)
+        colunas.append(f'CAST("{campo.column}" AS {_tipo(campo)}) AS {nome}')
+    if tabela == 'vendas':
+        # data_venda é gravada em UTC; o dia local é o mesmo usado pelos resumos diários.
+        fuso = _literal(settings.TIME_ZONE)
+        colunas.append(f"CAST(timezone({fuso}, timezone('UTC', CAST(\"data_venda\" AS TIMESTAMP))) AS DATE) AS dia")
+    return ', '.join(colunas)
+
+
+class Motor:
+    """A DuckDB connection holding the business tables, with the analytical queries as methods."""
+
+    def __init__(self, fonte=None, diretorio=None):
+        self.conexao = duckdb.connect()
+        self.conexao.execute(f"SET threads = {int(getattr(settings, 'ANALYTICS_DUCKDB_THREADS', 1))}")
+        self.conexao.execute("SET TimeZone = 'UTC'")
+        try:
+            self.fonte = self._carregar(fonte, diretorio)
+        except Exception:
+            self.conexao.close()
+            raise
+
+    def _carregar(self, fonte, diretorio):
+        if fonte == 'parquet' or (fonte is None and diretorio):
+            self._de_parquet(diretorio)
+            return 'parquet'
+        if fonte in (None, 'sqlite'):
+            try:
+                self._de_sqlite()
+                return 'sqlite'
+            except FonteIndisponivel as exc:
+                if fonte == 'sqlite':
+                    raise
+                logger.info("motor analítico lendo pelo ORM: %s", exc)
+        self._do_banco()
+        return 'banco'
+
+    def _de_sqlite(self):
+        if connection.vendor != 'sqlite':
+            raise FonteIndisponivel(f"o banco configurado é {connection.vendor}, não sqlite")
+        caminho = str(connection.settings_dict['NAME'])
+        if caminho.startswith('file:') or ':memory:' in caminho or not Path(caminho).is_file():
+            raise FonteIndisponivel("o banco sqlite não é um arquivo")
+        try:
+            # Só LOAD: instalar a extensão baixa da internet e fica a cargo do deploy (INSTALL sqlite).
+            self.conexao.execute("LOAD sqlite")
+        except duckdb.Error as exc:
+            raise FonteIndisponivel(f"extensão sqlite do DuckDB indisponível ({exc})")
+        self.conexao.execute(f"ATTACH {_literal(caminho)} AS origem (TYPE SQLITE, READ_ONLY)")
+        for tabela, (model, _) in TABELAS.items():
+            self.conexao.execute(
+                f'CREATE VIEW {tabela} AS SELECT {_selecao(tabela)} FROM origem."{model._meta.db_table}"'
+            )
+
+    def _de_parquet(self, diretorio):
+        diretorio = Path(diretorio)
+        faltando = [tabela for tabela in TABELAS if not (diretorio / f'{tabela}.parquet').is_file()]
+        if faltando:
+            raise FonteIndisponivel(f"exportação incompleta em {diretorio}: falta {', '.join(faltando)}")
+        for tabela in TABELAS:
+            arquivo = _literal(diretorio / f'{tabela}.parquet')
+            self.conexao.execute(f"CREATE VIEW {tabela} AS SELECT * FROM read_parquet({arquivo})")
+
+    def _do_banco(self):
+        for tabela, (model, campos) in TABELAS.items():
+            colunas = [model._meta.get_field(nome).column for nome in campos]
+            sql, params = model._base_manager.order_by().values_list(*campos).query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                # Em blocos: a memória do Python fica limitada a um bloco, o resto já está no DuckDB.
+                linhas = cursor.fetchmany(TAMANHO_BLOCO)
+                destino = f'CREATE TABLE {tabela} AS'
+                while True:
+                    self.conexao.register('_bloco', pd.DataFrame.from_records(linhas, columns=colunas))
+                    self.conexao.execute(f"{destino} SELECT {_selecao(tabela)} FROM _bloco")
+                    self.conexao.unregister('_bloco')
+                    linhas = cursor.fetchmany(TAMANHO_BLOCO)
+                    if not linhas:
+                        break
+                    destino = f'INSERT INTO {tabela}'
+
+    def close(self):
+        self.conexao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def consultar(self, sql, parametros=None):
+        """Run ``sql`` with named ``$parametros`` and return the result as a DataFrame."""
+        return self.conexao.execute(sql, parametros or {}).df()
+
+    # --- Consultas -------------------------------------------------------------
+
+    def totais_por_status(self):
+        """Records and value per origin (VENDA, RECEBER, PAGAR) and status."""
+        return self.consultar(f"""
+            SELECT '{ORIGEM_VENDA}' AS origem, status, count(*) AS registros, coalesce(sum(valor_total), 0) AS valor
+              FROM vendas GROUP BY status
+            UNION ALL
+            SELECT '{ORIGEM_RECEBER}', status, count(*), coalesce(sum(valor), 0) FROM contas_receber GROUP BY status
+            UNION ALL
+            SELECT '{ORIGEM_PAGAR}', status, count(*), coalesce(sum(valor), 0) FROM contas_pagar GROUP BY status
+            ORDER BY origem, status
+        """)
+
+    def receita_mensal(self, origem=ORIGEM_RECEBER, inicio=None, fim=None):
+        """Monthly completed sales (VENDA) or received receivables (RECEBER), days as in the daily rollups."""
+        if origem == ORIGEM_VENDA:
+            base = "SELECT dia, valor_total AS valor FROM vendas WHERE status = 'CONCLUIDA'"
+        elif origem == ORIGEM_RECEBER:
+            base = ("SELECT coalesce(data_recebimento, data_vencimento) AS dia, valor FROM contas_receber "
+                    "WHERE status = 'RECEBIDO'")
+        else:
+            raise ValueError(f"Origem sem receita: {origem}")
+        return self.consultar(f"""
+            SELECT CAST(date_trunc('month', dia) AS DATE) AS mes, count(*) AS registros, sum(valor) AS valor
+              FROM ({base}) AS receitas
+             WHERE ($inicio IS NULL OR dia >= $inicio) AND ($fim IS NULL OR dia <= $fim)
+             GROUP BY mes ORDER BY mes
+        """, {'inicio': inicio, 'fim': fim})
+
+    def produtos_mais_vendidos(self, limite=5, inicio=None, fim=None):
+        """Products ranked by quantity sold, optionally within a range of local sale days."""
+        return self.consultar("""
+            SELECT p.id AS produto_id, p.nome AS produto_nome, CAST(sum(i.quantidade) AS BIGINT) AS quantidade,
+                   sum(i.valor_total) AS valor
+              FROM itens i
+              JOIN vendas v ON v.id = i.venda_id
+              JOIN produtos p ON p.id = i.produto_id
+             WHERE ($inicio IS NULL OR v.dia >= $inicio) AND ($fim IS NULL OR v.dia <= $fim)
+             GROUP BY p.id, p.nome
+             ORDER BY quantidade DESC, p.nome
+             LIMIT $limite
+        """, {'limite': limite, 'inicio': inicio, 'fim': fim})
+
+    def _vencidas(self):
+        em_aberto = ', '.join(_literal(status) for status in STATUS_EM_ABERTO)
+        return f"""
+            SELECT '{ORIGEM_RECEBER}' AS origem, c.id, c.descricao, coalesce(cl.nome, 'Consumidor Final') AS nome,
+                   c.valor, c.status, c.data_vencimento, CAST($hoje AS DATE) - c.data_vencimento AS dias_em_atraso
+              FROM contas_receber c LEFT JOIN clientes cl ON cl.id = c.cliente_id
+             WHERE c.status IN ({em_aberto}) AND c.data_vencimento < CAST($hoje AS DATE)
+            UNION ALL
+            SELECT '{ORIGEM_PAGAR}', c.id, c.descricao, coalesce(f.nome_empresa, 'N/A'),
+                   c.valor, c.status, c.data_vencimento, CAST($hoje AS DATE) - c.data_vencimento
+              FROM contas_pagar c LEFT JOIN fornecedores f ON f.id = c.fornecedor_id
+             WHERE c.status IN ({em_aberto}) AND c.data_vencimento < CAST($hoje AS DATE)
+        """
+
+    def contas_vencidas(self, hoje, limite=100):
+        """Open receivables and payables due before ``hoje``, most overdue first."""
+        return self.consultar(f"""
+            SELECT * FROM ({self._vencidas()}) AS vencidas
+             ORDER BY dias_em_atraso DESC, origem, id
+             LIMIT $limite
+        """, {'hoje': hoje, 'limite': limite})
+
+    def vencidas_por_faixa(self, hoje):
+        """Overdue count and value per origin and age bracket (1-30, 31-60, 61-90, 90+ days)."""
+        return self.consultar(f"""
+            SELECT origem,
+                   CASE WHEN dias_em_atraso <= 30 THEN '1-30'
+                        WHEN dias_em_atraso <= 60 THEN '31-60'
+                        WHEN dias_em_atraso <= 90 THEN '61-90'
+                        ELSE '90+' END AS faixa,
+                   count(*) AS registros, sum(valor) AS valor
+              FROM ({self._vencidas()}) AS vencidas
+             GROUP BY origem, faixa ORDER BY origem, min(dias_em_atraso)
+        """, {'hoje': hoje})
+
+    def exportar(self, diretorio):
+        """Write every table as ``<tabela>.parquet`` under ``diretorio``, replacing a previous export."""
+        diretorio = Path(diretorio)
+        diretorio.mkdir(parents=True, exist_ok=True)
+        temporaria = Path(tempfile.mkdtemp(prefix='.exportando-', dir=diretorio))
+        try:
+            for tabela in TABELAS:
+                destino = _literal(temporaria / f'{tabela}.parquet')
+                self.conexao.execute(f"COPY (SELECT * FROM {tabela}) TO {destino} (FORMAT PARQUET)")
+            for tabela in TABELAS:
+                (temporaria / f'{tabela}.parquet').replace(diretorio / f'{tabela}.parquet')
+        finally:
+            shutil.rmtree(temporaria, ignore_errors=True)
+        return [diretorio / f'{tabela}.parquet' for tabela in TABELAS]
+
+
+def conectar(fonte=None, diretorio=None):
+    """Open a :class:`Motor`.
+
+    With no ``fonte``, a parquet ``diretorio`` is used when given, else the attached sqlite file,
+    else the rows read through the ORM.
+    """
+    if fonte is not None and fonte not in FONTES:
+        raise ValueError(f"Fonte desconhecida: {fonte}")
+    return Motor(fonte, diretorio)
@@ -0,0 +1,119 @@
+import copy
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import snapshots
+
+logger = logging.getLogger(__name__)
+
+# Cache das respostas do analista. A chave junta a pergunta normalizada, o modo, o dia e a versão
+# dos dados (snapshots.versao_atual): qualquer escrita nas tabelas de negócio muda a versão e as
+# respostas antigas deixam de ser encontradas. Só respostas interpretadas com sucesso entram, e só
+# de perguntas que abrem a sessão: com histórico, a mesma pergunta pode pedir outra resposta.
+
+TTL = 15 * 60
+MAXIMO_ENTRADAS = 256
+
+
+def normalizar(pergunta):
+    """``pergunta`` without case, accents, punctuation or repeated spaces."""
+    texto = unicodedata.normalize('NFKD', pergunta.casefold())
+    texto = ''.join(caractere for caractere in texto if not unicodedata.combining(caractere))
+    return ' '.join(re.sub(r'[^\w\s]', ' ', texto).split())
+
+
+@dataclass
+class _Entrada:
+    versao: str
+    corpo: dict
+    expira: float
+
+
+class CacheDeRespostas:
+    """LRU of parsed answers with a TTL, for the data version they were computed on."""
+
+    def __init__(self, ttl=TTL, maximo_entradas=MAXIMO_ENTRADAS, relogio=time.monotonic):
+        self.ttl = ttl
+        self.maximo_entradas = maximo_entradas
+        self.relogio = relogio
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = {'acertos': 0, 'faltas': 0, 'expirados': 0, 'despejados': 0, 'ignorados': 0}
+
+    @staticmethod
+    def chave(pergunta, modo, versao):
+        return (normalizar(pergunta), modo, timezone.localdate().isoformat(), versao)
+
+    def obter(self, pergunta, modo, versao=None):
+        """Copy of the cached body for ``pergunta`` at ``versao`` (default: the current one), or None."""
+        chave = self.chave(pergunta, modo, versao or snapshots.versao_atual())
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None and entrada.expira <= self.relogio():
+                del self._entradas[chave]
+                self._contadores['expirados'] += 1
+                entrada = None
+            if entrada is None:
+                self._contadores['faltas'] += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self._contadores['acertos'] += 1
+            return copy.deepcopy(entrada.corpo)
+
+    def guardar(self, pergunta, modo, corpo, versao=None):
+        versao = versao or snapshots.versao_atual()
+        chave = self.chave(pergunta, modo, versao)
+        with self._lock:
+            # A versão só avança: entradas de outras versões nunca mais serão encontradas.
+            for antiga in [antiga for antiga, entrada in self._entradas.items() if entrada.versao != versao]:
+                del self._entradas[antiga]
+            self._entradas[chave] = _Entrada(versao, copy.deepcopy(corpo), self.relogio() + self.ttl)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.maximo_entradas:
+                self._entradas.popitem(last=False)
+                self._contadores['despejados'] += 1
+
+    def ignorar(self):
+        """Counts a request that skipped the cache on purpose."""
+        with self._lock:
+            self._contadores['ignorados'] += 1
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            for chave in self._contadores:
+                self._contadores[chave] = 0
+
+    def stats(self):
+        with self._lock:
+            consultas = self._contadores['acertos'] + self._contadores['faltas']
+            return dict(self._contadores, entradas=len(self._entradas),
+                        taxa_acerto=self._contadores['acertos'] / consultas if consultas else 0.0)
+
+
+def habilitado():
+    return bool(getattr(settings, 'ANALYST_ANSWER_CACHE_TTL', TTL))
+
+
+_padrao = None
+_padrao_lock = threading.Lock()
+
+
+def padrao():
+    """The process-wide answer cache, configured from settings on first use."""
+    global _padrao
+    with _padrao_lock:
+        if _padrao is None:
+            _padrao = CacheDeRespostas(
+                ttl=getattr(settings, 'ANALYST_ANSWER_CACHE_TTL', TTL),
+                maximo_entradas=getattr(settings, 'ANALYST_ANSWER_CACHE_MAX_ENTRIES', MAXIMO_ENTRADAS),
+            )
+        return _padrao
@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+
+from .models import Cliente, Fornecedor, Produto, chave_de_busca
+
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+
+# Maior code point válido: como sufixo do prefixo fecha o intervalo [prefixo, prefixo + U+10FFFF)
+# que cobre toda string começada pelo prefixo.
+_FIM_DO_PREFIXO = '\U0010ffff'
+
+
+@dataclass(frozen=True)
+class Fonte:
+    """A searchable model: the name field (folded into ``chave_busca``) and the fields returned."""
+
+    model: type
+    campo: str
+    campos: tuple
+    serializar: object
+
+    def item(self, linha):
+        return {'id': linha['id'], 'texto': linha[self.campo], **self.serializar(linha)}
+
+
+FONTES = {
+    'produtos': Fonte(
+        Produto, 'nome', ('id', 'nome', 'preco_venda', 'quantidade_estoque'),
+        lambda linha: {'preco_venda': float(linha['preco_venda']), 'quantidade_estoque': linha['quantidade_estoque']},
+    ),
+    'clientes': Fonte(
+        Cliente, 'nome', ('id', 'nome', 'telefone', 'email'),
+        lambda linha: {'telefone': linha['telefone'], 'email': linha['email']},
+    ),
+    'fornecedores': Fonte(
+        Fornecedor, 'nome_empresa', ('id', 'nome_empresa', 'contato_nome', 'telefone'),
+        lambda linha: {'contato_nome': linha['contato_nome'], 'telefone': linha['telefone']},
+    ),
+}
+
+
+def limite(valor):
+    try:
+        return max(1, min(int(valor), LIMITE_MAXIMO))
+    except (TypeError, ValueError):
+        return LIMITE_PADRAO
+
+
+def buscar(fonte, termo, quantidade=LIMITE_PADRAO):
+    """Up to ``quantidade`` rows whose name starts with ``termo``, ignoring case and accents.
+
+    The prefix becomes a range over the stored ``chave_busca`` so the lookup is a seek on its index
+    instead of a ``LIKE`` scan; the term is folded by :func:`chave_de_busca` too, so both sides agree.
+    """
+    queryset = fonte.model.objects.all()
+    termo = chave_de_busca((termo or '').strip())
+    if termo:
+        queryset = queryset.filter(chave_busca__gte=termo, chave_busca__lt=termo + _FIM_DO_PREFIXO)
+    linhas = queryset.order_by('chave_busca', 'id').values(*fonte.campos)[:quantidade]
+    return [fonte.item(linha) for linha in linhas]
+
+
+def item(fonte, pk):
+    """The serialized row for ``pk`` (the initial value of an autocomplete widget), or None."""
+    linha = fonte.model.objects.filter(pk=pk).values(*fonte.campos).first()
+    return fonte.item(linha) if linha else None
@@ -0,0 +1,426 @@
+import asyncio
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.utils import timezone
+
+from . import analyst, analytics, cashflow, dataframes, imports, llm, recurring, rollups, sales, snapshots
+from .models import (
+    Categoria, Cliente, ContaPagar, ContaPagarRecorrente, ContaReceber, Fornecedor, Produto, ResumoFinanceiroDiario, Venda,
+    VendaItem, chave_de_busca,
+)
+
+# Os benchmarks gravam dados de exemplo: o comando ``benchmark`` os executa num banco de teste descartável.
+
+
+def _cadastros(produtos, clientes):
+    produtos = Produto.objects.bulk_create(
+        Produto(nome=f'Produto Benchmark {indice}', chave_busca=chave_de_busca(f'Produto Benchmark {indice}'),
+                preco_compra=Decimal('5.00'), preco_venda=Decimal('10.00'), quantidade_estoque=10 ** 9)
+        for indice in range(produtos)
+    )
+    clientes = Cliente.objects.bulk_create(
+        Cliente(nome=f'Cliente Benchmark {indice}', chave_busca=chave_de_busca(f'Cliente Benchmark {indice}'))
+        for indice in range(clientes)
+    )
+    return [produto.pk for produto in produtos], [cliente.pk for cliente in clientes]
+
+
+def linhas_de_vendas(quantidade, produto_ids, cliente_ids, semente=0):
+    """``quantidade`` import rows grouped in orders of 1–3 items, with every payment condition."""
+    sorteio = random.Random(semente)
+    linhas, pedido = [], 0
+    while len(linhas) < quantidade:
+        pedido += 1
+        forma = sorteio.choice(['AV', 'AP'])
+        cabecalho = {
+            'pedido': f'B{pedido}',
+            'cliente_id': sorteio.choice(cliente_ids),
+            'status': sorteio.choice(['CONCLUIDA'] * 4 + ['PENDENTE']),
+            'forma_pagamento': forma,
+            'condicao_prazo': sorteio.choice(['7D', '14D', '28D']) if forma == 'AP' else '',
+        }
+        for produto_id in sorteio.sample(produto_ids, min(sorteio.randint(1, 3), quantidade - len(linhas))):
+            linhas.append({**cabecalho, 'produto_id': produto_id, 'quantidade': sorteio.randint(1, 5)})
+    return list(enumerate(linhas, start=1))
+
+
+def importacao(linhas=5000, produtos=50, clientes=20, lote=imports.TAMANHO_LOTE, comparar=200, **_):
+    """Rows/second of ``imports.importar_vendas`` and, for reference, of saving the same orders one by one."""
+    produto_ids, cliente_ids = _cadastros(produtos, clientes)
+    registros = linhas_de_vendas(linhas, produto_ids, cliente_ids)
+
+    relatorio = imports.importar_vendas(registros, lote)
+    resultado = {
+        'linhas': relatorio.linhas,
+        'vendas': relatorio.vendas,
+        'erros': len(relatorio.erros),
+        'segundos': round(relatorio.segundos, 3),
+        'linhas_por_segundo': relatorio.linhas_por_segundo,
+    }
+
+    if comparar:
+        amostra = linhas_de_vendas(comparar, produto_ids, cliente_ids, semente=1)
+        produtos_por_pk = Produto.objects.in_bulk(produto_ids)
+        pedidos = {}
+        for _, linha in amostra:
+            pedidos.setdefault(linha['pedido'], []).append(linha)
+        inicio = time.perf_counter()
+        for itens in pedidos.values():
+            cabecalho = itens[0]
+            venda = Venda(cliente_id=cabecalho['cliente_id'], status=cabecalho['status'],
+                          forma_pagamento=cabecalho['forma_pagamento'],
+                          condicao_prazo=cabecalho['condicao_prazo'] or None)
+            sales.salvar_venda(venda, [(produtos_por_pk[item['produto_id']], item['quantidade']) for item in itens])
+        segundos = time.perf_counter() - inicio
+        resultado['linhas_por_segundo_venda_a_venda'] = round(len(amostra) / segundos, 1) if segundos else None
+    return resultado
+
+
+def _historico(vendas, produtos=200, clientes=500, semente=0):
+    # Grava direto com bulk_create (sem signals nem estoque): só o volume importa aqui.
+    sorteio = random.Random(semente)
+    fornecedores = Fornecedor.objects.bulk_create(
+        Fornecedor(nome_empresa=f'Fornecedor {i}', chave_busca=chave_de_busca(f'Fornecedor {i}')) for i in range(20))
+    categoria = Categoria.objects.create(nome='Benchmark')
+    produtos = Produto.objects.bulk_create(
+        Produto(nome=f'Produto {i}', chave_busca=chave_de_busca(f'Produto {i}'), fornecedor=sorteio.choice(fornecedores),
+                categoria=categoria, preco_compra=Decimal('5.00'), preco_venda=Decimal('10.00'), quantidade_estoque=100)
+        for i in range(produtos)
+    )
+    clientes = Cliente.objects.bulk_create(
+        Cliente(nome=f'Cliente {i}', chave_busca=chave_de_busca(f'Cliente {i}')) for i in range(clientes))
+    agora = timezone.now()
+
+    for inicio in range(0, vendas, 5000):
+        lote = range(inicio, min(inicio + 5000, vendas))
+        novas = Venda.objects.bulk_create(
+            Venda(cliente=sorteio.choice(clientes), status=sorteio.choice(['CONCLUIDA', 'CONCLUIDA', 'PENDENTE']),
+                  forma_pagamento='AP' if i % 2 else 'AV', condicao_prazo='28D' if i % 2 else None,
+                  valor_total=Decimal('20.00'))
+            for i in lote
+        )
+        VendaItem.objects.bulk_create(
+            VendaItem(venda=venda, produto=sorteio.choice(produtos), quantidade=2, preco_unitario=Decimal('10.00'),
+                      valor_total=Decimal('20.00'))
+            for venda in novas
+        )
+        ContaReceber.objects.bulk_create(
+            ContaReceber(venda=venda, cliente_id=venda.cliente_id, descricao=f'Venda #{venda.pk}', valor=venda.valor_total,
+                         data_vencimento=agora.date() + timedelta(days=28))
+            for venda in novas if venda.status == 'CONCLUIDA'
+        )
+        ContaPagar.objects.bulk_create(
+            ContaPagar(fornecedor=sorteio.choice(fornecedores), descricao='Compra', valor=Decimal('50.00'),
+                       data_vencimento=agora.date())
+            for _ in range(len(lote) // 10)
+        )
+
+
+def _medir(funcao):
+    inicio = time.perf_counter()
+    funcao()
+    segundos = time.perf_counter() - inicio
+    tracemalloc.start()
+    try:
+        funcao()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return round(segundos, 3), round(pico / 2 ** 20, 1)
+
+
+def dataframe(linhas=10000, **_):
+    """Time and peak Python memory (MiB) of the analysis DataFrames over ``linhas`` sales.
+
+    The typed per-entity frames and the combined view are measured separately; memory is traced in a
+    second run so tracing does not inflate the timing.
+    """
+    _historico(linhas)
+    resultado = {'vendas': linhas}
+    resultado['tabelas_segundos'], resultado['tabelas_pico_mib'] = _medir(dataframes.tabelas)
+    resultado['combinado_segundos'], resultado['combinado_pico_mib'] = _medir(dataframes.combinado)
+    resultado['amostra_chat_segundos'], resultado['amostra_chat_pico_mib'] = _medir(
+        lambda: dataframes.combinado(limite=dataframes.LIMITE_CHAT))
+    return resultado
+
+
+def analitico(linhas=10000, **_):
+    """Seconds to load the DuckDB engine (from the ORM and from a Parquet export) and to run each query."""
+    _historico(linhas)
+    hoje = timezone.localdate()
+    consultas = {
+        'totais_por_status': lambda motor: motor.totais_por_status(),
+        'receita_mensal': lambda motor: motor.receita_mensal(analytics.ORIGEM_VENDA),
+        'produtos_mais_vendidos': lambda motor: motor.produtos_mais_vendidos(10),
+        'contas_vencidas': lambda motor: motor.vencidas_por_faixa(hoje + timedelta(days=60)),
+    }
+
+    resultado = {'vendas': linhas}
+    with tempfile.TemporaryDirectory() as diretorio:
+        for fonte in ('banco', 'parquet'):
+            inicio = time.perf_counter()
+            motor = analytics.conectar(fonte, diretorio)
+            resultado[f'{fonte}_carga_segundos'] = round(time.perf_counter() - inicio, 3)
+            with motor:
+                for nome, consulta in consultas.items():
+                    inicio = time.perf_counter()
+                    consulta(motor)
+                    resultado[f'{fonte}_{nome}_segundos'] = round(time.perf_counter() - inicio, 3)
+                if fonte == 'banco':
+                    inicio = time.perf_counter()
+                    motor.exportar(diretorio)
+                    resultado['exportar_segundos'] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+def analista(linhas=10000, **_):
+    """Prompt size and latency of one answer in each analyst mode, with a scripted model (no network)."""
+    _historico(linhas)
+    final = json.dumps({'resposta_final': 'ok', 'diagnostico': '', 'plano_de_acao': '', 'dados_analisados': {}})
+    chamada = json.dumps({'chamadas': [{'ferramenta': 'vendas_por_produto', 'argumentos': {'limite': 5}}]})
+    roteiros = {analyst.MODO_PROMPT: [final], analyst.MODO_FERRAMENTAS: [chamada, final]}
+
+    resultado = {'vendas': linhas}
+    for modo, roteiro in roteiros.items():
+        snapshots.padrao().limpar()
+        modelo = analyst.ModeloRoteirizado(roteiro)
+        _, medicao = analyst.responder(modelo.start_chat(), 'Quais produtos mais venderam?', modo)
+        resultado.update({f'{modo}_{chave}': valor for chave, valor in medicao.as_dict().items() if chave != 'modo'})
+    return resultado
+
+
+def _percentil(valores, fracao):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(fracao * len(ordenados)))]
+
+
+def chat(linhas=10000, perguntas=40, simultaneas=8, latencia=0.05, **_):
+    """Throughput and latency of ``/api/ask/`` end to end (view, history, data, model client), offline.
+
+    The model is the local backend of :mod:`core.llm` answering after ``latencia`` seconds; requests
+    skip the answer cache, except in the last pass, which repeats one question. Each pass opens new
+    sessions, since the cache only answers a session's first question.
+    """
+    from django.test import AsyncClient
+    from django.test.utils import override_settings
+    from django.urls import reverse
+
+    from . import answers, views
+
+    _historico(linhas)
+    cliente = llm.Cliente(llm.ModeloLocal(latencia=latencia), llm.Politica(concorrencia=simultaneas))
+    passagens = {
+        analyst.MODO_PROMPT: {'modo': analyst.MODO_PROMPT, 'sem_cache': True},
+        analyst.MODO_FERRAMENTAS: {'modo': analyst.MODO_FERRAMENTAS, 'sem_cache': True},
+        'cache': {'modo': analyst.MODO_FERRAMENTAS},
+    }
+
+    async def perguntar(http, vagas, sessao, corpo):
+        async with vagas:
+            inicio = time.perf_counter()
+            resposta = await http.post(reverse('ask_api'), json.dumps({
+                'question': 'Quais produtos mais venderam?', 'session_id': sessao, **corpo,
+            }), content_type='application/json')
+            if resposta.status_code != 200:
+                raise RuntimeError(f"/api/ask/ respondeu {resposta.status_code}: {resposta.content[:200]}")
+            return time.perf_counter() - inicio
+
+    async def rodada(nome, corpo):
+        vagas = asyncio.Semaphore(simultaneas)
+        http = AsyncClient()
+        return await asyncio.gather(*[perguntar(http, vagas, f'benchmark-{nome}-{indice}', corpo) for indice in range(perguntas)])
+
+    resultado = {'vendas': linhas, 'perguntas': perguntas, 'simultaneas': simultaneas, 'latencia_modelo': latencia}
+    original = views.model
+    views.model = cliente
+    try:
+        # O cliente de teste do Django se apresenta como "testserver".
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for nome, corpo in passagens.items():
+                snapshots.padrao().limpar()
+                answers.padrao().limpar()
+                inicio = time.perf_counter()
+                tempos = async_to_sync(rodada)(nome, corpo)
+                segundos = time.perf_counter() - inicio
+                resultado.update({
+                    f'{nome}_segundos': round(segundos, 3),
+                    f'{nome}_por_segundo': round(perguntas / segundos, 1),
+                    f'{nome}_p50_segundos': round(_percentil(tempos, 0.5), 3),
+                    f'{nome}_p95_segundos': round(_percentil(tempos, 0.95), 3),
+                })
+    finally:
+        views.model = original
+    resultado.update({f'modelo_{chave}': valor for chave, valor in cliente.stats().items()})
+    return resultado
+
+
+def atrasos(linhas=100000, lote=5000, **_):
+    """Seconds of the overdue sweep over ``linhas`` accounts (half payable, half receivable).
+
+    Due dates spread over two years up to next month. The first sweep catches up on everything;
+    the second is the daily run, reaching only the accounts due on the day before.
+    """
+    from . import overdue
+
+    hoje = timezone.localdate()
+    sorteio = random.Random(0)
+    fornecedor = Fornecedor.objects.create(nome_empresa='Fornecedor Benchmark')
+    for inicio in range(0, linhas, lote):
+        tamanho = min(lote, linhas - inicio)
+        vencimentos = [hoje + timedelta(days=sorteio.randint(-730, 30)) for _ in range(tamanho)]
+        status = [sorteio.choice(['ABERTO', 'ABERTO', 'ABERTO', 'PAGO']) for _ in range(tamanho)]
+        metade = tamanho // 2
+        ContaPagar.objects.bulk_create(
+            ContaPagar(fornecedor=fornecedor, descricao='Compra', valor=Decimal('50.00'), data_vencimento=vencimento,
+                       status=situacao, data_pagamento=vencimento if situacao == 'PAGO' else None)
+            for vencimento, situacao in zip(vencimentos[:metade], status[:metade])
+        )
+        ContaReceber.objects.bulk_create(
+            ContaReceber(descricao='Venda', valor=Decimal('30.00'), data_vencimento=vencimento,
+                         status='RECEBIDO' if situacao == 'PAGO' else situacao,
+                         data_recebimento=vencimento if situacao == 'PAGO' else None)
+            for vencimento, situacao in zip(vencimentos[metade:], status[metade:])
+        )
+    rollups.rebuild()
+
+    resultado = {'contas': linhas}
+    for nome, referencia in (('primeira', hoje - timedelta(days=1)), ('diaria', hoje)):
+        varredura = overdue.varrer(referencia)
+        resultado[f'{nome}_alteradas'] = varredura.contas_pagar + varredura.contas_receber
+        resultado[f'{nome}_segundos'] = round(varredura.segundos, 3)
+    resultado['abertas_vencidas_restantes'] = sum(
+        model.objects.filter(status='ABERTO', data_vencimento__lt=hoje).count() for model in (ContaPagar, ContaReceber))
+    return resultado
+
+
+def _projecao_linha_a_linha(inicio, dias):
+    # Referência: a mesma projeção somando conta a conta em Python.
+    saldo, por_dia = 0, [0] * dias
+    for model, sinal in ((ContaReceber, 1), (ContaPagar, -1)):
+        contas = model.objects.filter(status__in=rollups.STATUS_EM_ABERTO).values_list('data_vencimento', 'valor')
+        for vencimento, valor in contas.iterator(chunk_size=10000):
+            deslocamento = max((vencimento - inicio).days, 0)
+            if deslocamento < dias:
+                por_dia[deslocamento] += sinal * valor
+    for indice, valor in enumerate(por_dia):
+        saldo += valor
+        por_dia[indice] = saldo
+    return por_dia
+
+
+def fluxo_caixa(linhas=1000000, lote=5000, **_):
+    """Seconds of the cash-flow projection over ``linhas`` open accounts (half payable, half receivable).
+
+    Due dates spread from a month ago to seven months ahead, with one pending sale per hundred accounts.
+    The projection is timed cold and from the cache, and checked against a row-by-row pass over the accounts.
+    """
+    hoje = timezone.localdate()
+    sorteio = random.Random(0)
+    fornecedor = Fornecedor.objects.create(nome_empresa='Fornecedor Benchmark')
+    for inicio in range(0, linhas, lote):
+        tamanho = min(lote, linhas - inicio)
+        vencimentos = [hoje + timedelta(days=sorteio.randint(-30, 210)) for _ in range(tamanho)]
+        valores = [Decimal(sorteio.randint(100, 100000)) / 100 for _ in range(tamanho)]
+        metade = tamanho // 2
+        ContaPagar.objects.bulk_create(
+            ContaPagar(fornecedor=fornecedor, descricao='Compra', valor=valor, data_vencimento=vencimento)
+            for vencimento, valor in zip(vencimentos[:metade], valores[:metade])
+        )
+        ContaReceber.objects.bulk_create(
+            ContaReceber(descricao='Venda', valor=valor, data_vencimento=vencimento)
+            for vencimento, valor in zip(vencimentos[metade:], valores[metade:])
+        )
+        Venda.objects.bulk_create(
+            Venda(status='PENDENTE', forma_pagamento='AP', condicao_prazo=sorteio.choice(['7D', '14D', '28D']),
+                  valor_total=valor)
+            for valor in valores[:tamanho // 100]
+        )
+    rollups.rebuild()
+
+    resultado = {'contas': linhas}
+    for dias in cashflow.HORIZONTES:
+        inicio = time.perf_counter()
+        cashflow.projecao(dias)
+        resultado[f'projecao_{dias}_segundos'] = round(time.perf_counter() - inicio, 3)
+        inicio = time.perf_counter()
+        cashflow.projecao(dias).as_json()
+        resultado[f'projecao_{dias}_em_cache_segundos'] = round(time.perf_counter() - inicio, 4)
+
+    dias = cashflow.HORIZONTES[-1]
+    inicio = time.perf_counter()
+    referencia = _projecao_linha_a_linha(hoje, dias)
+    resultado['linha_a_linha_segundos'] = round(time.perf_counter() - inicio, 3)
+    # Sem as vendas pendentes, as duas projeções precisam coincidir.
+    projecao = cashflow.projetar(hoje, dias)
+    vetorizada = np.cumsum(projecao.receber - projecao.pagar)
+    resultado['confere_com_linha_a_linha'] = vetorizada.tolist() == [round(valor * 100) for valor in referencia]
+    return resultado
+
+
+def recorrentes(linhas=5000, comparar=200, **_):
+    """Seconds to generate a year of payables for ``linhas`` recurring contracts, and to run it again.
+
+    Frequencies and due days are mixed; the second run must create nothing. For reference,
+    ``comparar`` contracts are generated one ``ContaPagar.objects.create`` at a time.
+    """
+    hoje = timezone.localdate()
+    sorteio = random.Random(0)
+    fornecedores = Fornecedor.objects.bulk_create(
+        Fornecedor(nome_empresa=f'Fornecedor Benchmark {indice}', chave_busca=chave_de_busca(f'Fornecedor Benchmark {indice}'))
+        for indice in range(50))
+    ContaPagarRecorrente.objects.bulk_create(
+        ContaPagarRecorrente(fornecedor=sorteio.choice(fornecedores), descricao=f'Contrato {indice}',
+                             valor=Decimal(sorteio.randint(1000, 500000)) / 100,
+                             frequencia=sorteio.choice(['MENSAL', 'MENSAL', 'MENSAL', 'TRIMESTRAL', 'ANUAL']),
+                             dia_vencimento=sorteio.randint(1, 31), inicio=hoje - timedelta(days=sorteio.randint(0, 365)))
+        for indice in range(linhas)
+    )
+
+    resultado = {'recorrencias': linhas}
+    for nome in ('primeira', 'segunda'):
+        geracao = recurring.gerar(dias=365, hoje=hoje)
+        resultado[f'{nome}_criadas'] = geracao.criadas
+        resultado[f'{nome}_segundos'] = round(geracao.segundos, 3)
+    resultado['contas'] = ContaPagar.objects.count()
+
+    # Os resumos mantidos pelo lote precisam coincidir com uma reconstrução do zero.
+    campos = ('dia', 'origem', 'status', 'forma_pagamento', 'registros', 'valor')
+    resumos = list(ResumoFinanceiroDiario.objects.order_by(*campos).values_list(*campos))
+    rollups.rebuild()
+    resultado['resumos_conferem'] = resumos == list(ResumoFinanceiroDiario.objects.order_by(*campos).values_list(*campos))
+
+    if comparar:
+        amostra = list(ContaPagarRecorrente.objects.order_by('pk')[:comparar])
+        ContaPagar.objects.filter(recorrencia__in=amostra).delete()
+        criadas = 0
+        inicio = time.perf_counter()
+        for recorrencia in amostra:
+            for dia in recurring.ocorrencias(recorrencia, hoje, hoje + timedelta(days=365)):
+                ContaPagar.objects.create(recorrencia=recorrencia, fornecedor_id=recorrencia.fornecedor_id,
+                                          descricao=recorrencia.descricao, valor=recorrencia.valor, data_vencimento=dia)
+                criadas += 1
+        segundos = time.perf_counter() - inicio
+        resultado['contas_por_segundo_uma_a_uma'] = round(criadas / segundos, 1) if segundos else None
+        if resultado['primeira_segundos']:
+            resultado['contas_por_segundo_em_lote'] = round(resultado['primeira_criadas'] / resultado['primeira_segundos'], 1)
+    return resultado
+
+
+BENCHMARKS = {
+    'importacao': importacao,
+    'dataframe': dataframe,
+    'analitico': analitico,
+    'analista': analista,
+    'chat': chat,
+    'atrasos': atrasos,
+    'fluxo_caixa': fluxo_caixa,
+    'recorrentes': recorrentes,
+}
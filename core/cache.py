@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+_stats_lock = threading.Lock()
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+
+def backend():
+    return caches[getattr(settings, 'METRICS_CACHE_ALIAS', 'metricas')]
+
+
+def _version_key(model):
+    return f'data_version:{model._meta.label_lower}'
+
+
+def data_version(*models):
+    """Current version counter of each model; a new counter starts from a timestamp, never from 1."""
+    chaves = [_version_key(model) for model in models]
+    cache = backend()
+    versoes = cache.get_many(chaves)
+    for chave in chaves:
+        if chave not in versoes:
+            # Se o contador foi despejado do cache, um valor novo evita reaproveitar entradas antigas.
+            cache.add(chave, time.time_ns(), timeout=None)
+            versoes[chave] = cache.get(chave)
+    return tuple(versoes[chave] for chave in chaves)
+
+
+def _bump(model):
+    cache = backend()
+    chave = _version_key(model)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, time.time_ns(), timeout=None)
+
+
+def bump_version(*models):
+    """Invalidate every cached entry that depends on ``models``.
+
+    The counter is bumped immediately and again once the current transaction commits, so a
+    reader that recomputed between the write and the commit cannot keep stale data alive.
+    """
+    for model in models:
+        _bump(model)
+    transaction.on_commit(lambda: [_bump(model) for model in models])
+
+
+def cached(namespace, models, compute, timeout=None):
+    """Return ``compute()`` from the cache, keyed by ``namespace`` and the data version of ``models``."""
+    versao = '.'.join(str(v) for v in data_version(*models))
+    chave = f'{namespace}:{versao}'
+    cache = backend()
+
+    valor = cache.get(chave, _MISSING)
+    with _stats_lock:
+        _stats[namespace]['hits' if valor is not _MISSING else 'misses'] += 1
+    if valor is not _MISSING:
+        return valor
+
+    valor = compute()
+    cache.set(chave, valor, timeout=timeout)
+    logger.debug("cache miss em %s (versão %s)", namespace, versao)
+    return valor
+
+
+def stats():
+    """Hit/miss counters of this process, per namespace."""
+    with _stats_lock:
+        resultado = {}
+        for namespace, contadores in _stats.items():
+            total = contadores['hits'] + contadores['misses']
+            resultado[namespace] = dict(contadores, hit_rate=contadores['hits'] / total if total else 0.0)
+        return resultado
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
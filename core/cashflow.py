@@ -0,0 +1,158 @@
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import cache, rollups, sales
+from .models import ContaPagar, ContaReceber, ResumoFinanceiroDiario, Venda
+
+# Projeção do fluxo de caixa: os valores em aberto saem dos resumos diários (uma linha por dia de
+# vencimento, não por conta) e viram vetores NumPy em centavos; levar os vencidos para hoje, distribuir
+# pelos dias do horizonte e acumular o saldo são operações vetoriais, sem laço por conta.
+
+HORIZONTES = (30, 90, 180)
+HORIZONTE_PADRAO = 30
+
+# Tabelas cujas escritas invalidam a projeção em cache.
+MODELS = (ContaReceber, ContaPagar, Venda)
+
+FLUXOS = ('receber', 'vendas', 'pagar')
+
+
+def horizonte(valor):
+    """Number of days to project from the ``dias`` parameter; raises ValueError outside HORIZONTES."""
+    if valor in (None, ''):
+        return HORIZONTE_PADRAO
+    try:
+        dias = int(valor)
+    except (TypeError, ValueError):
+        dias = None
+    if dias not in HORIZONTES:
+        raise ValueError(f"Horizonte inválido: use {', '.join(map(str, HORIZONTES))} dias.")
+    return dias
+
+
+def saldo_inicial(valor):
+    """Opening balance from the ``saldo_inicial`` parameter (default zero); raises ValueError when malformed."""
+    if valor in (None, ''):
+        return Decimal('0.00')
+    try:
+        saldo = Decimal(str(valor).replace(',', '.'))
+    except InvalidOperation:
+        saldo = None
+    if saldo is None or not saldo.is_finite():
+        raise ValueError("Saldo inicial inválido: informe um número, como 1500.00.")
+    return saldo.quantize(Decimal('0.01'))
+
+
+def _vetores(linhas):
+    """``[(dia, valor)]`` as a ``datetime64[D]`` array and an int64 array of cents."""
+    dias = np.array([dia for dia, _ in linhas], dtype='datetime64[D]')
+    centavos = np.array([round((valor or 0) * 100) for _, valor in linhas], dtype=np.int64)
+    return dias, centavos
+
+
+def _contas_em_aberto(origem):
+    # Conta em aberto fica no resumo do dia do vencimento.
+    linhas = (ResumoFinanceiroDiario.objects.filter(origem=origem, status__in=rollups.STATUS_EM_ABERTO).order_by()
+              .values_list('dia').annotate(total=Sum('valor')))
+    return _vetores(list(linhas))
+
+
+def _vendas_pendentes():
+    """Pending sales, expected on the sale day plus their payment term (they have no receivable yet)."""
+    linhas = list(
+        Venda.objects.filter(status='PENDENTE').order_by().annotate(dia=TruncDate('data_venda'))
+        .values_list('dia', 'forma_pagamento', 'condicao_prazo').annotate(total=Sum('valor_total'))
+    )
+    dias, centavos = _vetores([(dia, total) for dia, _, _, total in linhas])
+    prazos = np.array([sales.PRAZOS.get(condicao, 0) if forma == 'AP' else 0 for _, forma, condicao, _ in linhas],
+                      dtype='timedelta64[D]')
+    return dias + prazos, centavos
+
+
+def _reais(centavos):
+    return (np.asarray(centavos) / 100).round(2).tolist()
+
+
+def distribuir(dias, centavos, inicio, horizonte):
+    """Daily totals of ``centavos`` over ``horizonte`` days from ``inicio``, plus the past-due total.
+
+    Amounts due before ``inicio`` are still expected, so they fall on the first day.
+    """
+    deslocamento = (dias - np.datetime64(inicio, 'D')).astype(np.int64)
+    vencidos = int(centavos[deslocamento < 0].sum())
+    dentro = deslocamento < horizonte
+    por_dia = np.bincount(np.maximum(deslocamento[dentro], 0), weights=centavos[dentro], minlength=horizonte)
+    return np.rint(por_dia).astype(np.int64), vencidos
+
+
+@dataclass(frozen=True)
+class Projecao:
+    """Expected receipts and payments per day, in cents, from ``inicio`` on."""
+    inicio: object
+    receber: np.ndarray
+    vendas: np.ndarray
+    pagar: np.ndarray
+    # {'receber': ..., 'vendas': ..., 'pagar': ...}: centavos vencidos antes de ``inicio``, já no primeiro dia
+    vencidos: dict = field(default_factory=dict)
+
+    @property
+    def dias(self):
+        return len(self.pagar)
+
+    @property
+    def entradas(self):
+        return self.receber + self.vendas
+
+    @property
+    def liquido(self):
+        return self.entradas - self.pagar
+
+    def saldo(self, saldo_inicial=Decimal('0.00')):
+        return round(saldo_inicial * 100) + np.cumsum(self.liquido)
+
+    def as_json(self, saldo_inicial=Decimal('0.00')):
+        saldo = self.saldo(saldo_inicial)
+        menor = int(np.argmin(saldo)) if self.dias else None
+        datas = np.datetime64(self.inicio, 'D') + np.arange(self.dias)
+        return {
+            'inicio': self.inicio.isoformat(),
+            'dias': self.dias,
+            'saldo_inicial': float(saldo_inicial),
+            'datas': datas.astype(str).tolist(),
+            'entradas_receber': _reais(self.receber),
+            'entradas_vendas': _reais(self.vendas),
+            'saidas': _reais(self.pagar),
+            'liquido': _reais(self.liquido),
+            'saldo': _reais(saldo),
+            'totais': {
+                'entradas': _reais(self.entradas.sum()),
+                'saidas': _reais(self.pagar.sum()),
+                'saldo_final': _reais(saldo[-1]) if self.dias else float(saldo_inicial),
+            },
+            'vencidos': {fluxo: _reais(valor) for fluxo, valor in self.vencidos.items()},
+            'menor_saldo': {'data': str(datas[menor]), 'valor': _reais(saldo[menor])} if menor is not None else None,
+        }
+
+
+def projetar(inicio=None, dias=HORIZONTE_PADRAO):
+    """Cash-flow projection over ``dias`` days from ``inicio`` (default: today)."""
+    inicio = inicio or timezone.localdate()
+    fontes = {
+        'receber': _contas_em_aberto(rollups.ORIGEM_RECEBER),
+        'vendas': _vendas_pendentes(),
+        'pagar': _contas_em_aberto(rollups.ORIGEM_PAGAR),
+    }
+    distribuidos = {fluxo: distribuir(*fontes[fluxo], inicio, dias) for fluxo in FLUXOS}
+    return Projecao(inicio=inicio, vencidos={fluxo: vencidos for fluxo, (_, vencidos) in distribuidos.items()},
+                    **{fluxo: por_dia for fluxo, (por_dia, _) in distribuidos.items()})
+
+
+def projecao(dias=HORIZONTE_PADRAO):
+    """Today's projection, cached until the accounts or sales change."""
+    inicio = timezone.localdate()
+    return cache.cached(f'fluxo_caixa:{inicio.isoformat()}:{dias}', MODELS, lambda: projetar(inicio, dias))
@@ -0,0 +1,208 @@
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+from django.db.models import CharField, F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce
+
+from .models import ContaPagar, ContaReceber, Produto, Venda, VendaItem
+
+# DataFrames do assistente: cada entidade é lida coluna a coluna direto do cursor (sem instanciar
+# models) e tipada em bloco; a visão combinada de antes só é montada quando alguém a pede.
+
+LIMITE_CHAT = 50
+
+COLUNAS = [
+    'tipo_registro', 'id_origem', 'produto_nome', 'cliente_nome', 'quantidade_vendida', 'valor_total_venda',
+    'data_transacao', 'status_venda_code', 'status_venda_display', 'forma_pagamento', 'condicao_prazo',
+    'valor_conta_receber', 'status_conta_receber', 'data_vencimento_receber', 'data_recebimento',
+    'fornecedor_nome', 'valor_conta_pagar', 'status_conta_pagar', 'status_conta_pagar_code',
+    'status_conta_pagar_display', 'data_vencimento_pagar', 'data_pagamento', 'estoque_atual', 'preco_compra',
+    'preco_venda_unitario', 'categoria_nome', 'descricao_produto', 'data_cadastro_produto',
+]
+NUMERICAS = [
+    'quantidade_vendida', 'valor_total_venda', 'valor_conta_receber', 'valor_conta_pagar', 'estoque_atual',
+    'preco_compra', 'preco_venda_unitario',
+]
+DATAS = [
+    'data_transacao', 'data_vencimento_receber', 'data_recebimento', 'data_vencimento_pagar', 'data_pagamento',
+    'data_cadastro_produto',
+]
+TIPOS_REGISTRO = ['Venda', 'ContaReceber', 'ContaPagar', 'Produto']
+CATEGORIAS = {
+    'status_venda_code': [codigo for codigo, _ in Venda.STATUS_CHOICES],
+    'status_venda_display': [rotulo for _, rotulo in Venda.STATUS_CHOICES],
+    'forma_pagamento': [rotulo for _, rotulo in Venda.FORMAS_PAGAMENTO],
+    'condicao_prazo': [rotulo for _, rotulo in Venda.CONDICOES_PRAZO] + ['À Vista'],
+    'status_conta_receber': [codigo for codigo, _ in ContaReceber.STATUS_CHOICES],
+    'status_conta_pagar': [codigo for codigo, _ in ContaPagar.STATUS_CHOICES],
+    'status_conta_pagar_code': [codigo for codigo, _ in ContaPagar.STATUS_CHOICES],
+    'status_conta_pagar_display': [rotulo for _, rotulo in ContaPagar.STATUS_CHOICES],
+}
+
+
+def _ler(queryset, colunas, limite=None):
+    """Raw cursor rows of ``queryset`` as a DataFrame; ``colunas`` maps column names to lookups or expressions."""
+    # Tudo vira anotação para que a ordem do SELECT seja a de ``colunas``.
+    apelidos = {f'coluna_{indice}': F(valor) if isinstance(valor, str) else valor
+                for indice, valor in enumerate(colunas.values())}
+    queryset = queryset.annotate(**apelidos).values_list(*apelidos)
+    if limite is not None:
+        queryset = queryset[:limite]
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # Filtro ``__in`` com lista vazia: nada a ler.
+        return pd.DataFrame(columns=list(colunas))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=list(colunas))
+
+
+def _reais(expressao):
+    # Valores monetários já chegam como float, sem criar um Decimal por linha.
+    return Cast(expressao, FloatField())
+
+
+def _texto(expressao):
+    # Datas como texto ISO: o pandas converte a coluna inteira de uma vez, sem o conversor por linha do driver.
+    return Cast(expressao, CharField())
+
+
+def _data_hora(serie):
+    """Stored UTC timestamps as naive local datetime64 values."""
+    return pd.to_datetime(serie, utc=True).dt.tz_convert(settings.TIME_ZONE).dt.tz_localize(None)
+
+
+def _categoria(serie, choices, rotulos=False):
+    categorias = pd.Categorical(serie, categories=[codigo for codigo, _ in choices])
+    return categorias.rename_categories(dict(choices)) if rotulos else categorias
+
+
+def vendas(limite=None, pks=None):
+    """One row per sale, newest first, with the sale's products joined by comma."""
+    queryset = Venda.objects.order_by('-data_venda', '-id')
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    df = _ler(queryset, {
+        'id_origem': 'pk', 'cliente_nome': Coalesce('cliente__nome', Value('Consumidor Final')),
+        'valor_total_venda': _reais('valor_total'), 'data_transacao': _texto('data_venda'), 'status_venda_code': 'status',
+        'forma_pagamento': 'forma_pagamento', 'condicao_prazo': 'condicao_prazo',
+    }, limite)
+
+    itens = VendaItem.objects.order_by('id')
+    if limite is not None or pks is not None:
+        itens = itens.filter(venda_id__in=df['id_origem'].tolist())
+    itens = _ler(itens, {'venda_id': 'venda_id', 'produto_nome': 'produto__nome', 'quantidade': 'quantidade'})
+    # Pedidos de um item só (a maioria) levam o nome direto; só os demais passam pelo join de texto.
+    varios = itens['venda_id'].duplicated(keep=False)
+    nomes = pd.concat([
+        itens.loc[~varios].set_index('venda_id')['produto_nome'],
+        itens.loc[varios].groupby('venda_id', sort=False)['produto_nome'].agg(', '.join),
+    ])
+    df['produto_nome'] = df['id_origem'].map(nomes)
+    df['quantidade_vendida'] = df['id_origem'].map(itens.groupby('venda_id')['quantidade'].sum())
+    df['produto_nome'] = df['produto_nome'].fillna('N/A')
+    df['quantidade_vendida'] = df['quantidade_vendida'].fillna(0).astype('int64')
+
+    df['data_transacao'] = _data_hora(df['data_transacao'])
+    df['status_venda_display'] = _categoria(df['status_venda_code'], Venda.STATUS_CHOICES, rotulos=True)
+    df['status_venda_code'] = _categoria(df['status_venda_code'], Venda.STATUS_CHOICES)
+    df['forma_pagamento'] = _categoria(df['forma_pagamento'], Venda.FORMAS_PAGAMENTO, rotulos=True)
+    df['condicao_prazo'] = pd.Categorical(
+        _categoria(df['condicao_prazo'], Venda.CONDICOES_PRAZO, rotulos=True), categories=CATEGORIAS['condicao_prazo']
+    ).fillna('À Vista')
+    return df[['id_origem', 'produto_nome', 'cliente_nome', 'quantidade_vendida', 'valor_total_venda', 'data_transacao',
+               'status_venda_code', 'status_venda_display', 'forma_pagamento', 'condicao_prazo']]
+
+
+def contas_receber(limite=None):
+    df = _ler(ContaReceber.objects.order_by('data_vencimento', 'id'), {
+        'id_origem': 'pk', 'venda_id': 'venda_id',
+        'cliente_nome': Coalesce('cliente__nome', 'venda__cliente__nome', Value('Consumidor Final')),
+        'valor_conta_receber': _reais('valor'), 'status_conta_receber': 'status', 'data_vencimento_receber': _texto('data_vencimento'),
+        'data_recebimento': _texto('data_recebimento'),
+    }, limite)
+    df['venda_id'] = df['venda_id'].astype('Int64')
+    df['status_conta_receber'] = _categoria(df['status_conta_receber'], ContaReceber.STATUS_CHOICES)
+    df['data_vencimento_receber'] = pd.to_datetime(df['data_vencimento_receber'])
+    df['data_recebimento'] = pd.to_datetime(df['data_recebimento'])
+    return df
+
+
+def contas_pagar(limite=None):
+    df = _ler(ContaPagar.objects.order_by('data_vencimento', 'id'), {
+        'id_origem': 'pk', 'fornecedor_nome': Coalesce('fornecedor__nome_empresa', Value('N/A')),
+        'valor_conta_pagar': _reais('valor'),
+        'status_conta_pagar': 'status', 'data_vencimento_pagar': _texto('data_vencimento'),
+        'data_pagamento': _texto('data_pagamento'),
+    }, limite)
+    df['status_conta_pagar'] = _categoria(df['status_conta_pagar'], ContaPagar.STATUS_CHOICES)
+    df['status_conta_pagar_code'] = df['status_conta_pagar']
+    df['status_conta_pagar_display'] = _categoria(df['status_conta_pagar'].astype(object), ContaPagar.STATUS_CHOICES, rotulos=True)
+    df['data_vencimento_pagar'] = pd.to_datetime(df['data_vencimento_pagar'])
+    df['data_pagamento'] = pd.to_datetime(df['data_pagamento'])
+    return df
+
+
+def produtos(limite=None):
+    df = _ler(Produto.objects.order_by('nome', 'id'), {
+        'id_origem': 'pk', 'produto_nome': 'nome', 'descricao_produto': 'descricao',
+        'fornecedor_nome': Coalesce('fornecedor__nome_empresa', Value('N/A')),
+        'categoria_nome': Coalesce('categoria__nome', Value('N/A')),
+        'preco_compra': _reais('preco_compra'), 'preco_venda_unitario': _reais('preco_venda'),
+        'estoque_atual': 'quantidade_estoque', 'data_cadastro_produto': _texto('data_cadastro'),
+    }, limite)
+    df['data_cadastro_produto'] = _data_hora(df['data_cadastro_produto'])
+    return df
+
+
+CARREGADORES = {
+    'Venda': vendas,
+    'ContaReceber': contas_receber,
+    'ContaPagar': contas_pagar,
+    'Produto': produtos,
+}
+
+
+def tabelas():
+    """Typed DataFrame of every entity, keyed like ``tipo_registro``."""
+    return {tipo: carregar() for tipo, carregar in CARREGADORES.items()}
+
+
+def _com_venda(contas):
+    # As contas a receber herdam as colunas da venda de origem.
+    venda_ids = contas['venda_id'].dropna().astype('int64').tolist()
+    origem = vendas(pks=venda_ids).drop(columns=['cliente_nome']).rename(columns={'id_origem': 'venda_id'})
+    origem['venda_id'] = origem['venda_id'].astype('Int64')
+    contas = contas.merge(origem, on='venda_id', how='left').drop(columns=['venda_id'])
+    contas['produto_nome'] = contas['produto_nome'].fillna('N/A')
+    contas['condicao_prazo'] = contas['condicao_prazo'].fillna('À Vista')
+    return contas
+
+
+def combinado(limite=None):
+    """The legacy single DataFrame (one row per sale, receivable, payable and product, in that order).
+
+    With ``limite``, only the first ``limite`` rows of that order are read from the database.
+    """
+    partes = []
+    restante = limite
+    for tipo, carregar in CARREGADORES.items():
+        if restante is not None and restante <= 0:
+            break
+        df = carregar(limite=restante)
+        if tipo == 'ContaReceber':
+            df = _com_venda(df)
+        partes.append(df.assign(tipo_registro=tipo))
+        if restante is not None:
+            restante -= len(df)
+
+    df = pd.concat(partes, ignore_index=True).reindex(columns=COLUNAS)
+    df['tipo_registro'] = pd.Categorical(df['tipo_registro'], categories=TIPOS_REGISTRO)
+    for coluna, categorias in CATEGORIAS.items():
+        df[coluna] = pd.Categorical(df[coluna], categories=categorias)
+    df[NUMERICAS] = df[NUMERICAS].apply(pd.to_numeric).fillna(0)
+    # Colunas de entidades ausentes da amostra chegam do reindex como float: continuam datas (NaT).
+    df[DATAS] = df[DATAS].apply(pd.to_datetime)
+    return df
@@ -0,0 +1,260 @@
+import csv
+import io
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import ContaPagar, ContaReceber, Venda
+
+CHUNK_SIZE = 2000
+XLSX_LINHAS_POR_BLOCO = 500
+
+
+class Coluna:
+    """One export column: a header, the ``values_list`` field it reads and an optional formatter."""
+
+    def __init__(self, titulo, campo, formatar=None):
+        self.titulo = titulo
+        self.campo = campo
+        self.formatar = formatar
+
+
+def rotulos(choices):
+    mapa = dict(choices)
+    return lambda valor: mapa.get(valor, valor or '')
+
+
+def _local(valor):
+    if isinstance(valor, datetime) and timezone.is_aware(valor):
+        return timezone.localtime(valor).replace(tzinfo=None)
+    return valor
+
+
+def linhas(queryset, colunas):
+    """Yield formatted rows, reading the queryset in chunks through a server-side iterator."""
+    campos = [coluna.campo for coluna in colunas]
+    for registro in queryset.values_list(*campos).iterator(chunk_size=CHUNK_SIZE):
+        yield [
+            coluna.formatar(valor) if coluna.formatar else _local(valor)
+            for coluna, valor in zip(colunas, registro)
+        ]
+
+
+# --- CSV ------------------------------------------------------------------------
+
+class _Eco:
+    """File-like object whose write() hands the line back instead of storing it."""
+
+    def write(self, valor):
+        return valor
+
+
+def _csv_valor(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+
+def stream_csv(colunas, registros):
+    escritor = csv.writer(_Eco())
+    # BOM para o Excel reconhecer o UTF-8 dos acentos.
+    yield '\ufeff' + escritor.writerow([coluna.titulo for coluna in colunas])
+    for registro in registros:
+        yield escritor.writerow([_csv_valor(valor) for valor in registro])
+
+
+# --- XLSX -----------------------------------------------------------------------
+# Planilha mínima (SpreadsheetML) gravada num zip sem seek: o zipfile usa data descriptors,
+# então cada bloco comprimido pode ser enviado assim que fica pronto.
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{nome}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Estilos: 0 = padrão, 1 = data (dd/mm/aaaa), 2 = data e hora.
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="2"><numFmt numFmtId="164" formatCode="dd/mm/yyyy"/>'
+    '<numFmt numFmtId="165" formatCode="dd/mm/yyyy hh:mm"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+    '<borders count="1"><border/></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '</styleSheet>'
+)
+_EPOCA_EXCEL = datetime(1899, 12, 30)
+
+
+class _Coletor(io.RawIOBase):
+    """Unseekable sink that accumulates what zipfile writes until it is drained."""
+
+    def __init__(self):
+        super().__init__()
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def esvaziar(self):
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def _celula(valor):
+    if valor is None or valor == '':
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    if isinstance(valor, datetime):
+        serial = (valor - _EPOCA_EXCEL).total_seconds() / 86400
+        return f'<c s="2"><v>{serial:.6f}</v></c>'
+    if isinstance(valor, date):
+        return f'<c s="1"><v>{(valor - _EPOCA_EXCEL.date()).days}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(valor))}</t></is></c>'
+
+
+def _linha_xml(valores):
+    return '<row>' + ''.join(_celula(valor) for valor in valores) + '</row>'
+
+
+def stream_xlsx(colunas, registros, nome_planilha='Dados'):
+    coletor = _Coletor()
+    arquivo = zipfile.ZipFile(coletor, 'w', compression=zipfile.ZIP_DEFLATED)
+    arquivo.writestr('[Content_Types].xml', _CONTENT_TYPES)
+    arquivo.writestr('_rels/.rels', _RELS)
+    arquivo.writestr('xl/workbook.xml', _WORKBOOK.format(nome=escape(nome_planilha)))
+    arquivo.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+    arquivo.writestr('xl/styles.xml', _STYLES)
+    yield coletor.esvaziar()
+
+    with arquivo.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+        cabecalho = _linha_xml([coluna.titulo for coluna in colunas])
+        planilha.write((
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            + cabecalho
+        ).encode())
+        bloco = []
+        for registro in registros:
+            bloco.append(_linha_xml(registro))
+            if len(bloco) >= XLSX_LINHAS_POR_BLOCO:
+                planilha.write(''.join(bloco).encode())
+                bloco.clear()
+                yield coletor.esvaziar()
+        planilha.write((''.join(bloco) + '</sheetData></worksheet>').encode())
+
+    arquivo.close()
+    yield coletor.esvaziar()
+
+
+# --- Colunas por entidade -----------------------------------------------------------
+
+# Uma linha por item de venda (queryset de VendaItem); os dados do pedido se repetem em cada item.
+COLUNAS_VENDAS = [
+    Coluna('Venda', 'venda_id'),
+    Coluna('Data da Venda', 'venda__data_venda'),
+    Coluna('Cliente', 'venda__cliente__nome', lambda valor: valor or 'Consumidor Final'),
+    Coluna('Produto', 'produto__nome'),
+    Coluna('Quantidade', 'quantidade'),
+    Coluna('Preço Unitário', 'preco_unitario'),
+    Coluna('Valor do Item', 'valor_total'),
+    Coluna('Total da Venda', 'venda__valor_total'),
+    Coluna('Status', 'venda__status', rotulos(Venda.STATUS_CHOICES)),
+    Coluna('Forma de Pagamento', 'venda__forma_pagamento', rotulos(Venda.FORMAS_PAGAMENTO)),
+    Coluna('Condição de Prazo', 'venda__condicao_prazo', rotulos(Venda.CONDICOES_PRAZO)),
+]
+
+COLUNAS_CONTAS_RECEBER = [
+    Coluna('ID', 'pk'),
+    Coluna('Descrição', 'descricao'),
+    Coluna('Cliente', 'cliente__nome'),
+    Coluna('Venda', 'venda_id'),
+    Coluna('Valor', 'valor'),
+    Coluna('Lançamento', 'data_lancamento'),
+    Coluna('Vencimento', 'data_vencimento'),
+    Coluna('Recebimento', 'data_recebimento'),
+    Coluna('Status', 'status', rotulos(ContaReceber.STATUS_CHOICES)),
+]
+
+COLUNAS_CONTAS_PAGAR = [
+    Coluna('ID', 'pk'),
+    Coluna('Descrição', 'descricao'),
+    Coluna('Fornecedor', 'fornecedor__nome_empresa'),
+    Coluna('Valor', 'valor'),
+    Coluna('Lançamento', 'data_lancamento'),
+    Coluna('Vencimento', 'data_vencimento'),
+    Coluna('Pagamento', 'data_pagamento'),
+    Coluna('Status', 'status', rotulos(ContaPagar.STATUS_CHOICES)),
+]
+
+
+# --- Resposta -------------------------------------------------------------------
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', stream_csv),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', stream_xlsx),
+}
+
+
+def export_response(queryset, colunas, nome_arquivo, formato='csv'):
+    """StreamingHttpResponse with ``queryset`` exported as CSV or XLSX; unknown formats fall back to CSV."""
+    if formato not in FORMATOS:
+        formato = 'csv'
+    content_type, gerar = FORMATOS[formato]
+    response = StreamingHttpResponse(gerar(colunas, linhas(queryset, colunas)), content_type=content_type)
+    nome = f"{nome_arquivo}_{timezone.localdate():%Y%m%d}.{formato}"
+    response['Content-Disposition'] = f'attachment; filename="{nome}"'
+    return response
@@ -0,0 +1,120 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import rollups
+
+
+def _data(valor):
+    data = parse_date(valor)
+    if data is None:
+        raise ValueError(valor)
+    return data
+
+
+def _inicio_do_dia(data):
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def _id(valor):
+    return int(valor)
+
+
+def _contraparte(campo):
+    # 'nenhum' seleciona as contas sem contraparte (relatório de vencimentos).
+    return lambda valor: Q(**{f'{campo}__isnull': True}) if valor == 'nenhum' else Q(**{f'{campo}_id': _id(valor)})
+
+
+def _situacao(valor):
+    if valor != 'em_aberto':
+        raise ValueError(valor)
+    return Q(status__in=rollups.STATUS_EM_ABERTO)
+
+
+# Filtros por listagem: parâmetro da query string -> função que devolve o Q correspondente.
+# Cada filtro é coberto por um índice composto declarado no Meta do modelo.
+
+FILTROS_VENDAS = {
+    'status': lambda valor: Q(status=valor),
+    'cliente': lambda valor: Q(cliente_id=_id(valor)),
+    # Intervalo de datetimes (e não data_venda__date) para aproveitar o índice.
+    'data_inicio': lambda valor: Q(data_venda__gte=_inicio_do_dia(_data(valor))),
+    'data_fim': lambda valor: Q(data_venda__lt=_inicio_do_dia(_data(valor) + timedelta(days=1))),
+}
+
+FILTROS_CONTAS_RECEBER = {
+    'status': lambda valor: Q(status=valor),
+    'situacao': _situacao,
+    'cliente': _contraparte('cliente'),
+    'data_inicio': lambda valor: Q(data_vencimento__gte=_data(valor)),
+    'data_fim': lambda valor: Q(data_vencimento__lte=_data(valor)),
+}
+
+FILTROS_CONTAS_PAGAR = {
+    'status': lambda valor: Q(status=valor),
+    'situacao': _situacao,
+    'fornecedor': _contraparte('fornecedor'),
+    'data_inicio': lambda valor: Q(data_vencimento__gte=_data(valor)),
+    'data_fim': lambda valor: Q(data_vencimento__lte=_data(valor)),
+}
+
+FILTROS_PRODUTOS = {
+    'fornecedor': lambda valor: Q(fornecedor_id=_id(valor)),
+}
+
+
+# Ordenações oferecidas em cada listagem: nome -> (rótulo, campos). A primeira é a padrão e
+# todas terminam na pk para que os cursores sejam estáveis.
+
+ORDENACOES_VENDAS = {
+    'recentes': ('Mais recentes', ['-data_venda', '-pk']),
+    'antigas': ('Mais antigas', ['data_venda', 'pk']),
+}
+
+ORDENACOES_CONTAS = {
+    'vencimento_desc': ('Vencimento (mais distante)', ['-data_vencimento', '-pk']),
+    'vencimento': ('Vencimento (mais próximo)', ['data_vencimento', 'pk']),
+}
+
+ORDENACOES_RECORRENCIAS = {
+    'descricao': ('Descrição (A-Z)', ['descricao', 'pk']),
+    'dia': ('Dia do vencimento', ['dia_vencimento', 'pk']),
+}
+
+ORDENACOES_PRODUTOS = {
+    'nome': ('Nome (A-Z)', ['nome', 'pk']),
+    'nome_desc': ('Nome (Z-A)', ['-nome', '-pk']),
+    'estoque': ('Menor estoque', ['quantidade_estoque', 'pk']),
+}
+
+ORDENACOES_CLIENTES = {
+    'nome': ('Nome (A-Z)', ['nome', 'pk']),
+    'nome_desc': ('Nome (Z-A)', ['-nome', '-pk']),
+}
+
+ORDENACOES_FORNECEDORES = {
+    'nome': ('Nome (A-Z)', ['nome_empresa', 'pk']),
+    'nome_desc': ('Nome (Z-A)', ['-nome_empresa', '-pk']),
+}
+
+
+def apply_filters(queryset, params, filtros):
+    """Apply the filters present in ``params``; returns the queryset and the filters in effect.
+
+    Empty or malformed values are ignored instead of failing the whole listing.
+    """
+    ativos = {}
+    for nome, construir in filtros.items():
+        valor = (params.get(nome) or '').strip()
+        if not valor:
+            continue
+        try:
+            condicao = construir(valor)
+        except (TypeError, ValueError, OverflowError):
+            # OverflowError: data_fim=9999-12-31 passa do último dia representável.
+            continue
+        queryset = queryset.filter(condicao)
+        ativos[nome] = valor
+    return queryset, ativos
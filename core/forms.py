@@ -1,5 +1,29 @@
+import json
+
 from django import forms
-from .models import Produto, Cliente, Venda, ContaReceber, ContaPagar, Categoria, Fornecedor
+from django.urls import reverse
+from .autocomplete import FONTES, item
+from .models import Produto, Cliente, Venda, VendaItem, ContaReceber, ContaPagar, ContaPagarRecorrente, Categoria, Fornecedor
+
+
+class AutocompleteWidget(forms.Widget):
+    """Hidden pk plus a search box fed by the autocomplete endpoint, so the choices are never rendered."""
+
+    template_name = 'core/widgets/autocomplete.html'
+
+    def __init__(self, fonte, attrs=None):
+        super().__init__(attrs)
+        self.fonte = fonte
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        inicial = item(FONTES[self.fonte], value) if value not in (None, '') else None
+        context['widget'].update({
+            'url': reverse('autocomplete', kwargs={'fonte': self.fonte}),
+            'inicial': inicial,
+            'inicial_json': json.dumps(inicial) if inicial else '',
+        })
+        return context
 
 class CategoriaForm(forms.ModelForm):
     class Meta:
@@ -16,6 +40,7 @@ class ProdutoForm(forms.ModelForm):
         model = Produto
         fields = '__all__'
         widgets = {
+            'fornecedor': AutocompleteWidget('fornecedores'),
             'descricao': forms.Textarea(attrs={'rows': 3}),
         }
 
@@ -30,13 +55,35 @@ class ClienteForm(forms.ModelForm):
 class VendaForm(forms.ModelForm):
     class Meta:
         model = Venda
-        fields = ['produto', 'cliente', 'quantidade', 'status', 'forma_pagamento', 'condicao_prazo']
+        fields = ['cliente', 'status', 'forma_pagamento', 'condicao_prazo']
+        widgets = {
+            'cliente': AutocompleteWidget('clientes'),
+        }
+
+class VendaItemForm(forms.ModelForm):
+    class Meta:
+        model = VendaItem
+        fields = ['produto', 'quantidade']
+        widgets = {
+            'produto': AutocompleteWidget('produtos'),
+            'quantidade': forms.NumberInput(attrs={'min': 1}),
+        }
+
+    def validate_unique(self):
+        # Os itens são regravados por inteiro ao salvar a venda; duplicatas entre as linhas do
+        # formulário continuam sendo apontadas pelo formset.
+        pass
+
+VendaItemFormSet = forms.inlineformset_factory(
+    Venda, VendaItem, form=VendaItemForm, extra=0, min_num=1, validate_min=True, can_delete=True
+)
 
 class ContaReceberForm(forms.ModelForm):
     class Meta:
         model = ContaReceber
         fields = '__all__'
         widgets = {
+            'cliente': AutocompleteWidget('clientes'),
             'data_vencimento': forms.DateInput(attrs={'type': 'date'}),
             'data_recebimento': forms.DateInput(attrs={'type': 'date'}),
         }
@@ -44,8 +91,19 @@ class ContaReceberForm(forms.ModelForm):
 class ContaPagarForm(forms.ModelForm):
     class Meta:
         model = ContaPagar
-        fields = '__all__'
+        exclude = ['recorrencia']
         widgets = {
+            'fornecedor': AutocompleteWidget('fornecedores'),
             'data_vencimento': forms.DateInput(attrs={'type': 'date'}),
             'data_pagamento': forms.DateInput(attrs={'type': 'date'}),
+        }
+
+class ContaPagarRecorrenteForm(forms.ModelForm):
+    class Meta:
+        model = ContaPagarRecorrente
+        fields = '__all__'
+        widgets = {
+            'fornecedor': AutocompleteWidget('fornecedores'),
+            'inicio': forms.DateInput(attrs={'type': 'date'}),
+            'fim': forms.DateInput(attrs={'type': 'date'}),
         }
\ No newline at end of file
@@ -0,0 +1,151 @@
+import logging
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.utils.text import Truncator
+
+from .models import ChatMessage, ResumoConversa
+
+logger = logging.getLogger(__name__)
+
+# Histórico do chat reenviado ao modelo a cada pergunta. As últimas TURNOS trocas vão na íntegra,
+# dentro de um orçamento de tokens; o que sai dessa janela é dobrado num resumo guardado em
+# ResumoConversa, que só recebe as mensagens que acabaram de sair. Assim cada pergunta lê um
+# número fixo de mensagens (pelo índice sessão + timestamp), por mais longa que seja a sessão.
+# O resumo é escrito pelo modelo, só quando alguma mensagem sai da janela; sem modelo (ou se ele
+# falhar), fica uma transcrição truncada das mensagens antigas.
+
+TURNOS = 6
+MAXIMO_TOKENS = 3000
+MAXIMO_TOKENS_RESUMO = 600
+CARACTERES_POR_LINHA = 240
+CARACTERES_POR_MENSAGEM = 2000
+
+PEDIDO_DE_RESUMO = """Atualize o resumo de uma conversa entre um usuário e o assistente analista de um sistema de gestão.
+Mantenha os fatos de que a conversa ainda pode precisar: números, valores, datas e períodos, nomes de
+produtos, clientes e fornecedores, conclusões e preferências ou pedidos do usuário. Descarte saudações e
+repetições. Responda só com o resumo, em português, em no máximo {palavras} palavras.
+
+Resumo até aqui:
+{resumo}
+
+Novas mensagens:
+{mensagens}"""
+
+
+def estimar_tokens(texto):
+    # Mesma aproximação de analyst.Medicao: ~4 caracteres por token.
+    return len(texto) // 4
+
+
+def linha_do_resumo(mensagem):
+    rotulo = 'Usuário' if mensagem.role == 'user' else 'Assistente'
+    return f"{rotulo}: {Truncator(' '.join(mensagem.content.split())).chars(CARACTERES_POR_LINHA)}"
+
+
+def transcricao_truncada(resumo, mensagens, maximo_tokens):
+    """Fallback without a model: ``resumo`` plus the start of each message, oldest lines dropped beyond ``maximo_tokens``."""
+    linhas = resumo.splitlines() + [linha_do_resumo(mensagem) for mensagem in mensagens]
+    while linhas and estimar_tokens('\n'.join(linhas)) > maximo_tokens:
+        linhas.pop(0)
+    return '\n'.join(linhas)
+
+
+class Resumidor:
+    """Folds messages into the summary by asking ``modelo`` (anything with ``start_chat``) to rewrite it."""
+
+    def __init__(self, modelo):
+        self.modelo = modelo
+
+    def pedido(self, resumo, mensagens, maximo_tokens):
+        linhas = [
+            f"{'Usuário' if mensagem.role == 'user' else 'Assistente'}: "
+            f"{Truncator(mensagem.content).chars(CARACTERES_POR_MENSAGEM)}"
+            for mensagem in mensagens
+        ]
+        # ~4 caracteres por token e ~6 caracteres por palavra em português.
+        return PEDIDO_DE_RESUMO.format(palavras=maximo_tokens * 4 // 6, resumo=resumo or '(vazio)',
+                                       mensagens='\n'.join(linhas))
+
+    def __call__(self, resumo, mensagens, maximo_tokens):
+        resposta = self.modelo.start_chat().send_message(self.pedido(resumo, mensagens, maximo_tokens))
+        return Truncator(resposta.text.strip()).chars(maximo_tokens * 4)
+
+
+def resumir(resumo, mensagens, maximo_tokens, resumidor=None):
+    """New summary text after folding ``mensagens`` into ``resumo``, within ``maximo_tokens``."""
+    if resumidor is not None:
+        try:
+            return resumidor(resumo, mensagens, maximo_tokens)
+        except Exception:
+            logger.exception("falha ao resumir o histórico do chat; guardando a transcrição truncada")
+    return transcricao_truncada(resumo, mensagens, maximo_tokens)
+
+
+@dataclass
+class Janela:
+    resumo: str
+    mensagens: list
+    resumidas: int = 0
+
+    @property
+    def tokens(self):
+        return estimar_tokens(self.resumo) + sum(estimar_tokens(mensagem.content) for mensagem in self.mensagens)
+
+    def historico(self):
+        """The window in ``start_chat(history=...)`` format, the summary going first as one exchange."""
+        itens = []
+        if self.resumo:
+            itens += [
+                {'role': 'user', 'parts': [f"Resumo da conversa até aqui:\n{self.resumo}"]},
+                {'role': 'model', 'parts': ['Entendido.']},
+            ]
+        itens += [{'role': 'user' if mensagem.role == 'user' else 'model', 'parts': [mensagem.content]}
+                  for mensagem in self.mensagens]
+        return itens
+
+
+def janela(session_id, turnos=None, maximo_tokens=None, maximo_tokens_resumo=None, resumidor=None):
+    """The history of ``session_id`` to resend, after folding what left the window into its summary.
+
+    Defaults come from ``CHAT_HISTORY_TURNS``, ``CHAT_HISTORY_MAX_TOKENS`` and
+    ``CHAT_HISTORY_SUMMARY_TOKENS``; the summary counts towards ``maximo_tokens``. ``resumidor``
+    (e.g. a :class:`Resumidor`) writes the summary; without one it is a truncated transcript.
+    """
+    turnos = turnos or getattr(settings, 'CHAT_HISTORY_TURNS', TURNOS)
+    maximo_tokens = maximo_tokens or getattr(settings, 'CHAT_HISTORY_MAX_TOKENS', MAXIMO_TOKENS)
+    maximo_tokens_resumo = maximo_tokens_resumo or getattr(settings, 'CHAT_HISTORY_SUMMARY_TOKENS', MAXIMO_TOKENS_RESUMO)
+    if maximo_tokens_resumo >= maximo_tokens:
+        raise ValueError("O resumo precisa caber no orçamento do histórico")
+
+    resumo = ResumoConversa.objects.filter(session_id=session_id).first()
+    pendentes = ChatMessage.objects.filter(session_id=session_id)
+    if resumo is not None:
+        pendentes = pendentes.filter(timestamp__gt=resumo.ate)
+    recentes = list(pendentes.order_by('-timestamp', '-id')[:2 * turnos])[::-1]
+
+    # Das mais novas para as mais antigas enquanto couberem; a janela sempre começa numa pergunta.
+    inicio, usados = len(recentes), 0
+    while inicio and usados + estimar_tokens(recentes[inicio - 1].content) <= maximo_tokens - maximo_tokens_resumo:
+        inicio -= 1
+        usados += estimar_tokens(recentes[inicio].content)
+    while inicio < len(recentes) and recentes[inicio].role != 'user':
+        inicio += 1
+    mantidas = recentes[inicio:]
+
+    if len(recentes) < 2 * turnos:
+        saindo = recentes[:inicio]
+    else:
+        # Janela cheia: antes dela pode haver mensagens ainda fora do resumo (em geral, a última troca).
+        if mantidas:
+            pendentes = pendentes.filter(timestamp__lt=mantidas[0].timestamp)
+        saindo = list(pendentes.order_by('timestamp', 'id'))
+
+    if resumo is None:
+        resumo = ResumoConversa(session_id=session_id)
+    if saindo:
+        resumo.texto = resumir(resumo.texto, saindo, maximo_tokens_resumo, resumidor)
+        resumo.ate = saindo[-1].timestamp
+        resumo.mensagens += len(saindo)
+        resumo.save()
+    return Janela(resumo=resumo.texto, mensagens=mantidas, resumidas=resumo.mensagens)
@@ -0,0 +1,391 @@
+import csv
+import io
+import json
+import time as relogio
+from dataclasses import dataclass, field
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import cache, rollups, sales, stock
+from .models import Cliente, ContaReceber, MovimentoEstoque, Produto, Venda, VendaItem
+
+TAMANHO_LOTE = 1000
+TAMANHO_LOTE_MAXIMO = 10000
+
+STATUS_VALIDOS = {codigo for codigo, _ in Venda.STATUS_CHOICES}
+FORMAS_VALIDAS = {codigo for codigo, _ in Venda.FORMAS_PAGAMENTO}
+PRAZOS_VALIDOS = {codigo for codigo, _ in Venda.CONDICOES_PRAZO}
+
+
+def tamanho_lote(valor):
+    try:
+        return max(1, min(int(valor), TAMANHO_LOTE_MAXIMO))
+    except (TypeError, ValueError):
+        return TAMANHO_LOTE
+
+
+class LinhaInvalida(ValueError):
+    pass
+
+
+@dataclass
+class RelatorioImportacao:
+    """Outcome of one import: counters, per-row errors and throughput."""
+
+    linhas: int = 0
+    vendas: int = 0
+    itens: int = 0
+    contas_receber: int = 0
+    erros: list = field(default_factory=list)
+    segundos: float = 0.0
+
+    @property
+    def linhas_por_segundo(self):
+        return round(self.linhas / self.segundos, 1) if self.segundos else None
+
+    def erro(self, linha, mensagem):
+        self.erros.append({'linha': linha, 'erro': mensagem})
+
+    def as_dict(self):
+        return {
+            'linhas': self.linhas,
+            'vendas_criadas': self.vendas,
+            'itens_criados': self.itens,
+            'contas_receber_criadas': self.contas_receber,
+            'linhas_com_erro': len({erro['linha'] for erro in self.erros}),
+            'erros': self.erros,
+            'segundos': round(self.segundos, 3),
+            'linhas_por_segundo': self.linhas_por_segundo,
+        }
+
+
+@dataclass
+class Pedido:
+    """One order to be created: the order-level fields of its first row plus every line's item.
+
+    ``itens`` is None when any row of the order failed validation, so the whole order is skipped.
+    """
+
+    chave: str
+    linhas: list
+    itens: list = None
+    cliente_id: int = None
+    status: str = 'CONCLUIDA'
+    forma_pagamento: str = 'AV'
+    condicao_prazo: str = None
+    data_venda: datetime = None
+    invalidas: set = field(default_factory=set)
+
+    def quantidades(self):
+        """``{produto_id: (quantidade, preco_unitario)}``; repeated products are merged, first price wins."""
+        agrupados = {}
+        for produto_id, quantidade, preco in self.itens:
+            anterior, preco_anterior = agrupados.get(produto_id, (0, preco))
+            agrupados[produto_id] = (anterior + quantidade, preco_anterior)
+        return agrupados
+
+
+# --- Leitura ----------------------------------------------------------------------
+
+def ler_csv(arquivo):
+    """Yield ``(número da linha, dict)`` from a CSV file with a header row (binary or text)."""
+    if not isinstance(arquivo, io.TextIOBase):
+        arquivo = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    for numero, registro in enumerate(csv.DictReader(arquivo), start=2):
+        yield numero, registro
+
+
+def ler_jsonl(arquivo):
+    """Yield ``(número da linha, dict)`` from a JSON Lines file; blank lines are skipped."""
+    if not isinstance(arquivo, io.TextIOBase):
+        arquivo = io.TextIOWrapper(arquivo, encoding='utf-8-sig')
+    for numero, texto in enumerate(arquivo, start=1):
+        if not texto.strip():
+            continue
+        try:
+            registro = json.loads(texto)
+        except json.JSONDecodeError as exc:
+            registro = exc
+        yield numero, registro
+
+
+LEITORES = {'csv': ler_csv, 'jsonl': ler_jsonl}
+
+
+def formato_do_arquivo(nome, content_type=''):
+    nome = (nome or '').lower()
+    if nome.endswith(('.jsonl', '.ndjson')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'jsonl'
+    return 'csv'
+
+
+# --- Validação ----------------------------------------------------------------------
+
+def _texto(registro, campo):
+    valor = registro.get(campo)
+    return '' if valor is None else str(valor).strip()
+
+
+def _inteiro(registro, campo, obrigatorio=False):
+    valor = _texto(registro, campo)
+    if not valor:
+        if obrigatorio:
+            raise LinhaInvalida(f"Campo '{campo}' é obrigatório.")
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise LinhaInvalida(f"Campo '{campo}' deve ser um número inteiro.") from None
+
+
+def _data_venda(valor):
+    if not valor:
+        return None
+    data_hora = parse_datetime(valor)
+    if data_hora is None:
+        data = parse_date(valor)
+        if data is None:
+            raise LinhaInvalida("Campo 'data_venda' deve estar no formato AAAA-MM-DD.")
+        data_hora = datetime.combine(data, time.min)
+    if timezone.is_naive(data_hora):
+        data_hora = timezone.make_aware(data_hora)
+    return data_hora
+
+
+def validar_linha(registro):
+    """Parse one input row into ``(pedido fields, (produto_id, quantidade, preco_unitario))``."""
+    if not isinstance(registro, dict):
+        raise LinhaInvalida("Linha não é um objeto JSON válido.")
+
+    produto_id = _inteiro(registro, 'produto_id', obrigatorio=True)
+    quantidade = _inteiro(registro, 'quantidade', obrigatorio=True)
+    if quantidade < 1:
+        raise LinhaInvalida("Campo 'quantidade' deve ser maior que zero.")
+
+    preco = _texto(registro, 'preco_unitario')
+    try:
+        preco = Decimal(preco).quantize(Decimal('0.01')) if preco else None
+    except InvalidOperation:
+        raise LinhaInvalida("Campo 'preco_unitario' deve ser um valor decimal.") from None
+    if preco is not None and preco < 0:
+        raise LinhaInvalida("Campo 'preco_unitario' não pode ser negativo.")
+
+    status = _texto(registro, 'status').upper() or 'CONCLUIDA'
+    forma_pagamento = _texto(registro, 'forma_pagamento').upper() or 'AV'
+    condicao_prazo = _texto(registro, 'condicao_prazo').upper() or None
+    if status not in STATUS_VALIDOS:
+        raise LinhaInvalida(f"Status inválido: {status}.")
+    if forma_pagamento not in FORMAS_VALIDAS:
+        raise LinhaInvalida(f"Forma de pagamento inválida: {forma_pagamento}.")
+    if forma_pagamento == 'AP' and condicao_prazo not in PRAZOS_VALIDOS:
+        raise LinhaInvalida("Vendas a prazo exigem 'condicao_prazo' (7D, 14D ou 28D).")
+    if forma_pagamento == 'AV':
+        condicao_prazo = None
+
+    pedido = {
+        'cliente_id': _inteiro(registro, 'cliente_id'),
+        'status': status,
+        'forma_pagamento': forma_pagamento,
+        'condicao_prazo': condicao_prazo,
+        'data_venda': _data_venda(_texto(registro, 'data_venda')),
+    }
+    return pedido, (produto_id, quantidade, preco)
+
+
+def _registros(registros, relatorio):
+    # Um arquivo corrompido no meio encerra a leitura, mas os pedidos já lidos ainda são gravados.
+    iterador = iter(registros)
+    while True:
+        try:
+            registro = next(iterador)
+        except StopIteration:
+            return
+        except (UnicodeDecodeError, csv.Error) as exc:
+            relatorio.erro(relatorio.linhas + 1, f"Arquivo ilegível a partir desta linha: {exc}")
+            return
+        yield registro
+
+
+def _pedidos(registros, relatorio):
+    """Group consecutive rows sharing a ``pedido`` key into orders; rows without a key are orders."""
+    vistos = set()
+    atual = None
+    for numero, registro in registros:
+        relatorio.linhas += 1
+        chave = _texto(registro, 'pedido') if isinstance(registro, dict) else ''
+        try:
+            campos, item = validar_linha(registro)
+        except LinhaInvalida as exc:
+            relatorio.erro(numero, str(exc))
+            campos, item = {}, None
+
+        if atual is not None and chave and chave == atual.chave:
+            atual.linhas.append(numero)
+            if item is None:
+                atual.invalidas.add(numero)
+                atual.itens = None
+            elif atual.itens is not None:
+                atual.itens.append(item)
+            continue
+
+        if atual is not None:
+            yield atual
+            atual = None
+        if chave and chave in vistos:
+            relatorio.erro(numero, f"Pedido '{chave}' repetido fora de linhas consecutivas.")
+            continue
+        if chave:
+            vistos.add(chave)
+        pedido = Pedido(chave=chave, linhas=[numero], itens=None if item is None else [item], **campos)
+        if item is None:
+            pedido.invalidas.add(numero)
+        if chave:
+            atual = pedido
+        elif item is not None:
+            yield pedido
+    if atual is not None:
+        yield atual
+
+
+def _lotes(pedidos, tamanho):
+    lote, linhas = [], 0
+    for pedido in pedidos:
+        lote.append(pedido)
+        linhas += len(pedido.linhas)
+        if linhas >= tamanho:
+            yield lote
+            lote, linhas = [], 0
+    if lote:
+        yield lote
+
+
+# --- Gravação ------------------------------------------------------------------------
+
+@stock.atomic_com_retentativa
+def _gravar_lote(pedidos):
+    demandas = [pedido.quantidades() for pedido in pedidos]
+    produto_ids = {produto_id for demanda in demandas for produto_id in demanda}
+    produtos = Produto.objects.select_for_update().only('nome', 'preco_venda', 'quantidade_estoque').in_bulk(produto_ids)
+    cliente_ids = {pedido.cliente_id for pedido in pedidos if pedido.cliente_id}
+    clientes = set(Cliente.objects.filter(pk__in=cliente_ids).values_list('pk', flat=True))
+
+    # Reserva o estoque pedido a pedido, na ordem do arquivo, contra o saldo lido no lote;
+    # a baixa de todos os aceitos sai num único UPDATE agregado por produto.
+    saldo = {pk: produto.quantidade_estoque for pk, produto in produtos.items()}
+    aceitos, erros, baixas = [], [], {}
+    for pedido, demanda in zip(pedidos, demandas):
+        erro = None
+        if pedido.cliente_id and pedido.cliente_id not in clientes:
+            erro = f"Cliente {pedido.cliente_id} não encontrado."
+        for produto_id, (quantidade, _) in demanda.items():
+            if erro:
+                break
+            if produto_id not in produtos:
+                erro = f"Produto {produto_id} não encontrado."
+            elif saldo[produto_id] < quantidade:
+                erro = (f"Estoque insuficiente para {produtos[produto_id].nome}. "
+                        f"Apenas {saldo[produto_id]} unidades disponíveis.")
+        if erro:
+            erros.append((pedido, erro))
+            continue
+        for produto_id, (quantidade, _) in demanda.items():
+            saldo[produto_id] -= quantidade
+            baixas[produto_id] = baixas.get(produto_id, 0) + quantidade
+        aceitos.append((pedido, demanda))
+
+    stock.movimentar(baixas)
+
+    vendas, itens_por_venda = [], []
+    for pedido, demanda in aceitos:
+        itens = []
+        for produto_id, (quantidade, preco) in demanda.items():
+            produto = produtos[produto_id]
+            preco = produto.preco_venda if preco is None else preco
+            itens.append(VendaItem(produto=produto, quantidade=quantidade, preco_unitario=preco,
+                                   valor_total=preco * quantidade))
+        vendas.append(Venda(
+            cliente_id=pedido.cliente_id, status=pedido.status, forma_pagamento=pedido.forma_pagamento,
+            condicao_prazo=pedido.condicao_prazo,
+            valor_total=sum((item.valor_total for item in itens), Decimal('0.00')),
+        ))
+        itens_por_venda.append(itens)
+
+    Venda.objects.bulk_create(vendas)
+    # data_venda é auto_now_add: as datas vindas do arquivo entram num UPDATE em lote.
+    datadas = []
+    for venda, (pedido, _) in zip(vendas, aceitos):
+        if pedido.data_venda:
+            venda.data_venda = pedido.data_venda
+            datadas.append(venda)
+    if datadas:
+        Venda.objects.bulk_update(datadas, ['data_venda'])
+
+    itens, contas, movimentos = [], [], []
+    for venda, itens_da_venda in zip(vendas, itens_por_venda):
+        for item in itens_da_venda:
+            item.venda = venda
+            movimentos.append(MovimentoEstoque(produto=item.produto, venda=venda, motivo='VENDA', quantidade=-item.quantidade))
+        itens.extend(itens_da_venda)
+        if venda.status == 'CONCLUIDA':
+            vencimento, status, recebimento = sales.termos_conta_receber(
+                venda.forma_pagamento, venda.condicao_prazo, hoje=timezone.localdate(venda.data_venda)
+            )
+            contas.append(ContaReceber(
+                venda=venda, cliente_id=venda.cliente_id,
+                descricao=sales.descricao_conta_receber(venda, itens_da_venda), valor=venda.valor_total,
+                data_vencimento=vencimento, status=status, data_recebimento=recebimento,
+            ))
+    VendaItem.objects.bulk_create(itens)
+    ContaReceber.objects.bulk_create(contas)
+    MovimentoEstoque.objects.bulk_create(movimentos)
+
+    # bulk_create não dispara os signals: a contribuição do lote entra nos resumos de uma vez.
+    rollups.aplicar_em_lote(
+        [rollups.contribuicao_venda(venda) for venda in vendas]
+        + [rollups.contribuicao_conta_receber(conta, conta.venda.forma_pagamento) for conta in contas]
+    )
+    cache.bump_version(Venda, VendaItem, ContaReceber, Produto)
+    return len(vendas), len(itens), len(contas), erros
+
+
+def importar_vendas(registros, tamanho_lote=TAMANHO_LOTE):
+    """Import ``(número da linha, dict)`` rows as sales, ``tamanho_lote`` rows per transaction.
+
+    Consecutive rows sharing a ``pedido`` value form one order with one item per product; rows without
+    it are single-item orders. An order with an invalid row, an unknown product or client, or not enough
+    stock is skipped as a whole and reported on each of its rows. Returns a ``RelatorioImportacao``.
+    """
+    relatorio = RelatorioImportacao()
+    inicio = relogio.perf_counter()
+
+    for lote in _lotes(_pedidos(_registros(registros, relatorio), relatorio), tamanho_lote):
+        erros = []
+        for pedido in lote:
+            if pedido.itens is None:
+                erros.extend((numero, f"Pedido '{pedido.chave}' recusado: há outra linha inválida no pedido.")
+                             for numero in pedido.linhas if numero not in pedido.invalidas)
+        validos = [pedido for pedido in lote if pedido.itens is not None]
+        if validos:
+            try:
+                vendas, itens, contas, recusados = _gravar_lote(validos)
+            except stock.EstoqueInsuficiente as exc:
+                # O saldo mudou entre a leitura e a baixa (venda concorrente): o lote inteiro é recusado.
+                vendas = itens = contas = 0
+                recusados = [(pedido, str(exc)) for pedido in validos]
+            relatorio.vendas += vendas
+            relatorio.itens += itens
+            relatorio.contas_receber += contas
+            erros.extend((numero, mensagem) for pedido, mensagem in recusados for numero in pedido.linhas)
+        for numero, mensagem in erros:
+            relatorio.erro(numero, mensagem)
+
+    relatorio.erros.sort(key=lambda erro: erro['linha'])
+    relatorio.segundos = relogio.perf_counter() - inicio
+    return relatorio
+
+
+def importar_arquivo(arquivo, formato='csv', tamanho_lote=TAMANHO_LOTE):
+    return importar_vendas(LEITORES[formato](arquivo), tamanho_lote)
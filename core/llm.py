@@ -0,0 +1,437 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Camada de acesso ao modelo de linguagem. Um backend é qualquer objeto com ``start_chat(history)``
+# cuja sessão tenha ``send_message(texto, generation_config=None, timeout=None)`` e
+# ``send_message_async(texto, generation_config=None, stream=False, timeout=None)`` - a interface
+# que o analista já usa. O Cliente envolve o backend com tempo limite por chamada, novas tentativas
+# com espera exponencial, disjuntor e limite de chamadas simultâneas.
+
+BACKEND_GEMINI = 'gemini'
+BACKEND_LOCAL = 'local'
+BACKENDS = [BACKEND_GEMINI, BACKEND_LOCAL]
+
+
+class ErroDoModelo(Exception):
+    pass
+
+
+class ErroTransitorio(ErroDoModelo):
+    """A failure worth retrying (overload, unavailable service)."""
+
+
+class TempoEsgotado(ErroDoModelo, TimeoutError):
+    pass
+
+
+class CircuitoAberto(ErroDoModelo):
+    pass
+
+
+class ModeloOcupado(ErroDoModelo):
+    """No free slot under the concurrency limit within the call's timeout."""
+
+
+@dataclass
+class Politica:
+    timeout: float = 30.0
+    tentativas: int = 3
+    espera_inicial: float = 0.5
+    espera_maxima: float = 8.0
+    concorrencia: int = 8
+    falhas_para_abrir: int = 5
+    segundos_aberto: float = 30.0
+
+    def espera(self, tentativa):
+        # Exponencial com variação aleatória, para as repetições de várias requisições não coincidirem.
+        teto = min(self.espera_maxima, self.espera_inicial * 2 ** tentativa)
+        return random.uniform(teto / 2, teto)
+
+
+class Disjuntor:
+    """Circuit breaker: opens after consecutive failures, lets one trial call through after a pause."""
+
+    FECHADO = 'fechado'
+    ABERTO = 'aberto'
+    MEIO_ABERTO = 'meio-aberto'
+
+    def __init__(self, falhas_para_abrir=5, segundos_aberto=30.0, relogio=time.monotonic):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.segundos_aberto = segundos_aberto
+        self.relogio = relogio
+        self.estado = self.FECHADO
+        self.falhas = 0
+        self._aberto_em = 0.0
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """Raise CircuitoAberto unless the call may go ahead; True when it is the trial call."""
+        with self._lock:
+            if self.estado == self.FECHADO:
+                return False
+            if self.estado == self.ABERTO and self.relogio() - self._aberto_em >= self.segundos_aberto:
+                # Uma chamada de teste; as demais esperam o resultado dela.
+                self.estado = self.MEIO_ABERTO
+                return True
+            raise CircuitoAberto("Modelo indisponível: muitas falhas seguidas")
+
+    def liberar(self):
+        """End a trial call that recorded neither success nor failure (definitive error, cancellation)."""
+        with self._lock:
+            if self.estado == self.MEIO_ABERTO:
+                # Sem veredito sobre o modelo: a próxima chamada vira o novo teste.
+                self.estado = self.ABERTO
+
+    def sucesso(self):
+        with self._lock:
+            self.estado = self.FECHADO
+            self.falhas = 0
+
+    def falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.estado == self.MEIO_ABERTO or self.falhas >= self.falhas_para_abrir:
+                if self.estado != self.ABERTO:
+                    logger.warning("disjuntor do modelo aberto após %d falhas", self.falhas)
+                self.estado = self.ABERTO
+                self._aberto_em = self.relogio()
+
+
+class Cliente:
+    """``GenerativeModel``-like wrapper applying a :class:`Politica` to every call of ``backend``."""
+
+    def __init__(self, backend, politica=None, transitorios=(), disjuntor=None, dormir=time.sleep):
+        self.backend = backend
+        self.politica = politica or Politica()
+        self.transitorios = (ErroTransitorio, TempoEsgotado) + tuple(transitorios)
+        self.disjuntor = disjuntor or Disjuntor(self.politica.falhas_para_abrir, self.politica.segundos_aberto)
+        self.dormir = dormir
+        self._vagas = threading.BoundedSemaphore(self.politica.concorrencia)
+        # asyncio.Semaphore pertence a um laço de eventos: um por laço (sob ASGI, um só).
+        self._vagas_async = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._contadores = {'chamadas': 0, 'sucessos': 0, 'falhas': 0, 'repeticoes': 0, 'tempos_esgotados': 0,
+                            'recusadas': 0}
+
+    def start_chat(self, history=None):
+        return _Chat(self, self.backend.start_chat(history=history))
+
+    def _contar(self, chave):
+        with self._lock:
+            self._contadores[chave] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._contadores, disjuntor=self.disjuntor.estado)
+
+    @contextmanager
+    def _tentativa(self, tentativa):
+        if tentativa:
+            self._contar('repeticoes')
+        try:
+            teste = self.disjuntor.permitir()
+        except CircuitoAberto:
+            self._contar('recusadas')
+            raise
+        try:
+            yield
+        finally:
+            if teste:
+                self.disjuntor.liberar()
+
+    def _depois_da_falha(self, exc, tentativa):
+        """True when the call should be tried again."""
+        if isinstance(exc, TempoEsgotado):
+            self._contar('tempos_esgotados')
+        if not isinstance(exc, self.transitorios):
+            self._contar('falhas')
+            raise exc
+        self.disjuntor.falha()
+        if tentativa + 1 >= self.politica.tentativas:
+            self._contar('falhas')
+            raise exc
+        logger.info("chamada ao modelo falhou (%s); tentativa %d de %d", type(exc).__name__, tentativa + 2,
+                    self.politica.tentativas)
+        return True
+
+    def _sucesso(self):
+        self.disjuntor.sucesso()
+        self._contar('sucessos')
+
+    def chamar(self, enviar):
+        """Result of ``enviar(timeout)`` under the policy (sync)."""
+        self._contar('chamadas')
+        for tentativa in range(self.politica.tentativas):
+            with self._tentativa(tentativa):
+                if not self._vagas.acquire(timeout=self.politica.timeout):
+                    raise ModeloOcupado("Limite de chamadas simultâneas ao modelo atingido")
+                try:
+                    resultado = enviar(self.politica.timeout)
+                except Exception as exc:
+                    self._depois_da_falha(exc, tentativa)
+                else:
+                    self._sucesso()
+                    return resultado
+                finally:
+                    self._vagas.release()
+            self.dormir(self.politica.espera(tentativa))
+
+    def _semaforo(self):
+        laco = asyncio.get_running_loop()
+        with self._lock:
+            if laco not in self._vagas_async:
+                self._vagas_async[laco] = asyncio.Semaphore(self.politica.concorrencia)
+            return self._vagas_async[laco]
+
+    async def chamar_async(self, enviar):
+        """Result of ``await enviar(timeout)`` under the policy, the timeout enforced here as well."""
+        self._contar('chamadas')
+        vagas = self._semaforo()
+        for tentativa in range(self.politica.tentativas):
+            with self._tentativa(tentativa):
+                try:
+                    await asyncio.wait_for(vagas.acquire(), self.politica.timeout)
+                except asyncio.TimeoutError:
+                    raise ModeloOcupado("Limite de chamadas simultâneas ao modelo atingido") from None
+                try:
+                    try:
+                        resultado = await asyncio.wait_for(enviar(self.politica.timeout), self.politica.timeout)
+                    except asyncio.TimeoutError as exc:
+                        if isinstance(exc, TempoEsgotado):
+                            raise
+                        raise TempoEsgotado(f"O modelo não respondeu em {self.politica.timeout}s") from None
+                except Exception as exc:
+                    self._depois_da_falha(exc, tentativa)
+                else:
+                    self._sucesso()
+                    return resultado
+                finally:
+                    vagas.release()
+            await asyncio.sleep(self.politica.espera(tentativa))
+
+
+class _Chat:
+    def __init__(self, cliente, sessao):
+        self.cliente = cliente
+        self.sessao = sessao
+
+    def send_message(self, texto, generation_config=None):
+        return self.cliente.chamar(
+            lambda timeout: self.sessao.send_message(texto, generation_config=generation_config, timeout=timeout))
+
+    async def send_message_async(self, texto, generation_config=None, stream=False):
+        # Com stream, a política vale até o modelo começar a responder; o resto fica com quem lê os trechos.
+        return await self.cliente.chamar_async(
+            lambda timeout: self.sessao.send_message_async(texto, generation_config=generation_config, stream=stream,
+                                                           timeout=timeout))
+
+
+# --- Gemini -------------------------------------------------------------------------
+
+def texto_do_trecho(trecho):
+    """Text of a streamed chunk, or '' for a chunk without text."""
+    try:
+        return trecho.text
+    except ValueError:
+        # Trecho sem texto (ex.: só o motivo de término).
+        return ''
+
+
+class _FluxoGemini:
+    def __init__(self, resposta, ao_terminar):
+        self.resposta = resposta
+        self.ao_terminar = ao_terminar
+
+    async def __aiter__(self):
+        recebido = ''
+        async for trecho in self.resposta:
+            recebido += texto_do_trecho(trecho)
+            yield trecho
+        self.ao_terminar(recebido)
+
+
+class _SessaoGemini:
+    """Chat over ``generate_content``: unlike ``ChatSession`` it takes a timeout per call, and the
+    history only grows once a reply arrives in full, so a failed call can simply be retried."""
+
+    def __init__(self, modelo, history):
+        self.modelo = modelo
+        self.history = list(history or [])
+
+    def _conteudo(self, texto):
+        return self.history + [{'role': 'user', 'parts': [texto]}]
+
+    def _registrar(self, texto, resposta):
+        self.history += [{'role': 'user', 'parts': [texto]}, {'role': 'model', 'parts': [resposta]}]
+
+    def send_message(self, texto, generation_config=None, timeout=None):
+        resposta = self.modelo.generate_content(self._conteudo(texto), generation_config=generation_config,
+                                                request_options={'timeout': timeout} if timeout else None)
+        self._registrar(texto, resposta.text)
+        return resposta
+
+    async def send_message_async(self, texto, generation_config=None, stream=False, timeout=None):
+        resposta = await self.modelo.generate_content_async(
+            self._conteudo(texto), generation_config=generation_config, stream=stream,
+            request_options={'timeout': timeout} if timeout else None,
+        )
+        if stream:
+            return _FluxoGemini(resposta, lambda recebido: self._registrar(texto, recebido))
+        self._registrar(texto, resposta.text)
+        return resposta
+
+
+class Gemini:
+    """Google Gemini backend; the SDK is only configured on the first chat."""
+
+    def __init__(self, nome='gemini-2.0-flash', api_key=None):
+        self.nome = nome
+        self.api_key = api_key
+        self._modelo = None
+
+    def start_chat(self, history=None):
+        if self._modelo is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=self.api_key)
+            self._modelo = genai.GenerativeModel(self.nome)
+        return _SessaoGemini(self._modelo, history)
+
+    @staticmethod
+    def transitorios():
+        from google.api_core import exceptions
+
+        return (exceptions.ServiceUnavailable, exceptions.TooManyRequests, exceptions.InternalServerError,
+                exceptions.DeadlineExceeded, exceptions.GatewayTimeout, exceptions.BadGateway)
+
+
+# --- Modelo local -------------------------------------------------------------------
+
+class Resposta:
+    """Minimal reply object: just the ``text`` the analyst reads."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class RespostaEmTrechos:
+    """Streamed reply: ``text`` in chunks of ``tamanho`` characters, ``intervalo`` seconds apart."""
+
+    def __init__(self, text, tamanho=16, intervalo=0):
+        self.text = text
+        self.tamanho = tamanho
+        self.intervalo = intervalo
+
+    async def __aiter__(self):
+        for posicao in range(0, len(self.text), self.tamanho):
+            if posicao:
+                await asyncio.sleep(self.intervalo)
+            yield Resposta(self.text[posicao:posicao + self.tamanho])
+
+
+class ModeloLocal:
+    """Deterministic offline backend for load tests and benchmarks.
+
+    Every reply takes ``latencia`` seconds. A prompt listing the analyst's tools first gets a call
+    to ``ferramenta``; a history summary request (core/history.py) gets its new messages back as
+    plain text; anything else gets a final answer with ``resposta`` (by default, one that names
+    the size of the prompt it read).
+    """
+
+    def __init__(self, latencia=0.0, resposta='', ferramenta='vendas_por_produto', trecho=16):
+        self.latencia = latencia
+        self.resposta = resposta
+        self.ferramenta = ferramenta
+        self.trecho = trecho
+
+    def start_chat(self, history=None):
+        return _SessaoLocal(self, history)
+
+    def responder(self, texto):
+        if 'Resumo até aqui:' in texto:
+            return texto.rsplit('Novas mensagens:', 1)[-1].strip()
+        if 'Ferramentas:' in texto and self.ferramenta:
+            return json.dumps({'chamadas': [{'ferramenta': self.ferramenta, 'argumentos': {'limite': 5}}]})
+        return json.dumps({
+            'resposta_final': self.resposta or f"Resposta local para um prompt de {len(texto)} caracteres.",
+            'diagnostico': '', 'plano_de_acao': '', 'dados_analisados': {},
+        }, ensure_ascii=False)
+
+
+class _SessaoLocal:
+    def __init__(self, modelo, history):
+        self.modelo = modelo
+        self.history = list(history or [])
+
+    def _espera(self, timeout):
+        if timeout is not None and self.modelo.latencia > timeout:
+            return timeout, TempoEsgotado(f"O modelo não respondeu em {timeout}s")
+        return self.modelo.latencia, None
+
+    def _responder(self, texto, erro):
+        if erro is not None:
+            raise erro
+        resposta = self.modelo.responder(texto)
+        self.history += [{'role': 'user', 'parts': [texto]}, {'role': 'model', 'parts': [resposta]}]
+        return resposta
+
+    def send_message(self, texto, generation_config=None, timeout=None):
+        segundos, erro = self._espera(timeout)
+        time.sleep(segundos)
+        return Resposta(self._responder(texto, erro))
+
+    async def send_message_async(self, texto, generation_config=None, stream=False, timeout=None):
+        segundos, erro = self._espera(timeout)
+        await asyncio.sleep(segundos)
+        resposta = self._responder(texto, erro)
+        return RespostaEmTrechos(resposta, self.modelo.trecho) if stream else Resposta(resposta)
+
+
+# --- Configuração -------------------------------------------------------------------
+
+def politica_configurada():
+    return Politica(
+        timeout=getattr(settings, 'LLM_TIMEOUT', 30.0),
+        tentativas=getattr(settings, 'LLM_ATTEMPTS', 3),
+        espera_inicial=getattr(settings, 'LLM_BACKOFF', 0.5),
+        concorrencia=getattr(settings, 'LLM_MAX_CONCURRENCY', 8),
+        falhas_para_abrir=getattr(settings, 'LLM_BREAKER_FAILURES', 5),
+        segundos_aberto=getattr(settings, 'LLM_BREAKER_SECONDS', 30.0),
+    )
+
+
+def construir(backend=None, politica=None):
+    """A :class:`Cliente` for ``backend`` (default: ``LLM_BACKEND``) configured from settings."""
+    backend = backend or getattr(settings, 'LLM_BACKEND', BACKEND_GEMINI)
+    if backend == BACKEND_GEMINI:
+        modelo = Gemini(getattr(settings, 'LLM_MODEL', 'gemini-2.0-flash'), getattr(settings, 'GEMINI_API_KEY', None))
+        return Cliente(modelo, politica or politica_configurada(), transitorios=Gemini.transitorios())
+    if backend == BACKEND_LOCAL:
+        modelo = ModeloLocal(latencia=getattr(settings, 'LLM_STUB_LATENCY', 0.0),
+                             resposta=getattr(settings, 'LLM_STUB_RESPONSE', ''))
+        return Cliente(modelo, politica or politica_configurada())
+    raise ValueError(f"Backend de modelo desconhecido: {backend} (use um de: {', '.join(BACKENDS)})")
+
+
+_padrao = None
+_padrao_lock = threading.Lock()
+
+
+def padrao():
+    """The process-wide client, built from settings on first use."""
+    global _padrao
+    with _padrao_lock:
+        if _padrao is None:
+            _padrao = construir()
+        return _padrao
@@ -0,0 +1,53 @@
+# core/management/commands/analytics_report.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core import analytics
+
+
+def _data(valor):
+    data = parse_date(valor)
+    if data is None:
+        raise CommandError(f"Data inválida: {valor} (use AAAA-MM-DD)")
+    return data
+
+
+class Command(BaseCommand):
+    help = 'Relatório analítico no DuckDB (totais, receita mensal, produtos, contas vencidas) fora do ORM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fonte', choices=analytics.FONTES,
+                            help='Padrão: o diretório de --parquet, senão o sqlite anexado, senão o ORM')
+        parser.add_argument('--parquet', metavar='DIRETORIO', help='Lê uma exportação anterior')
+        parser.add_argument('--exportar', metavar='DIRETORIO', help='Grava as tabelas em Parquet e sai')
+        parser.add_argument('--inicio', type=_data)
+        parser.add_argument('--fim', type=_data)
+        parser.add_argument('--top', type=int, default=10, help='Quantidade de produtos no ranking')
+
+    def handle(self, *args, **options):
+        try:
+            motor = analytics.conectar(options['fonte'], options['parquet'])
+        except analytics.FonteIndisponivel as exc:
+            raise CommandError(str(exc))
+
+        with motor:
+            if options['exportar']:
+                arquivos = motor.exportar(options['exportar'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"{len(arquivos)} tabelas exportadas para {options['exportar']} (fonte: {motor.fonte})."))
+                return
+
+            hoje = timezone.localdate()
+            periodo = {'inicio': options['inicio'], 'fim': options['fim']}
+            secoes = [
+                ('Totais por status', motor.totais_por_status()),
+                ('Vendas concluídas por mês', motor.receita_mensal(analytics.ORIGEM_VENDA, **periodo)),
+                ('Receita recebida por mês', motor.receita_mensal(analytics.ORIGEM_RECEBER, **periodo)),
+                ('Produtos mais vendidos', motor.produtos_mais_vendidos(options['top'], **periodo)),
+                (f'Contas vencidas em {hoje:%d/%m/%Y}', motor.vencidas_por_faixa(hoje)),
+            ]
+            self.stdout.write(f"Fonte: {motor.fonte}")
+            for titulo, df in secoes:
+                self.stdout.write(self.style.MIGRATE_HEADING(titulo))
+                self.stdout.write(df.to_string(index=False) if not df.empty else '  (sem dados)')
@@ -0,0 +1,32 @@
+# core/management/commands/benchmark.py
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Mede tempo, vazão e memória das rotinas pesadas num banco de teste descartável (o banco configurado não é alterado)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('nome', choices=sorted(benchmarks.BENCHMARKS))
+        parser.add_argument('--linhas', type=int, nargs='+', default=[5000],
+                            help='Um ou mais volumes; cada um roda num banco novo')
+        parser.add_argument('--lote', type=int, default=1000)
+        parser.add_argument('--comparar', type=int, default=200,
+                            help='Linhas gravadas venda a venda, como referência (0 desliga)')
+
+    def handle(self, *args, **options):
+        for linhas in options['linhas']:
+            nome_original = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                resultado = benchmarks.BENCHMARKS[options['nome']](
+                    linhas=linhas, lote=options['lote'], comparar=options['comparar']
+                )
+            finally:
+                connection.creation.destroy_test_db(nome_original, verbosity=0)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{options['nome']} com {linhas} linhas"))
+            for chave, valor in resultado.items():
+                self.stdout.write(f"  {chave}: {valor}")
@@ -0,0 +1,30 @@
+# core/management/commands/import_sales.py
+from django.core.management.base import BaseCommand, CommandError
+
+from core import imports
+
+
+class Command(BaseCommand):
+    help = 'Importa vendas em lote de um arquivo CSV ou JSONL, baixando o estoque e gerando as Contas a Receber'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo (.csv, .jsonl ou .ndjson)')
+        parser.add_argument('--formato', choices=sorted(imports.LEITORES), help='Padrão: deduzido pela extensão')
+        parser.add_argument('--lote', type=int, default=imports.TAMANHO_LOTE, help='Linhas por transação')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or imports.formato_do_arquivo(options['arquivo'])
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                relatorio = imports.importar_arquivo(arquivo, formato, imports.tamanho_lote(options['lote']))
+        except OSError as exc:
+            raise CommandError(f"Não foi possível ler {options['arquivo']}: {exc}")
+
+        for erro in relatorio.erros:
+            self.stderr.write(f"Linha {erro['linha']}: {erro['erro']}")
+        resumo = relatorio.as_dict()
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumo['linhas']} linhas lidas: {resumo['vendas_criadas']} vendas, {resumo['itens_criados']} itens "
+            f"e {resumo['contas_receber_criadas']} contas a receber criadas; {resumo['linhas_com_erro']} linhas com erro "
+            f"({resumo['segundos']}s, {resumo['linhas_por_segundo']} linhas/s)."
+        ))
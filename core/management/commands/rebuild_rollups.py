@@ -0,0 +1,12 @@
+# core/management/commands/rebuild_rollups.py
+from django.core.management.base import BaseCommand
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recalcula do zero os resumos financeiros diários a partir de Vendas e Contas'
+
+    def handle(self, *args, **kwargs):
+        total = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{total} linhas de resumo recalculadas."))
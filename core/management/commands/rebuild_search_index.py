@@ -0,0 +1,14 @@
+# core/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand, CommandError
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói os índices de busca textual (FTS5) de Produtos, Clientes e Fornecedores'
+
+    def handle(self, *args, **kwargs):
+        if not search.disponivel():
+            raise CommandError("A busca textual FTS5 só está disponível com SQLite.")
+        tipos = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Índices reconstruídos: {', '.join(tipos)}."))
@@ -0,0 +1,23 @@
+# core/management/commands/reconcile_stock.py
+from django.core.management.base import BaseCommand
+
+from core import stock
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o estoque dos Produtos a partir do razão de movimentos e relata as divergências'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apenas-relatorio', action='store_true', help='Só relata, sem corrigir o estoque')
+
+    def handle(self, *args, **options):
+        corrigir = not options['apenas_relatorio']
+        divergentes = stock.reconciliar(corrigir=corrigir)
+        for pk, nome, atual, saldo in divergentes:
+            self.stdout.write(f"#{pk} {nome}: estoque {atual}, razão {saldo} (diferença {atual - saldo:+d})")
+        if not divergentes:
+            self.stdout.write(self.style.SUCCESS("Estoque de todos os produtos confere com o razão."))
+        elif corrigir:
+            self.stdout.write(self.style.WARNING(f"{len(divergentes)} produtos corrigidos a partir do razão."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(divergentes)} produtos divergentes (nada foi alterado)."))
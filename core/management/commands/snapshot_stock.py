@@ -0,0 +1,22 @@
+# core/management/commands/snapshot_stock.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core import stock
+
+
+class Command(BaseCommand):
+    help = 'Grava o saldo de estoque de cada produto movimentado desde o último saldo (rodar diariamente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', help='Saldo no início deste dia (AAAA-MM-DD); padrão: hoje')
+
+    def handle(self, *args, **options):
+        dia = parse_date(options['data']) if options['data'] else timezone.localdate()
+        if dia is None:
+            raise CommandError("Use a data no formato AAAA-MM-DD.")
+        if dia > timezone.localdate():
+            raise CommandError("Não é possível gravar saldos de um dia futuro.")
+        total = stock.registrar_saldos(stock.inicio_do_dia(dia))
+        self.stdout.write(self.style.SUCCESS(f"{total} saldos de estoque gravados para {dia:%d/%m/%Y}."))
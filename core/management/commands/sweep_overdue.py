@@ -0,0 +1,27 @@
+# core/management/commands/sweep_overdue.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core import overdue
+
+
+class Command(BaseCommand):
+    help = 'Marca como ATRASADO as contas a pagar e a receber em aberto com vencimento passado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', help='Data de referência (AAAA-MM-DD); padrão: hoje')
+
+    def handle(self, *args, **options):
+        hoje = None
+        if options['data']:
+            hoje = parse_date(options['data'])
+            if hoje is None:
+                raise CommandError(f"Data inválida: {options['data']} (use AAAA-MM-DD)")
+
+        varredura = overdue.varrer(hoje)
+        if varredura is None:
+            self.stdout.write("Nada a varrer: já houve uma varredura para esta data.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Vencimentos antes de {varredura.referencia:%d/%m/%Y}: {varredura.contas_pagar} contas a pagar e "
+            f"{varredura.contas_receber} a receber em atraso ({varredura.segundos:.3f}s)."))
@@ -1,48 +1,52 @@
 # core/management/commands/test_analyst.py
 from django.core.management.base import BaseCommand
 from django.conf import settings
-import google.generativeai as genai
 import sys
 
+from core import llm
+
 class Command(BaseCommand):
-    help = 'Testa a conexão direta com a API do Google Gemini'
+    help = 'Testa a conexão com o modelo de linguagem (Gemini, ou o modelo local sem rede) pela camada core/llm.py'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=llm.BACKENDS, help='Padrão: LLM_BACKEND')
 
-    def handle(self, *args, **kwargs):
-        self.stdout.write(self.style.SUCCESS("--- INICIANDO TESTE DIRETO COM API GEMINI ---"))
+    def handle(self, *args, **options):
+        backend = options['backend'] or settings.LLM_BACKEND
+        self.stdout.write(self.style.SUCCESS(f"--- INICIANDO TESTE DO MODELO ({backend}) ---"))
 
         # 1. Chave da API
-        api_key = settings.GEMINI_API_KEY
-        if not api_key or api_key == "SUA_CHAVE_API_VEM_AQUI":
-            self.stdout.write(self.style.ERROR("ERRO: Chave GEMINI_API_KEY não configurada em config/settings.py"))
-            return
-        self.stdout.write("Passo 1: Chave de API encontrada.")
+        if backend == llm.BACKEND_GEMINI:
+            api_key = settings.GEMINI_API_KEY
+            if not api_key or api_key == "SUA_CHAVE_API_VEM_AQUI":
+                self.stdout.write(self.style.ERROR("ERRO: Chave GEMINI_API_KEY não configurada (variável de ambiente ou .env)"))
+                return
+            self.stdout.write("Passo 1: Chave de API encontrada.")
+        else:
+            self.stdout.write("Passo 1: Modelo local, sem chave nem rede.")
 
         try:
-            # 2. Configurar a API do Google
-            self.stdout.write("Passo 2: Configurando a API do Google...")
-            sys.stdout.flush()
-            genai.configure(api_key=api_key)
-            self.stdout.write("Passo 2: API configurada com sucesso.")
-
-            # 3. Criar o modelo
-            self.stdout.write("\nPasso 3: Criando o modelo generativo...")
-            sys.stdout.flush()
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            self.stdout.write("Passo 3: Modelo criado com sucesso.")
+            # 2. Criar o cliente
+            self.stdout.write("Passo 2: Criando o cliente do modelo...")
+            cliente = llm.construir(backend)
+            politica = cliente.politica
+            self.stdout.write(f"Passo 2: Cliente criado (timeout {politica.timeout}s, {politica.tentativas} tentativas).")
 
-            # 4. Fazer uma pergunta simples
+            # 3. Fazer uma pergunta simples
             prompt = "Olá! Responda com 'API funcionando!' para confirmar."
-            self.stdout.write(f"\nPasso 4: Enviando prompt: '{prompt}'")
-            self.stdout.write("(Aguardando resposta da API...)")
+            self.stdout.write(f"\nPasso 3: Enviando prompt: '{prompt}'")
+            self.stdout.write("(Aguardando resposta do modelo...)")
             sys.stdout.flush()
 
-            response = model.generate_content(prompt)
+            response = cliente.start_chat().send_message(prompt)
 
-            self.stdout.write(self.style.SUCCESS(f"\n\n>>>> RESPOSTA DA API: {response.text}\n"))
+            self.stdout.write(self.style.SUCCESS(f"\n\n>>>> RESPOSTA DO MODELO: {response.text}\n"))
 
         except Exception as e:
             self.stdout.write(self.style.ERROR("\n--- OCORREU UM ERRO DURANTE A EXECUÇÃO ---"))
             self.stdout.write(self.style.ERROR(f"Tipo do Erro: {type(e).__name__}"))
             self.stdout.write(self.style.ERROR(f"Mensagem: {e}"))
+        else:
+            self.stdout.write(f"Estatísticas: {cliente.stats()}")
 
-        self.stdout.write(self.style.SUCCESS("\n--- TESTE CONCLUÍDO ---"))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS("\n--- TESTE CONCLUÍDO ---"))
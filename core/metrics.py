@@ -0,0 +1,101 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from . import cache, rollups
+from .models import ContaPagar, ContaReceber, Produto, Venda, VendaItem
+
+STATUS_EM_ABERTO = rollups.STATUS_EM_ABERTO
+TOP_PRODUTOS_LIMITE = 5
+
+# Tabelas cujas escritas invalidam os KPIs em cache.
+DASHBOARD_MODELS = (Venda, VendaItem, ContaReceber, ContaPagar, Produto)
+
+ZERO = Decimal('0.00')
+
+
+@dataclass(frozen=True)
+class DashboardMetrics:
+    """KPIs do dashboard, compartilhados pela view HTML e pela API JSON."""
+    total_vendas: int = 0
+    vendas_concluidas_count: int = 0
+    vendas_pendentes_count: int = 0
+    receita_faturada: Decimal = ZERO
+    receita_recebida: Decimal = ZERO
+    contas_receber_em_aberto_valor: Decimal = ZERO
+    contas_receber_em_aberto_count: int = 0
+    contas_pagar_em_aberto_valor: Decimal = ZERO
+    contas_pagar_em_aberto_count: int = 0
+    # [(primeiro dia do mês, total recebido)] em ordem cronológica
+    receita_por_mes: list = field(default_factory=list)
+    # [{'produto__nome': ..., 'total_quantidade_vendida': ...}]
+    produtos_mais_vendidos: list = field(default_factory=list)
+
+    def chart_data(self):
+        return {
+            'labels': [mes.strftime('%m/%Y') for mes, _ in self.receita_por_mes],
+            'data': [float(total) for _, total in self.receita_por_mes],
+        }
+
+    def as_context(self):
+        return {
+            'total_vendas': self.total_vendas,
+            'receita_faturada': self.receita_faturada,
+            'receita_recebida': self.receita_recebida,
+            'vendas_pendentes_count': self.vendas_pendentes_count,
+            'vendas_concluidas_count': self.vendas_concluidas_count,
+            'contas_receber_em_aberto_valor': self.contas_receber_em_aberto_valor,
+            'contas_receber_em_aberto_count': self.contas_receber_em_aberto_count,
+            'contas_pagar_em_aberto_valor': self.contas_pagar_em_aberto_valor,
+            'contas_pagar_em_aberto_count': self.contas_pagar_em_aberto_count,
+            'chart_data': self.chart_data(),
+            'produtos_mais_vendidos': self.produtos_mais_vendidos,
+        }
+
+    def as_json(self):
+        data = self.as_context()
+        for key, value in data.items():
+            if isinstance(value, Decimal):
+                data[key] = float(value)
+        return data
+
+
+def _produtos_mais_vendidos(limite=TOP_PRODUTOS_LIMITE):
+    return list(
+        VendaItem.objects.values('produto__nome').annotate(
+            total_quantidade_vendida=Sum('quantidade')
+        ).order_by('-total_quantidade_vendida')[:limite]
+    )
+
+
+def compute_dashboard_metrics():
+    """Calcula os KPIs do dashboard a partir dos resumos diários e do ranking de produtos."""
+    totais = rollups.monthly_totals()
+
+    total_vendas, _ = rollups.somar(totais, rollups.ORIGEM_VENDA, [s for s, _ in Venda.STATUS_CHOICES])
+    vendas_concluidas, receita_faturada = rollups.somar(totais, rollups.ORIGEM_VENDA, 'CONCLUIDA')
+    vendas_pendentes, _ = rollups.somar(totais, rollups.ORIGEM_VENDA, 'PENDENTE')
+    _, receita_recebida = rollups.somar(totais, rollups.ORIGEM_RECEBER, 'RECEBIDO')
+    receber_aberto_count, receber_aberto_valor = rollups.somar(totais, rollups.ORIGEM_RECEBER, STATUS_EM_ABERTO)
+    pagar_aberto_count, pagar_aberto_valor = rollups.somar(totais, rollups.ORIGEM_PAGAR, STATUS_EM_ABERTO)
+
+    return DashboardMetrics(
+        total_vendas=total_vendas,
+        vendas_concluidas_count=vendas_concluidas,
+        vendas_pendentes_count=vendas_pendentes,
+        receita_faturada=receita_faturada,
+        receita_recebida=receita_recebida,
+        contas_receber_em_aberto_valor=receber_aberto_valor,
+        contas_receber_em_aberto_count=receber_aberto_count,
+        contas_pagar_em_aberto_valor=pagar_aberto_valor,
+        contas_pagar_em_aberto_count=pagar_aberto_count,
+        receita_por_mes=[
+            (mes, valor) for mes, _, valor in totais.get((rollups.ORIGEM_RECEBER, 'RECEBIDO'), [])
+        ],
+        produtos_mais_vendidos=_produtos_mais_vendidos(),
+    )
+
+
+def cached_dashboard_metrics():
+    return cache.cached('dashboard', DASHBOARD_MODELS, compute_dashboard_metrics)
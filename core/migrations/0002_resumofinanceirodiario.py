@@ -0,0 +1,70 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:23
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Case, Count, DateField, F, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def popular_resumos(apps, schema_editor):
+    Venda = apps.get_model('core', 'Venda')
+    ContaReceber = apps.get_model('core', 'ContaReceber')
+    ContaPagar = apps.get_model('core', 'ContaPagar')
+    ResumoFinanceiroDiario = apps.get_model('core', 'ResumoFinanceiroDiario')
+
+    fontes = [
+        ('VENDA', Venda.objects.annotate(
+            dia=TruncDate('data_venda'), forma=F('forma_pagamento'), valor=F('valor_total'))),
+        ('RECEBER', ContaReceber.objects.annotate(
+            dia=Case(When(status='RECEBIDO', data_recebimento__isnull=False, then=F('data_recebimento')),
+                     default=F('data_vencimento'), output_field=DateField()),
+            forma=Coalesce('venda__forma_pagamento', Value('')))),
+        ('PAGAR', ContaPagar.objects.annotate(
+            dia=Case(When(status='PAGO', data_pagamento__isnull=False, then=F('data_pagamento')),
+                     default=F('data_vencimento'), output_field=DateField()),
+            forma=Value(''))),
+    ]
+    resumos = []
+    for origem, queryset in fontes:
+        linhas = queryset.order_by().values('dia', 'status', 'forma').annotate(
+            total_registros=Count('id'), total_valor=Sum('valor'))
+        resumos.extend(
+            ResumoFinanceiroDiario(
+                origem=origem, dia=linha['dia'], status=linha['status'], forma_pagamento=linha['forma'] or '',
+                registros=linha['total_registros'], valor=linha['total_valor'] or Decimal('0.00'),
+            )
+            for linha in linhas
+        )
+    ResumoFinanceiroDiario.objects.bulk_create(resumos, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoFinanceiroDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origem', models.CharField(choices=[('VENDA', 'Venda'), ('RECEBER', 'Conta a Receber'), ('PAGAR', 'Conta a Pagar')], max_length=10)),
+                ('dia', models.DateField()),
+                ('status', models.CharField(max_length=10)),
+                ('forma_pagamento', models.CharField(blank=True, default='', max_length=2)),
+                ('registros', models.IntegerField(default=0)),
+                ('valor', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Resumo Financeiro Diário',
+                'verbose_name_plural': 'Resumos Financeiros Diários',
+                'ordering': ['dia'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumofinanceirodiario',
+            constraint=models.UniqueConstraint(fields=('origem', 'dia', 'status', 'forma_pagamento'), name='resumo_diario_unico'),
+        ),
+        migrations.RunPython(popular_resumos, migrations.RunPython.noop),
+    ]
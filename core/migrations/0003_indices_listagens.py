@@ -0,0 +1,69 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_resumofinanceirodiario'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['nome', 'id'], name='cliente_nome_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contapagar',
+            index=models.Index(fields=['data_vencimento', 'id'], name='cp_vencimento_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contapagar',
+            index=models.Index(fields=['status', 'data_vencimento', 'id'], name='cp_status_vencimento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contapagar',
+            index=models.Index(fields=['fornecedor', 'data_vencimento', 'id'], name='cp_fornecedor_vencimento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contareceber',
+            index=models.Index(fields=['data_vencimento', 'id'], name='cr_vencimento_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contareceber',
+            index=models.Index(fields=['status', 'data_vencimento', 'id'], name='cr_status_vencimento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contareceber',
+            index=models.Index(fields=['cliente', 'data_vencimento', 'id'], name='cr_cliente_vencimento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fornecedor',
+            index=models.Index(fields=['nome_empresa', 'id'], name='fornecedor_nome_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['nome', 'id'], name='produto_nome_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['quantidade_estoque', 'id'], name='produto_estoque_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['fornecedor', 'nome', 'id'], name='produto_fornecedor_nome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['data_venda', 'id'], name='venda_data_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['status', 'data_venda', 'id'], name='venda_status_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['cliente', 'data_venda', 'id'], name='venda_cliente_data_idx'),
+        ),
+    ]
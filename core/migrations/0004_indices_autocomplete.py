@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:30
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_indices_listagens'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(django.db.models.functions.text.Lower('nome'), models.F('id'), name='cliente_nome_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fornecedor',
+            index=models.Index(django.db.models.functions.text.Lower('nome_empresa'), models.F('id'), name='fornecedor_nome_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(django.db.models.functions.text.Lower('nome'), models.F('id'), name='produto_nome_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# Tabelas FTS5 de conteúdo externo: guardam só o índice e leem o texto da tabela de origem.
+# Os gatilhos de UPDATE olham apenas as colunas indexadas, então as atualizações de estoque
+# não mexem no índice.
+INDICES = [
+    ('core_produto', ['nome', 'descricao']),
+    ('core_cliente', ['nome', 'email', 'endereco']),
+    ('core_fornecedor', ['nome_empresa', 'contato_nome']),
+]
+
+
+def _sql_criacao(tabela, colunas):
+    fts = f'{tabela}_fts'
+    lista = ', '.join(colunas)
+    antigos = ', '.join(f'old.{coluna}' for coluna in colunas)
+    novos = ', '.join(f'new.{coluna}' for coluna in colunas)
+    remover = f"INSERT INTO {fts}({fts}, rowid, {lista}) VALUES ('delete', old.id, {antigos});"
+    inserir = f"INSERT INTO {fts}(rowid, {lista}) VALUES (new.id, {novos});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({lista}, content='{tabela}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {tabela} BEGIN {inserir} END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {tabela} BEGIN {remover} END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {lista} ON {tabela} BEGIN {remover} {inserir} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def criar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for tabela, colunas in INDICES:
+        for sql in _sql_criacao(tabela, colunas):
+            schema_editor.execute(sql)
+
+
+def remover_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for tabela, _ in INDICES:
+        for sufixo in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {tabela}_fts_{sufixo}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {tabela}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_indices_autocomplete'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:36
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def copiar_para_itens(apps, schema_editor):
+    Venda = apps.get_model('core', 'Venda')
+    VendaItem = apps.get_model('core', 'VendaItem')
+
+    itens = []
+    vendas = Venda.objects.filter(produto__isnull=False).values_list('id', 'produto_id', 'quantidade', 'valor_total')
+    for venda_id, produto_id, quantidade, valor_total in vendas.iterator(chunk_size=2000):
+        quantidade = quantidade or 1
+        # O valor_total da venda já era preço de venda x quantidade no momento da venda.
+        preco_unitario = (valor_total / quantidade).quantize(Decimal('0.01'))
+        itens.append(VendaItem(
+            venda_id=venda_id, produto_id=produto_id, quantidade=quantidade,
+            preco_unitario=preco_unitario, valor_total=valor_total,
+        ))
+        if len(itens) >= 2000:
+            VendaItem.objects.bulk_create(itens)
+            itens = []
+    VendaItem.objects.bulk_create(itens)
+
+
+def copiar_para_vendas(apps, schema_editor):
+    Venda = apps.get_model('core', 'Venda')
+    VendaItem = apps.get_model('core', 'VendaItem')
+
+    # O esquema antigo comporta um produto por venda: fica o primeiro item de cada uma.
+    for item in VendaItem.objects.order_by('-id').iterator(chunk_size=2000):
+        Venda.objects.filter(pk=item.venda_id).update(produto_id=item.produto_id, quantidade=item.quantidade)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_busca_textual'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendaItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.PositiveIntegerField()),
+                ('preco_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('valor_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='itens_venda', to='core.produto')),
+                ('venda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens', to='core.venda')),
+            ],
+            options={
+                'verbose_name': 'Item de Venda',
+                'verbose_name_plural': 'Itens de Venda',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['produto', 'venda'], name='venda_item_produto_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='vendaitem',
+            constraint=models.UniqueConstraint(fields=('venda', 'produto'), name='venda_item_produto_unico'),
+        ),
+        # Nulos apenas durante a cópia, para que a migração também possa ser desfeita.
+        migrations.AlterField(
+            model_name='venda',
+            name='produto',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='vendas_produto', to='core.produto'),
+        ),
+        migrations.AlterField(
+            model_name='venda',
+            name='quantidade',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(copiar_para_itens, copiar_para_vendas),
+        migrations.RemoveField(
+            model_name='venda',
+            name='produto',
+        ),
+        migrations.RemoveField(
+            model_name='venda',
+            name='quantidade',
+        ),
+    ]
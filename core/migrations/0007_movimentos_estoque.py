@@ -0,0 +1,63 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def abrir_razao(apps, schema_editor):
+    Produto = apps.get_model('core', 'Produto')
+    MovimentoEstoque = apps.get_model('core', 'MovimentoEstoque')
+
+    # O histórico anterior não existe: o razão começa com o estoque atual de cada produto.
+    agora = django.utils.timezone.now()
+    MovimentoEstoque.objects.bulk_create(
+        (MovimentoEstoque(produto_id=produto_id, motivo='INICIAL', quantidade=quantidade, data=agora)
+         for produto_id, quantidade in Produto.objects.exclude(quantidade_estoque=0).values_list('id', 'quantidade_estoque')),
+        batch_size=2000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_venda_itens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateTimeField()),
+                ('quantidade', models.IntegerField()),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_estoque', to='core.produto')),
+            ],
+            options={
+                'verbose_name': 'Saldo de Estoque',
+                'verbose_name_plural': 'Saldos de Estoque',
+                'ordering': ['produto', 'data'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimentoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('motivo', models.CharField(choices=[('INICIAL', 'Saldo inicial'), ('VENDA', 'Venda'), ('ALTERACAO', 'Alteração de venda'), ('EXCLUSAO', 'Exclusão de venda'), ('AJUSTE', 'Ajuste manual')], max_length=10)),
+                ('quantidade', models.IntegerField()),
+                ('data', models.DateTimeField(default=django.utils.timezone.now)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimentos_estoque', to='core.produto')),
+                ('venda', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentos_estoque', to='core.venda')),
+            ],
+            options={
+                'verbose_name': 'Movimento de Estoque',
+                'verbose_name_plural': 'Movimentos de Estoque',
+                'ordering': ['data', 'id'],
+                'indexes': [models.Index(fields=['produto', 'data', 'quantidade'], name='movimento_produto_data_idx'), models.Index(fields=['data', 'id'], name='movimento_data_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='saldoestoque',
+            constraint=models.UniqueConstraint(fields=('produto', 'data'), name='saldo_estoque_produto_data_unico'),
+        ),
+        migrations.RunPython(abrir_razao, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-17 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_movimentos_estoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoConversa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=255, unique=True)),
+                ('texto', models.TextField(blank=True, default='')),
+                ('ate', models.DateTimeField(help_text='Timestamp da última mensagem incluída no resumo')),
+                ('mensagens', models.PositiveIntegerField(default=0, help_text='Mensagens já resumidas')),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resumo de Conversa',
+                'verbose_name_plural': 'Resumos de Conversa',
+            },
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='session_id',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session_id', 'timestamp'], name='chat_sessao_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-17 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_historico_chat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VarreduraAtrasos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('referencia', models.DateField(help_text='Contas com vencimento anterior a esta data ficaram em atraso')),
+                ('desde', models.DateField(blank=True, help_text='Início da faixa varrida (vazio: varredura completa)', null=True)),
+                ('contas_pagar', models.PositiveIntegerField(default=0)),
+                ('contas_receber', models.PositiveIntegerField(default=0)),
+                ('segundos', models.FloatField(default=0)),
+                ('executada_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Varredura de Atrasos',
+                'verbose_name_plural': 'Varreduras de Atrasos',
+                'ordering': ['-executada_em'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-17 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_varredura_atrasos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiquidacaoEmLote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lado', models.CharField(max_length=10)),
+                ('chave', models.CharField(max_length=255)),
+                ('assinatura', models.CharField(help_text='Hash das contas e da data pedidas com esta chave', max_length=64)),
+                ('resposta', models.JSONField()),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Liquidação em Lote',
+                'verbose_name_plural': 'Liquidações em Lote',
+                'ordering': ['-criada_em'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='liquidacaoemlote',
+            constraint=models.UniqueConstraint(fields=('lado', 'chave'), name='liquidacao_lado_chave_unica'),
+        ),
+    ]
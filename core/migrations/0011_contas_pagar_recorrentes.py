@@ -0,0 +1,45 @@
+# Generated by Django 5.0.6 on 2026-10-17 14:05
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_liquidacao_em_lote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContaPagarRecorrente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descricao', models.CharField(max_length=255)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('frequencia', models.CharField(choices=[('MENSAL', 'Mensal'), ('BIMESTRAL', 'Bimestral'), ('TRIMESTRAL', 'Trimestral'), ('SEMESTRAL', 'Semestral'), ('ANUAL', 'Anual')], default='MENSAL', max_length=10)),
+                ('dia_vencimento', models.PositiveSmallIntegerField(help_text='Nos meses mais curtos, vence no último dia do mês', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(31)])),
+                ('inicio', models.DateField(help_text='Primeiro mês da recorrência; as frequências contam a partir dele')),
+                ('fim', models.DateField(blank=True, help_text='Último vencimento possível (vazio: sem fim)', null=True)),
+                ('ativa', models.BooleanField(default=True)),
+                ('gerada_ate', models.DateField(blank=True, editable=False, help_text='Contas já geradas até esta data', null=True)),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+                ('fornecedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recorrencias_fornecedor', to='core.fornecedor')),
+            ],
+            options={
+                'verbose_name': 'Conta a Pagar Recorrente',
+                'verbose_name_plural': 'Contas a Pagar Recorrentes',
+                'ordering': ['descricao', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='contapagar',
+            name='recorrencia',
+            field=models.ForeignKey(blank=True, help_text='Recorrência que gerou esta conta', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='contas', to='core.contapagarrecorrente'),
+        ),
+        migrations.AddConstraint(
+            model_name='contapagar',
+            constraint=models.UniqueConstraint(fields=('recorrencia', 'data_vencimento'), name='cp_recorrencia_vencimento_unico'),
+        ),
+    ]
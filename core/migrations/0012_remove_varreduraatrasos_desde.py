@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-17 14:18
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_contas_pagar_recorrentes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='varreduraatrasos',
+            name='desde',
+        ),
+    ]
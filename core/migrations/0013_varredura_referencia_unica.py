@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-17 14:19
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remover_repetidas(apps, schema_editor):
+    # Workers concorrentes podiam gravar a mesma referência mais de uma vez: fica a última.
+    VarreduraAtrasos = apps.get_model('core', 'VarreduraAtrasos')
+    ultimas = VarreduraAtrasos.objects.values('referencia').annotate(ultima=Max('id')).values('ultima')
+    VarreduraAtrasos.objects.exclude(id__in=ultimas).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_remove_varreduraatrasos_desde'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_repetidas, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='varreduraatrasos',
+            name='referencia',
+            field=models.DateField(help_text='Contas com vencimento anterior a esta data ficaram em atraso', unique=True),
+        ),
+    ]
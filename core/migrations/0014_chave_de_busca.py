@@ -0,0 +1,81 @@
+# Generated by Django 5.0.6 on 2026-10-17 14:22
+
+import unicodedata
+from importlib import import_module
+
+from django.db import migrations, models
+
+busca_textual = import_module('core.migrations.0005_busca_textual')
+
+
+def preencher_chaves(apps, schema_editor):
+    # Mesma normalização de core.models.chave_de_busca, copiada para a migração não mudar com ela.
+    def chave(texto):
+        texto = unicodedata.normalize('NFKD', (texto or '').casefold())
+        return ''.join(caractere for caractere in texto if not unicodedata.combining(caractere))[:255]
+
+    for nome, campo in (('Fornecedor', 'nome_empresa'), ('Cliente', 'nome'), ('Produto', 'nome')):
+        model = apps.get_model('core', nome)
+        objetos = list(model.objects.only('pk', campo))
+        for objeto in objetos:
+            objeto.chave_busca = chave(getattr(objeto, campo))
+        model.objects.bulk_update(objetos, ['chave_busca'], batch_size=1000)
+
+
+def recriar_busca_textual(apps, schema_editor):
+    # No SQLite, AddField de coluna NOT NULL recria a tabela e leva junto os gatilhos do FTS5.
+    busca_textual.remover_indices(apps, schema_editor)
+    busca_textual.criar_indices(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_varredura_referencia_unica'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cliente',
+            name='cliente_nome_lower_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='fornecedor',
+            name='fornecedor_nome_lower_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='produto',
+            name='produto_nome_lower_idx',
+        ),
+        # Ao desfazer, os RemoveField abaixo também recriam as tabelas.
+        migrations.RunPython(migrations.RunPython.noop, recriar_busca_textual),
+        migrations.AddField(
+            model_name='cliente',
+            name='chave_busca',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='fornecedor',
+            name='chave_busca',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='chave_busca',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(recriar_busca_textual, migrations.RunPython.noop),
+        migrations.RunPython(preencher_chaves, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['chave_busca', 'id'], name='cliente_chave_busca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fornecedor',
+            index=models.Index(fields=['chave_busca', 'id'], name='fornecedor_chave_busca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['chave_busca', 'id'], name='produto_chave_busca_idx'),
+        ),
+    ]
@@ -1,11 +1,35 @@
+import unicodedata
+
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils import timezone
 from django.urls import reverse
 from decimal import Decimal
 from django.contrib.auth.models import User
 
+def chave_de_busca(texto):
+    """``texto`` without case or accents, the key the autocomplete range-scans.
+
+    Computed in Python because SQLite's ``LOWER()`` only folds ASCII ("Água" would not match "á").
+    ``save()`` keeps it in sync (``loaddata`` through a raw ``pre_save`` receiver in signals.py); rows
+    written with ``bulk_create`` must set it themselves.
+    """
+    texto = unicodedata.normalize('NFKD', (texto or '').casefold())
+    return ''.join(caractere for caractere in texto if not unicodedata.combining(caractere))[:255]
+
+
+def _com_chave_de_busca(instancia, campo, kwargs):
+    instancia.chave_busca = chave_de_busca(getattr(instancia, campo))
+    campos = kwargs.get('update_fields')
+    if campos is not None and campo in campos:
+        kwargs['update_fields'] = {*campos, 'chave_busca'}
+    return kwargs
+
+
 class Fornecedor(models.Model):
     nome_empresa = models.CharField(max_length=255)
+    chave_busca = models.CharField(max_length=255, editable=False, default='')  # ver chave_de_busca
     contato_nome = models.CharField(max_length=255, blank=True)
     telefone = models.CharField(max_length=20, blank=True)
     email = models.EmailField(blank=True)
@@ -14,15 +38,23 @@ class Fornecedor(models.Model):
         verbose_name = "Fornecedor"
         verbose_name_plural = "Fornecedores"
         ordering = ['nome_empresa']
+        indexes = [
+            models.Index(fields=['nome_empresa', 'id'], name='fornecedor_nome_id_idx'),
+            models.Index(fields=['chave_busca', 'id'], name='fornecedor_chave_busca_idx'),
+        ]
 
     def __str__(self):
         return self.nome_empresa
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **_com_chave_de_busca(self, 'nome_empresa', kwargs))
+
     def get_absolute_url(self):
         return reverse('fornecedor_editar', kwargs={'pk': self.pk}) 
 
 class Cliente(models.Model):
     nome = models.CharField(max_length=255)
+    chave_busca = models.CharField(max_length=255, editable=False, default='')  # ver chave_de_busca
     telefone = models.CharField(max_length=20, blank=True)
     email = models.EmailField(blank=True)
     endereco = models.TextField(blank=True)
@@ -32,6 +64,10 @@ class Cliente(models.Model):
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['nome', 'id'], name='cliente_nome_id_idx'),
+            models.Index(fields=['chave_busca', 'id'], name='cliente_chave_busca_idx'),
+        ]
 
     def __str__(self):
         return self.nome
@@ -39,6 +75,9 @@ class Cliente(models.Model):
     def get_absolute_url(self):
         return reverse('cliente_editar', kwargs={'pk': self.pk}) 
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **_com_chave_de_busca(self, 'nome', kwargs))
+
 class Categoria(models.Model):
     nome = models.CharField(max_length=100, unique=True)
     descricao = models.TextField(blank=True, null=True)
@@ -56,6 +95,7 @@ class Categoria(models.Model):
 
 class Produto(models.Model):
     nome = models.CharField(max_length=200)
+    chave_busca = models.CharField(max_length=255, editable=False, default='')  # ver chave_de_busca
     descricao = models.TextField(blank=True, null=True)
     fornecedor = models.ForeignKey(Fornecedor, on_delete=models.SET_NULL, null=True, blank=True, related_name='produtos')
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, blank=True, related_name='produtos_da_categoria')
@@ -68,6 +108,12 @@ class Produto(models.Model):
         verbose_name = "Produto"
         verbose_name_plural = "Produtos"
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['nome', 'id'], name='produto_nome_id_idx'),
+            models.Index(fields=['chave_busca', 'id'], name='produto_chave_busca_idx'),
+            models.Index(fields=['quantidade_estoque', 'id'], name='produto_estoque_id_idx'),
+            models.Index(fields=['fornecedor', 'nome', 'id'], name='produto_fornecedor_nome_idx'),
+        ]
 
     def __str__(self):
         return self.nome
@@ -75,6 +121,9 @@ class Produto(models.Model):
     def get_absolute_url(self):
         return reverse('produto_editar', kwargs={'pk': self.pk})
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **_com_chave_de_busca(self, 'nome', kwargs))
+
 class Venda(models.Model):
     STATUS_CHOICES = [
         ('PENDENTE', 'Pendente'),
@@ -91,33 +140,118 @@ class Venda(models.Model):
     ]
     forma_pagamento = models.CharField(max_length=2, choices=FORMAS_PAGAMENTO, default='AV')
     condicao_prazo = models.CharField(max_length=3, choices=CONDICOES_PRAZO, blank=True, null=True)
-    produto = models.ForeignKey(Produto, on_delete=models.PROTECT, related_name='vendas_produto')
     cliente = models.ForeignKey(Cliente, on_delete=models.SET_NULL, null=True, blank=True, related_name='vendas_cliente')
-    quantidade = models.PositiveIntegerField()
     valor_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     data_venda = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDENTE')
 
     def __str__(self):
-        return f"Venda de {self.quantidade}x {self.produto.nome} para {self.cliente.nome if self.cliente else 'N/A'} (R${self.valor_total})"
+        return f"Venda #{self.pk} para {self.cliente.nome if self.cliente else 'N/A'} (R${self.valor_total})"
 
     def save(self, *args, **kwargs):
         if self.forma_pagamento == 'AV':
             self.condicao_prazo = None
-        if self.produto and self.quantidade:
-            self.valor_total = self.produto.preco_venda * self.quantidade
-        else : 
-            self.valor_total = Decimal('0.00') 
         super().save(*args, **kwargs)
+
+    @property
+    def quantidade_total(self):
+        return sum(item.quantidade for item in self.itens.all())
+
+    @property
+    def resumo_itens(self):
+        itens = list(self.itens.all())
+        if len(itens) == 1:
+            return itens[0].produto.nome
+        return f"{len(itens)} itens"
         
     class Meta:
         verbose_name = "Venda"
         verbose_name_plural = "Vendas"     
         ordering = ['-data_venda']
+        indexes = [
+            models.Index(fields=['data_venda', 'id'], name='venda_data_id_idx'),
+            models.Index(fields=['status', 'data_venda', 'id'], name='venda_status_data_idx'),
+            models.Index(fields=['cliente', 'data_venda', 'id'], name='venda_cliente_data_idx'),
+        ]
         
     def get_absolute_url(self):
         return reverse('venda_editar', kwargs={'pk': self.pk}) 
 
+class VendaItem(models.Model):
+    venda = models.ForeignKey(Venda, on_delete=models.CASCADE, related_name='itens')
+    produto = models.ForeignKey(Produto, on_delete=models.PROTECT, related_name='itens_venda')
+    quantidade = models.PositiveIntegerField()
+    preco_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+    valor_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        verbose_name = "Item de Venda"
+        verbose_name_plural = "Itens de Venda"
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['venda', 'produto'], name='venda_item_produto_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['produto', 'venda'], name='venda_item_produto_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantidade}x {self.produto.nome} (Venda #{self.venda_id})"
+
+    def save(self, *args, **kwargs):
+        self.valor_total = self.preco_unitario * self.quantidade
+        super().save(*args, **kwargs)
+
+class MovimentoEstoque(models.Model):
+    MOTIVOS = [
+        ('INICIAL', 'Saldo inicial'),
+        ('VENDA', 'Venda'),
+        ('ALTERACAO', 'Alteração de venda'),
+        ('EXCLUSAO', 'Exclusão de venda'),
+        ('AJUSTE', 'Ajuste manual'),
+    ]
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='movimentos_estoque')
+    venda = models.ForeignKey(Venda, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimentos_estoque')
+    motivo = models.CharField(max_length=10, choices=MOTIVOS)
+    # Positiva nas entradas, negativa nas saídas.
+    quantidade = models.IntegerField()
+    data = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Movimento de Estoque"
+        verbose_name_plural = "Movimentos de Estoque"
+        ordering = ['data', 'id']
+        indexes = [
+            models.Index(fields=['produto', 'data', 'quantidade'], name='movimento_produto_data_idx'),
+            models.Index(fields=['data', 'id'], name='movimento_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_motivo_display()}: {self.quantidade:+d} {self.produto.nome} ({self.data:%d/%m/%Y %H:%M})"
+
+    def save(self, *args, **kwargs):
+        # O razão é só de inclusão: correções entram como novos movimentos.
+        if not self._state.adding:
+            raise ValueError("Movimentos de estoque não podem ser alterados.")
+        super().save(*args, **kwargs)
+
+class SaldoEstoque(models.Model):
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='saldos_estoque')
+    # Soma dos movimentos do produto com data anterior a este instante.
+    data = models.DateTimeField()
+    quantidade = models.IntegerField()
+
+    class Meta:
+        verbose_name = "Saldo de Estoque"
+        verbose_name_plural = "Saldos de Estoque"
+        ordering = ['produto', 'data']
+        constraints = [
+            models.UniqueConstraint(fields=['produto', 'data'], name='saldo_estoque_produto_data_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.produto.nome} em {self.data:%d/%m/%Y %H:%M}: {self.quantidade}"
+
 class ContaPagar(models.Model):
     fornecedor = models.ForeignKey(Fornecedor, on_delete=models.SET_NULL, null=True, blank=True, related_name='contas_pagar_fornecedor')
     descricao = models.CharField(max_length= 255)
@@ -133,6 +267,8 @@ class ContaPagar(models.Model):
         ('CANCELADO', 'Cancelado'),
     ]
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ABERTO')
+    recorrencia = models.ForeignKey('ContaPagarRecorrente', on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='contas', help_text="Recorrência que gerou esta conta")
     
     def __str__(self):
         return f"Pagar a {self.fornecedor.nome_empresa if self.fornecedor else 'N/A'} - R${self.valor} ({self.status})"
@@ -141,10 +277,58 @@ class ContaPagar(models.Model):
         verbose_name = "Conta a Pagar"
         verbose_name_plural = "Contas a Pagar"
         ordering = ['data_vencimento']
+        indexes = [
+            models.Index(fields=['data_vencimento', 'id'], name='cp_vencimento_id_idx'),
+            models.Index(fields=['status', 'data_vencimento', 'id'], name='cp_status_vencimento_idx'),
+            models.Index(fields=['fornecedor', 'data_vencimento', 'id'], name='cp_fornecedor_vencimento_idx'),
+        ]
+        constraints = [
+            # Uma conta por vencimento de cada recorrência: o gerador pode rodar de novo sem duplicar.
+            models.UniqueConstraint(fields=['recorrencia', 'data_vencimento'], name='cp_recorrencia_vencimento_unico'),
+        ]
     
     def get_absolute_url(self):
         return reverse('conta_pagar_editar', kwargs={'pk': self.pk})
         
+class ContaPagarRecorrente(models.Model):
+    """Rent, payroll or supplier contract whose ContaPagar rows are generated ahead (core/recurring.py)."""
+    FREQUENCIAS = [
+        ('MENSAL', 'Mensal'),
+        ('BIMESTRAL', 'Bimestral'),
+        ('TRIMESTRAL', 'Trimestral'),
+        ('SEMESTRAL', 'Semestral'),
+        ('ANUAL', 'Anual'),
+    ]
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.SET_NULL, null=True, blank=True, related_name='recorrencias_fornecedor')
+    descricao = models.CharField(max_length=255)
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+    frequencia = models.CharField(max_length=10, choices=FREQUENCIAS, default='MENSAL')
+    dia_vencimento = models.PositiveSmallIntegerField(
+        validators=[MinValueValidator(1), MaxValueValidator(31)],
+        help_text="Nos meses mais curtos, vence no último dia do mês")
+    inicio = models.DateField(help_text="Primeiro mês da recorrência; as frequências contam a partir dele")
+    fim = models.DateField(null=True, blank=True, help_text="Último vencimento possível (vazio: sem fim)")
+    ativa = models.BooleanField(default=True)
+    gerada_ate = models.DateField(null=True, blank=True, editable=False,
+                                  help_text="Contas já geradas até esta data")
+    criada_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.descricao} ({self.get_frequencia_display()}, dia {self.dia_vencimento}) - R${self.valor}"
+
+    def clean(self):
+        if self.fim and self.inicio and self.fim < self.inicio:
+            raise ValidationError({'fim': "O fim não pode ser anterior ao início."})
+
+    class Meta:
+        verbose_name = "Conta a Pagar Recorrente"
+        verbose_name_plural = "Contas a Pagar Recorrentes"
+        ordering = ['descricao', 'id']
+
+    def get_absolute_url(self):
+        return reverse('conta_pagar_recorrente_editar', kwargs={'pk': self.pk})
+
+
 class ContaReceber(models.Model):
     venda = models.OneToOneField(Venda, on_delete=models.CASCADE, related_name='conta_receber_venda', null=True, blank=True)
     cliente = models.ForeignKey(Cliente, on_delete=models.SET_NULL, null=True, blank=True, related_name='contas_receber_cliente')
@@ -169,12 +353,17 @@ class ContaReceber(models.Model):
         verbose_name = "Conta a Receber"
         verbose_name_plural = "Contas a Receber"
         ordering = ['data_vencimento']
+        indexes = [
+            models.Index(fields=['data_vencimento', 'id'], name='cr_vencimento_id_idx'),
+            models.Index(fields=['status', 'data_vencimento', 'id'], name='cr_status_vencimento_idx'),
+            models.Index(fields=['cliente', 'data_vencimento', 'id'], name='cr_cliente_vencimento_idx'),
+        ]
     
     def get_absolute_url(self):
         return reverse('conta_receber_editar', kwargs={'pk': self.pk})
     
 class ChatMessage(models.Model):
-    session_id = models.CharField(max_length=255, db_index=True)
+    session_id = models.CharField(max_length=255)
     role = models.CharField(max_length=10)  # 'user' ou 'assistant'
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
@@ -184,4 +373,86 @@ class ChatMessage(models.Model):
     
     class Meta:
         ordering = ['timestamp']
-    
\ No newline at end of file
+        indexes = [
+            # A janela do histórico (core/history.py) lê só as últimas mensagens da sessão.
+            models.Index(fields=['session_id', 'timestamp'], name='chat_sessao_timestamp_idx'),
+        ]
+
+
+class VarreduraAtrasos(models.Model):
+    """One run of the overdue sweeper (core/overdue.py)."""
+    referencia = models.DateField(unique=True, help_text="Contas com vencimento anterior a esta data ficaram em atraso")
+    contas_pagar = models.PositiveIntegerField(default=0)
+    contas_receber = models.PositiveIntegerField(default=0)
+    segundos = models.FloatField(default=0)
+    executada_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Varredura de Atrasos"
+        verbose_name_plural = "Varreduras de Atrasos"
+        ordering = ['-executada_em']
+
+    def __str__(self):
+        return f"{self.referencia}: {self.contas_pagar + self.contas_receber} contas em {self.segundos:.3f}s"
+
+
+class LiquidacaoEmLote(models.Model):
+    """Response of a batch settlement, kept under the request's idempotency key (core/settlements.py)."""
+    lado = models.CharField(max_length=10)  # 'pagar' ou 'receber'
+    chave = models.CharField(max_length=255)
+    assinatura = models.CharField(max_length=64, help_text="Hash das contas e da data pedidas com esta chave")
+    resposta = models.JSONField()
+    criada_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Liquidação em Lote"
+        verbose_name_plural = "Liquidações em Lote"
+        ordering = ['-criada_em']
+        constraints = [
+            models.UniqueConstraint(fields=['lado', 'chave'], name='liquidacao_lado_chave_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.lado} {self.chave}"
+
+
+class ResumoConversa(models.Model):
+    """Rolling summary of the chat messages that already left a session's history window."""
+    session_id = models.CharField(max_length=255, unique=True)
+    texto = models.TextField(blank=True, default='')
+    ate = models.DateTimeField(help_text="Timestamp da última mensagem incluída no resumo")
+    mensagens = models.PositiveIntegerField(default=0, help_text="Mensagens já resumidas")
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Resumo de Conversa"
+        verbose_name_plural = "Resumos de Conversa"
+
+    def __str__(self):
+        return f"{self.session_id} ({self.mensagens} mensagens)"
+
+
+class ResumoFinanceiroDiario(models.Model):
+    ORIGENS = [
+        ('VENDA', 'Venda'),
+        ('RECEBER', 'Conta a Receber'),
+        ('PAGAR', 'Conta a Pagar'),
+    ]
+    origem = models.CharField(max_length=10, choices=ORIGENS)
+    # Venda: dia da venda. Contas: dia da liquidação quando liquidadas, senão o vencimento.
+    dia = models.DateField()
+    status = models.CharField(max_length=10)
+    forma_pagamento = models.CharField(max_length=2, blank=True, default='')
+    registros = models.IntegerField(default=0)
+    valor = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    def __str__(self):
+        return f"{self.get_origem_display()} {self.dia} {self.status} {self.forma_pagamento or '-'}: {self.registros} / R${self.valor}"
+
+    class Meta:
+        verbose_name = "Resumo Financeiro Diário"
+        verbose_name_plural = "Resumos Financeiros Diários"
+        ordering = ['dia']
+        constraints = [
+            models.UniqueConstraint(fields=['origem', 'dia', 'status', 'forma_pagamento'], name='resumo_diario_unico'),
+        ]
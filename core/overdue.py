@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from . import cache, rollups
+from .models import ContaPagar, ContaReceber, VarreduraAtrasos
+
+logger = logging.getLogger(__name__)
+
+# Varredura de atrasos: contas ABERTO com vencimento passado viram ATRASADO num UPDATE por tabela
+# (pelo índice status + vencimento), e os resumos diários mudam de status junto, sem recalcular.
+# Cada execução olha todos os vencimentos passados: uma conta lançada, importada ou reaberta depois da
+# última execução com vencimento antigo também entra, e o índice mantém a consulta barata.
+
+ALVOS = (
+    (ContaPagar, rollups.ORIGEM_PAGAR, 'contas_pagar'),
+    (ContaReceber, rollups.ORIGEM_RECEBER, 'contas_receber'),
+)
+
+
+def ultima():
+    return VarreduraAtrasos.objects.order_by('-executada_em', '-id').first()
+
+
+def varrer(hoje=None):
+    """Flip ABERTO accounts due before ``hoje`` to ATRASADO; returns the run's VarreduraAtrasos.
+
+    Returns None when a run for ``hoje`` (or a later date) already happened, in this process or another.
+    """
+    hoje = hoje or timezone.localdate()
+    anterior = ultima()
+    if anterior is not None and anterior.referencia >= hoje:
+        return None
+
+    inicio = time.perf_counter()
+    with transaction.atomic():
+        # O registro da execução é gravado antes dos UPDATEs: a referência é única, então de várias
+        # workers (ou cron + agendador) só a primeira varre; as outras esperam o commit dela e desistem.
+        try:
+            with transaction.atomic():
+                varredura = VarreduraAtrasos.objects.create(referencia=hoje)
+        except IntegrityError:
+            return None
+        for model, origem, campo in ALVOS:
+            alteradas = model.objects.filter(status='ABERTO', data_vencimento__lt=hoje).update(status='ATRASADO')
+            if alteradas:
+                rollups.mudar_status(origem, 'ABERTO', 'ATRASADO', hoje)
+            setattr(varredura, campo, alteradas)
+        varredura.segundos = time.perf_counter() - inicio
+        varredura.save(update_fields=['contas_pagar', 'contas_receber', 'segundos'])
+
+    if varredura.contas_pagar or varredura.contas_receber:
+        # O UPDATE em lote não dispara sinais: as métricas e o analista precisam ver a mudança.
+        cache.bump_version(ContaPagar, ContaReceber)
+    logger.info("varredura de atrasos até %s: %d a pagar, %d a receber em %.3fs", hoje,
+                varredura.contas_pagar, varredura.contas_receber, varredura.segundos)
+    return varredura
+
+
+class Agendador(threading.Thread):
+    """Daemon thread calling :func:`varrer` every ``intervalo`` seconds (a no-op once it ran that day).
+
+    Each server worker starts its own; the unique reference date keeps it to one sweep per day.
+    """
+
+    def __init__(self, intervalo):
+        super().__init__(name='varredura-atrasos', daemon=True)
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.is_set():
+            try:
+                varrer()
+            except Exception:
+                logger.exception("falha na varredura de atrasos")
+            finally:
+                # As conexões desta thread não são fechadas pelo ciclo de requisições.
+                connections.close_all()
+            self._parar.wait(self.intervalo)
+
+    def parar(self):
+        self._parar.set()
+
+
+_agendador = None
+_agendador_lock = threading.Lock()
+
+
+def iniciar_agendador(intervalo=None):
+    """Start the process-wide scheduler if ``OVERDUE_SWEEP_INTERVAL`` (seconds) is set; idempotent."""
+    global _agendador
+    intervalo = intervalo if intervalo is not None else getattr(settings, 'OVERDUE_SWEEP_INTERVAL', 0)
+    if not intervalo:
+        return None
+    with _agendador_lock:
+        if _agendador is None:
+            _agendador = Agendador(intervalo)
+            _agendador.start()
+        return _agendador
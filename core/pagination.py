@@ -0,0 +1,199 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+POR_PAGINA_PADRAO = 50
+POR_PAGINA_MAXIMO = 200
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _serializar(valor):
+    # isoformat() completo: o DjangoJSONEncoder truncaria os microssegundos e o cursor
+    # deixaria de apontar exatamente para a linha de fronteira.
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return str(valor)
+
+
+@dataclass
+class KeysetPage:
+    itens: list
+    ordenacao: str = ''
+    cursor_proximo: str = None
+    cursor_anterior: str = None
+    url_proxima: str = None
+    url_anterior: str = None
+    ordenacoes: list = field(default_factory=list)
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    @property
+    def tem_proxima(self):
+        return self.cursor_proximo is not None
+
+    @property
+    def tem_anterior(self):
+        return self.cursor_anterior is not None
+
+
+class KeysetPaginator:
+    """Cursor (keyset) pagination over a fixed ordering.
+
+    ``ordering`` lists field names as in ``order_by`` and must end in a unique field (the pk), so
+    the cursor, which carries the ordering values of the boundary row, is stable under inserts.
+    """
+
+    def __init__(self, queryset, ordering, per_page=POR_PAGINA_PADRAO):
+        if not ordering or ordering[-1].lstrip('-') not in ('pk', 'id'):
+            raise ValueError("A ordenação precisa terminar na chave primária.")
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+        self.campos = [campo.lstrip('-') for campo in self.ordering]
+
+    # --- cursor ---
+
+    def _valores(self, obj):
+        return [getattr(obj, campo) for campo in self.campos]
+
+    def encode_cursor(self, obj, direcao):
+        payload = json.dumps({'d': direcao, 'v': self._valores(obj)}, default=_serializar, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            preenchimento = '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+            direcao, valores = payload['d'], payload['v']
+            if direcao not in ('next', 'prev') or len(valores) != len(self.campos):
+                raise CursorInvalido(cursor)
+            model = self.queryset.model
+            valores = [
+                model._meta.pk.to_python(valor) if campo == 'pk' else model._meta.get_field(campo).to_python(valor)
+                for campo, valor in zip(self.campos, valores)
+            ]
+        except (binascii.Error, ValueError, KeyError, TypeError, ValidationError) as exc:
+            raise CursorInvalido(cursor) from exc
+        return direcao, valores
+
+    # --- consulta ---
+
+    def _apos(self, valores, ordering):
+        """Q selecting the rows that come strictly after ``valores`` in ``ordering``."""
+        condicao = Q()
+        iguais = Q()
+        for campo, valor in zip(ordering, valores):
+            nome = campo.lstrip('-')
+            lookup = 'lt' if campo.startswith('-') else 'gt'
+            condicao |= iguais & Q(**{f'{nome}__{lookup}': valor})
+            iguais &= Q(**{nome: valor})
+        # Limite redundante na primeira coluna: permite ao banco buscar direto no índice
+        # em vez de avaliar o OR linha a linha.
+        primeiro = ordering[0]
+        limite = 'lte' if primeiro.startswith('-') else 'gte'
+        return Q(**{f'{primeiro.lstrip("-")}__{limite}': valores[0]}) & condicao
+
+    @staticmethod
+    def _inverter(ordering):
+        return [campo[1:] if campo.startswith('-') else f'-{campo}' for campo in ordering]
+
+    def page(self, cursor=None):
+        direcao, valores = ('next', None)
+        if cursor:
+            direcao, valores = self.decode_cursor(cursor)
+
+        ordering = self.ordering if direcao == 'next' else self._inverter(self.ordering)
+        queryset = self.queryset.order_by(*ordering)
+        if valores is not None:
+            queryset = queryset.filter(self._apos(valores, ordering))
+
+        itens = list(queryset[:self.per_page + 1])
+        ha_mais = len(itens) > self.per_page
+        itens = itens[:self.per_page]
+
+        if direcao == 'prev':
+            itens.reverse()
+            tem_proxima, tem_anterior = True, ha_mais
+        else:
+            tem_proxima, tem_anterior = ha_mais, valores is not None
+
+        return KeysetPage(
+            itens=itens,
+            cursor_proximo=self.encode_cursor(itens[-1], 'next') if itens and tem_proxima else None,
+            cursor_anterior=self.encode_cursor(itens[0], 'prev') if itens and tem_anterior else None,
+        )
+
+
+def _por_pagina(request):
+    try:
+        valor = int(request.GET.get('por_pagina', POR_PAGINA_PADRAO))
+    except (TypeError, ValueError):
+        return POR_PAGINA_PADRAO
+    return max(1, min(valor, POR_PAGINA_MAXIMO))
+
+
+def paginate(request, queryset, ordenacoes):
+    """Paginate ``queryset`` using the ``ordem``, ``cursor`` and ``por_pagina`` query parameters.
+
+    ``ordenacoes`` maps each public ordering name to ``(label, fields)``; the first entry is the
+    default. Unknown orderings and invalid cursors fall back to the first page of the default.
+    """
+    ordem = request.GET.get('ordem')
+    if ordem not in ordenacoes:
+        ordem = next(iter(ordenacoes))
+    paginator = KeysetPaginator(queryset, ordenacoes[ordem][1], per_page=_por_pagina(request))
+
+    try:
+        pagina = paginator.page(request.GET.get('cursor'))
+    except CursorInvalido:
+        pagina = paginator.page()
+
+    parametros = request.GET.copy()
+    parametros.pop('cursor', None)
+    if pagina.cursor_proximo:
+        parametros['cursor'] = pagina.cursor_proximo
+        pagina.url_proxima = '?' + parametros.urlencode()
+    if pagina.cursor_anterior:
+        parametros['cursor'] = pagina.cursor_anterior
+        pagina.url_anterior = '?' + parametros.urlencode()
+
+    pagina.ordenacao = ordem
+    pagina.ordenacoes = [(nome, rotulo) for nome, (rotulo, _) in ordenacoes.items()]
+    return pagina
+
+
+def paginate_list(request, itens):
+    """Page over an in-memory list (e.g. a cached report) with the ``pagina`` and ``por_pagina`` parameters.
+
+    The list is already loaded, so plain page numbers are enough; the page has the same interface as
+    :func:`paginate`'s for the pagination template.
+    """
+    por_pagina = _por_pagina(request)
+    try:
+        numero = max(1, int(request.GET.get('pagina', 1)))
+    except (TypeError, ValueError):
+        numero = 1
+    inicio = (numero - 1) * por_pagina
+    pagina = KeysetPage(itens=list(itens[inicio:inicio + por_pagina]))
+
+    parametros = request.GET.copy()
+    if inicio + por_pagina < len(itens):
+        pagina.cursor_proximo = str(numero + 1)
+        parametros['pagina'] = pagina.cursor_proximo
+        pagina.url_proxima = '?' + parametros.urlencode()
+    if numero > 1:
+        pagina.cursor_anterior = str(min(numero - 1, max(1, -(-len(itens) // por_pagina))))
+        parametros['pagina'] = pagina.cursor_anterior
+        pagina.url_anterior = '?' + parametros.urlencode()
+    return pagina
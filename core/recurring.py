@@ -0,0 +1,146 @@
+import calendar
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cache, rollups, stock
+from .models import ContaPagar, ContaPagarRecorrente
+
+logger = logging.getLogger(__name__)
+
+# Contas a pagar recorrentes: cada execução gera, com bulk_create, as contas que vencem até o fim do
+# horizonte e ainda não existem. A recorrência guarda até onde já gerou, e a restrição única
+# (recorrencia, data_vencimento) impede duplicatas mesmo com duas execuções simultâneas.
+
+HORIZONTE = 90
+LOTE = 1000
+
+MESES = {'MENSAL': 1, 'BIMESTRAL': 2, 'TRIMESTRAL': 3, 'SEMESTRAL': 6, 'ANUAL': 12}
+
+
+def vencimento(ano, mes, dia):
+    """``dia`` of the month, or its last day when the month is shorter."""
+    return date(ano, mes, min(dia, calendar.monthrange(ano, mes)[1]))
+
+
+def ocorrencias(recorrencia, desde, ate):
+    """Due dates of ``recorrencia`` from ``desde`` to ``ate`` (inclusive), within its start and end."""
+    desde = max(desde, recorrencia.inicio)
+    if recorrencia.fim is not None:
+        ate = min(ate, recorrencia.fim)
+    if desde > ate:
+        return []
+
+    passo = MESES[recorrencia.frequencia]
+    inicio = recorrencia.inicio
+    # Meses contados a partir do início, para que bimestral e trimestral sigam o calendário do contrato.
+    indice = ((desde.year - inicio.year) * 12 + desde.month - inicio.month) // passo
+    datas = []
+    while True:
+        ano, mes = divmod(inicio.month - 1 + indice * passo, 12)
+        dia = vencimento(inicio.year + ano, mes + 1, recorrencia.dia_vencimento)
+        if dia > ate:
+            return datas
+        if dia >= desde:
+            datas.append(dia)
+        indice += 1
+
+
+@dataclass
+class Geracao:
+    ate: date
+    recorrencias: int = 0
+    criadas: int = 0
+    existentes: int = 0
+    segundos: float = 0.0
+
+
+def pendentes(ate, hoje):
+    """Active recurrences not generated up to ``ate`` yet."""
+    return (ContaPagarRecorrente.objects.filter(ativa=True)
+            .filter(Q(fim__isnull=True) | Q(fim__gte=hoje))
+            .filter(Q(gerada_ate__isnull=True) | Q(gerada_ate__lt=ate)))
+
+
+def gerar(dias=None, hoje=None, recorrencias=None):
+    """Create the ContaPagar rows due in the next ``dias`` days (default: RECURRING_PAYABLES_HORIZON).
+
+    Generation continues from where the previous run stopped, but never before ``hoje``: past due dates
+    of a new or reactivated recurrence are not back-filled. ``recorrencias`` limits the run to those pks.
+    """
+    hoje = hoje or timezone.localdate()
+    dias = dias if dias is not None else getattr(settings, 'RECURRING_PAYABLES_HORIZON', HORIZONTE)
+    ate = hoje + timedelta(days=dias)
+    fila = pendentes(ate, hoje).order_by()
+    if recorrencias is not None:
+        fila = fila.filter(pk__in=recorrencias)
+
+    inicio = time.perf_counter()
+    pendencias = list(fila)
+    geracao = Geracao(ate=ate)
+    if pendencias:
+        try:
+            geracao = _gerar(pendencias, hoje, ate)
+        except IntegrityError:
+            # Outra execução gravou parte das mesmas contas entre a leitura e o INSERT: as que ela criou
+            # agora aparecem como existentes.
+            geracao = _gerar(list(fila), hoje, ate)
+    geracao.segundos = time.perf_counter() - inicio
+    logger.info("contas recorrentes até %s: %d recorrências, %d contas criadas, %d já existiam em %.3fs",
+                ate, geracao.recorrencias, geracao.criadas, geracao.existentes, geracao.segundos)
+    return geracao
+
+
+def regenerar(recorrencia, dias=None, hoje=None):
+    """Redo the future open accounts of an edited ``recorrencia``; returns ``(removidas, geracao)``.
+
+    Open accounts due from ``hoje`` on are deleted and generated again with the current terms
+    (none when the recurrence is no longer active). Paid, cancelled or past-due ones are kept.
+    """
+    hoje = hoje or timezone.localdate()
+    with transaction.atomic():
+        # Um a um, pelos signals, que tiram cada conta dos resumos diários; são poucas por recorrência.
+        removidas, _ = recorrencia.contas.filter(status='ABERTO', data_vencimento__gte=hoje).delete()
+        ContaPagarRecorrente.objects.filter(pk=recorrencia.pk).update(gerada_ate=None)
+    return removidas, gerar(dias, hoje, recorrencias=[recorrencia.pk])
+
+
+@stock.atomic_com_retentativa
+def _gerar(fila, hoje, ate):
+    geracao = Geracao(ate=ate, recorrencias=len(fila))
+    planejadas = {}
+    for recorrencia in fila:
+        desde = max(recorrencia.gerada_ate + timedelta(days=1), hoje) if recorrencia.gerada_ate else hoje
+        for dia in ocorrencias(recorrencia, desde, ate):
+            planejadas[(recorrencia.pk, dia)] = recorrencia
+
+    novas = []
+    if planejadas:
+        # Pela faixa de vencimentos, não por uma lista de milhares de recorrências.
+        existentes = set(ContaPagar.objects.filter(
+            recorrencia__isnull=False, data_vencimento__gte=min(dia for _, dia in planejadas), data_vencimento__lte=ate,
+        ).values_list('recorrencia_id', 'data_vencimento'))
+        novas = [
+            ContaPagar(recorrencia=recorrencia, fornecedor_id=recorrencia.fornecedor_id, descricao=recorrencia.descricao,
+                       valor=recorrencia.valor, data_vencimento=dia)
+            for (pk, dia), recorrencia in planejadas.items() if (pk, dia) not in existentes
+        ]
+        geracao.existentes = len(planejadas) - len(novas)
+
+    if novas:
+        ContaPagar.objects.bulk_create(novas, batch_size=LOTE)
+        # bulk_create não dispara os signals: a contribuição do lote entra nos resumos de uma vez.
+        rollups.aplicar_em_lote(rollups.contribuicao_conta_pagar(conta) for conta in novas)
+        cache.bump_version(ContaPagar)
+    geracao.criadas = len(novas)
+
+    pks = [recorrencia.pk for recorrencia in fila]
+    for indice in range(0, len(pks), LOTE):
+        ContaPagarRecorrente.objects.filter(pk__in=pks[indice:indice + LOTE]).update(gerada_ate=ate)
+    return geracao
@@ -0,0 +1,299 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DateField, Exists, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from . import cache
+from .models import ContaPagar, ContaReceber, Produto, ResumoFinanceiroDiario, Venda
+
+ORIGEM_VENDA = 'VENDA'
+ORIGEM_RECEBER = 'RECEBER'
+ORIGEM_PAGAR = 'PAGAR'
+
+STATUS_EM_ABERTO = ['ABERTO', 'ATRASADO']
+
+# Tabelas cujas escritas invalidam as métricas agregadas em cache.
+METRICS_MODELS = (Venda, ContaReceber, ContaPagar, Produto)
+
+ZERO = Decimal('0.00')
+
+
+# --- Chaves -----------------------------------------------------------------
+# Cada linha de negócio contribui com (chave, valor) para exatamente um resumo.
+
+def chave_venda(data_venda, status, forma_pagamento):
+    return (ORIGEM_VENDA, timezone.localdate(data_venda), status, forma_pagamento or '')
+
+
+def chave_conta_receber(status, data_vencimento, data_recebimento, forma_pagamento=''):
+    dia = data_recebimento if status == 'RECEBIDO' and data_recebimento else data_vencimento
+    return (ORIGEM_RECEBER, dia, status, forma_pagamento or '')
+
+
+def chave_conta_pagar(status, data_vencimento, data_pagamento):
+    dia = data_pagamento if status == 'PAGO' and data_pagamento else data_vencimento
+    return (ORIGEM_PAGAR, dia, status, '')
+
+
+def contribuicao_venda(venda):
+    if venda.data_venda is None:
+        return None
+    return chave_venda(venda.data_venda, venda.status, venda.forma_pagamento), venda.valor_total
+
+
+def contribuicao_conta_receber(conta, forma_pagamento=''):
+    chave = chave_conta_receber(conta.status, conta.data_vencimento, conta.data_recebimento, forma_pagamento)
+    return chave, conta.valor
+
+
+def contribuicao_conta_pagar(conta):
+    return chave_conta_pagar(conta.status, conta.data_vencimento, conta.data_pagamento), conta.valor
+
+
+def contribuicao_salva(model, pk):
+    """Contribution of the row as currently stored in the database, or None."""
+    if pk is None:
+        return None
+    if model is Venda:
+        row = Venda.objects.filter(pk=pk).values('data_venda', 'status', 'forma_pagamento', 'valor_total').first()
+        if not row or row['data_venda'] is None:
+            return None
+        return chave_venda(row['data_venda'], row['status'], row['forma_pagamento']), row['valor_total']
+    if model is ContaReceber:
+        row = ContaReceber.objects.filter(pk=pk).values(
+            'status', 'data_vencimento', 'data_recebimento', 'valor', 'venda__forma_pagamento'
+        ).first()
+        if not row:
+            return None
+        chave = chave_conta_receber(row['status'], row['data_vencimento'], row['data_recebimento'],
+                                    row['venda__forma_pagamento'])
+        return chave, row['valor']
+    if model is ContaPagar:
+        row = ContaPagar.objects.filter(pk=pk).values('status', 'data_vencimento', 'data_pagamento', 'valor').first()
+        if not row:
+            return None
+        return chave_conta_pagar(row['status'], row['data_vencimento'], row['data_pagamento']), row['valor']
+    raise ValueError(f"Modelo sem resumo financeiro: {model.__name__}")
+
+
+# --- Atualização incremental ------------------------------------------------
+
+def aplicar(chave, registros, valor):
+    """Add a delta to the rollup row identified by ``chave``, creating it when needed."""
+    origem, dia, status, forma_pagamento = chave
+    filtro = {'origem': origem, 'dia': dia, 'status': status, 'forma_pagamento': forma_pagamento}
+    valor = Decimal(valor or 0)
+
+    with transaction.atomic():
+        atualizados = ResumoFinanceiroDiario.objects.filter(**filtro).update(
+            registros=F('registros') + registros, valor=F('valor') + valor
+        )
+        if not atualizados:
+            try:
+                with transaction.atomic():
+                    ResumoFinanceiroDiario.objects.create(registros=registros, valor=valor, **filtro)
+            except IntegrityError:
+                # Outra transação criou a linha entre o UPDATE e o INSERT.
+                ResumoFinanceiroDiario.objects.filter(**filtro).update(
+                    registros=F('registros') + registros, valor=F('valor') + valor
+                )
+        ResumoFinanceiroDiario.objects.filter(registros=0, **filtro).delete()
+
+
+def aplicar_em_lote(contribuicoes):
+    """Add many new rows' ``(chave, valor)`` contributions with one write per distinct rollup row."""
+    totais = {}
+    for chave, valor in contribuicoes:
+        registros, soma = totais.get(chave, (0, ZERO))
+        totais[chave] = (registros + 1, soma + valor)
+    with transaction.atomic():
+        for chave, (registros, valor) in totais.items():
+            aplicar(chave, registros, valor)
+    return len(totais)
+
+
+def mover(antes, depois):
+    """Move one row's contribution from ``antes`` to ``depois`` (either may be None)."""
+    if antes == depois:
+        return
+    if antes is not None:
+        aplicar(antes[0], -1, -antes[1])
+    if depois is not None:
+        aplicar(depois[0], 1, depois[1])
+
+
+def mover_em_lote(movimentos):
+    """:func:`mover` for many rows' ``(antes, depois)`` pairs, with one write per distinct rollup row."""
+    totais = defaultdict(lambda: (0, ZERO))
+    for antes, depois in movimentos:
+        if antes == depois:
+            continue
+        for contribuicao, sinal in ((antes, -1), (depois, 1)):
+            if contribuicao is not None:
+                chave, valor = contribuicao
+                registros, soma = totais[chave]
+                totais[chave] = (registros + sinal, soma + sinal * valor)
+    with transaction.atomic():
+        for chave, (registros, valor) in totais.items():
+            if registros or valor:
+                aplicar(chave, registros, valor)
+    return len(totais)
+
+
+def mudar_status(origem, de, para, ate):
+    """Move the ``de`` rollups of ``origem`` for days before ``ate`` to status ``para``.
+
+    For bulk status changes that keep the rollup day (open accounts are filed under their due date):
+    three set-based statements instead of one :func:`aplicar` per row.
+    """
+    origens = ResumoFinanceiroDiario.objects.filter(origem=origem, status=de, dia__lt=ate)
+    par = origens.filter(dia=OuterRef('dia'), forma_pagamento=OuterRef('forma_pagamento')).order_by()
+    destino = ResumoFinanceiroDiario.objects.filter(
+        origem=origem, status=para, dia=OuterRef('dia'), forma_pagamento=OuterRef('forma_pagamento')
+    )
+    with transaction.atomic():
+        # Dias que já têm linha no status novo somam nela; os demais só trocam o status.
+        ResumoFinanceiroDiario.objects.filter(origem=origem, status=para).filter(Exists(par)).update(
+            registros=F('registros') + Subquery(par.values('registros')[:1]),
+            valor=F('valor') + Subquery(par.values('valor')[:1]),
+        )
+        origens.filter(Exists(destino)).delete()
+        return origens.update(status=para)
+
+
+# --- Recalculo a partir das tabelas de origem ---------------------------------
+
+def _dia_conta_receber():
+    return Case(
+        When(status='RECEBIDO', data_recebimento__isnull=False, then=F('data_recebimento')),
+        default=F('data_vencimento'),
+        output_field=DateField(),
+    )
+
+
+def _dia_conta_pagar():
+    return Case(
+        When(status='PAGO', data_pagamento__isnull=False, then=F('data_pagamento')),
+        default=F('data_vencimento'),
+        output_field=DateField(),
+    )
+
+
+def _agregados(origem, dias=None):
+    if origem == ORIGEM_VENDA:
+        queryset = Venda.objects.annotate(
+            dia=TruncDate('data_venda'), forma=F('forma_pagamento'), valor=F('valor_total')
+        )
+    elif origem == ORIGEM_RECEBER:
+        queryset = ContaReceber.objects.annotate(
+            dia=_dia_conta_receber(), forma=Coalesce('venda__forma_pagamento', Value(''))
+        )
+    elif origem == ORIGEM_PAGAR:
+        queryset = ContaPagar.objects.annotate(dia=_dia_conta_pagar(), forma=Value(''))
+    else:
+        raise ValueError(f"Origem desconhecida: {origem}")
+
+    if dias is not None:
+        queryset = queryset.filter(dia__in=list(dias))
+
+    linhas = queryset.order_by().values('dia', 'status', 'forma').annotate(
+        total_registros=Count('id'), total_valor=Sum('valor')
+    )
+    return [
+        ResumoFinanceiroDiario(
+            origem=origem, dia=linha['dia'], status=linha['status'], forma_pagamento=linha['forma'] or '',
+            registros=linha['total_registros'], valor=linha['total_valor'] or ZERO,
+        )
+        for linha in linhas
+    ]
+
+
+def recompute_days(origem, dias):
+    """Rebuild the rollups of ``origem`` for the given days; used after bulk writes that skip signals."""
+    dias = {dia for dia in dias if dia is not None}
+    if not dias:
+        return 0
+    with transaction.atomic():
+        ResumoFinanceiroDiario.objects.filter(origem=origem, dia__in=dias).delete()
+        resumos = _agregados(origem, dias)
+        ResumoFinanceiroDiario.objects.bulk_create(resumos)
+    cache.bump_version(*METRICS_MODELS)
+    return len(resumos)
+
+
+def rebuild():
+    """Drop and recompute every rollup row from Venda, ContaReceber and ContaPagar."""
+    with transaction.atomic():
+        ResumoFinanceiroDiario.objects.all().delete()
+        total = 0
+        for origem in (ORIGEM_VENDA, ORIGEM_RECEBER, ORIGEM_PAGAR):
+            resumos = _agregados(origem)
+            ResumoFinanceiroDiario.objects.bulk_create(resumos, batch_size=1000)
+            total += len(resumos)
+    cache.bump_version(*METRICS_MODELS)
+    return total
+
+
+# --- Leitura --------------------------------------------------------------------
+
+def monthly_totals():
+    """{(origem, status): [(mes, registros, valor), ...]} read from the daily rollups."""
+    linhas = ResumoFinanceiroDiario.objects.annotate(mes=TruncMonth('dia')).order_by('mes').values(
+        'origem', 'status', 'mes'
+    ).annotate(total_registros=Sum('registros'), total_valor=Sum('valor'))
+
+    totais = defaultdict(list)
+    for linha in linhas:
+        totais[(linha['origem'], linha['status'])].append(
+            (linha['mes'], linha['total_registros'] or 0, linha['total_valor'] or ZERO)
+        )
+    return totais
+
+
+def somar(totais, origem, status):
+    """Total (registros, valor) over every month for ``origem`` and one or more statuses."""
+    if isinstance(status, str):
+        status = [status]
+    registros, valor = 0, ZERO
+    for item in status:
+        for _, mes_registros, mes_valor in totais.get((origem, item), []):
+            registros += mes_registros
+            valor += mes_valor
+    return registros, valor
+
+
+def aggregated_metrics():
+    """Metrics for the analyst prompt, cached until one of ``METRICS_MODELS`` changes."""
+    return cache.cached('aggregated_metrics', METRICS_MODELS, compute_aggregated_metrics)
+
+
+def compute_aggregated_metrics():
+    """Metrics for the analyst prompt, read from the rollups plus one aggregate over Produto."""
+    totais = monthly_totals()
+
+    vendas_concluidas = somar(totais, ORIGEM_VENDA, 'CONCLUIDA')
+    vendas_pendentes = somar(totais, ORIGEM_VENDA, 'PENDENTE')
+    estoque = Produto.objects.aggregate(total=Sum('quantidade_estoque'), quantidade=Count('id'))
+
+    return {
+        'total_vendas_concluidas': round(float(vendas_concluidas[1]), 2),
+        'total_vendas_pendentes': round(float(vendas_pendentes[1]), 2),
+        'total_contas_recebidas': round(float(somar(totais, ORIGEM_RECEBER, 'RECEBIDO')[1]), 2),
+        'total_contas_receber_aberto_atrasado': round(float(somar(totais, ORIGEM_RECEBER, STATUS_EM_ABERTO)[1]), 2),
+        'total_contas_pagar_aberto_atrasado': round(float(somar(totais, ORIGEM_PAGAR, STATUS_EM_ABERTO)[1]), 2),
+        'quantidade_vendas_concluidas': vendas_concluidas[0],
+        'quantidade_vendas_pendentes': vendas_pendentes[0],
+        'total_estoque_geral': round(float(estoque['total'] or 0), 2),
+        'quantidade_total_produtos_cadastrados': estoque['quantidade'],
+        'vendas_concluidas_por_mes': {
+            mes.strftime('%Y-%m'): round(float(valor), 2)
+            for mes, _, valor in totais.get((ORIGEM_VENDA, 'CONCLUIDA'), [])
+        },
+        'receita_recebida_por_mes': {
+            mes.strftime('%Y-%m'): round(float(valor), 2)
+            for mes, _, valor in totais.get((ORIGEM_RECEBER, 'RECEBIDO'), [])
+        },
+    }
@@ -0,0 +1,126 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from . import cache, stock
+from .models import ContaReceber, Venda, VendaItem
+
+PRAZOS = {'7D': 7, '14D': 14, '28D': 28}
+
+
+def termos_conta_receber(forma_pagamento, condicao_prazo, hoje=None):
+    """(data_vencimento, status, data_recebimento) of the receivable of a concluded sale.
+
+    À vista sales are received on the spot; a prazo sales fall due after the chosen term.
+    """
+    hoje = hoje or timezone.localdate()
+    if forma_pagamento == 'AV':
+        return hoje, 'RECEBIDO', hoje
+    return hoje + timedelta(days=PRAZOS.get(condicao_prazo, 0)), 'ABERTO', None
+
+
+def descricao_conta_receber(venda, itens):
+    resumo = itens[0].produto.nome if len(itens) == 1 else f"{len(itens)} itens"
+    return f"Recebimento de Venda #{venda.pk} - {resumo}"
+
+
+def sincronizar_conta_receber(venda, itens):
+    """Create, update or drop the order's single ContaReceber so it matches the order's status."""
+    if venda.status != 'CONCLUIDA':
+        for conta in ContaReceber.objects.filter(venda=venda):
+            conta.delete()
+        return None
+
+    data_vencimento, status, data_recebimento = termos_conta_receber(venda.forma_pagamento, venda.condicao_prazo)
+    valores = {
+        'cliente': venda.cliente,
+        'descricao': descricao_conta_receber(venda, itens),
+        'valor': venda.valor_total,
+        'data_vencimento': data_vencimento,
+        'status': status,
+        'data_recebimento': data_recebimento,
+    }
+    conta = ContaReceber.objects.filter(venda=venda).first()
+    if conta is None:
+        return ContaReceber.objects.create(venda=venda, **valores)
+    for campo, valor in valores.items():
+        setattr(conta, campo, valor)
+    conta.save()
+    return conta
+
+
+def agrupar_linhas(linhas):
+    """Merge ``(produto, quantidade)`` pairs by product, keeping the first-seen order."""
+    agrupadas = {}
+    for produto, quantidade in linhas:
+        anterior = agrupadas.get(produto.pk, (produto, 0))[1]
+        agrupadas[produto.pk] = (produto, anterior + quantidade)
+    return agrupadas
+
+
+def salvar_venda(venda, linhas):
+    """Save a new or edited order with its ``(produto, quantidade)`` lines in one transaction.
+
+    Stock moves in a single conditional UPDATE for every product involved, the lines are written with
+    one ``bulk_create`` and the order keeps exactly one ContaReceber. Raises
+    ``stock.EstoqueInsuficiente`` (and rolls everything back) when the stock cannot cover the order.
+    """
+    return _salvar_venda(venda, venda.pk, agrupar_linhas(linhas))
+
+
+@stock.atomic_com_retentativa
+def _salvar_venda(venda, pk, linhas):
+    # Uma tentativa desfeita pode ter deixado a pk de um INSERT que não existe mais.
+    venda.pk = pk
+    venda._state.adding = pk is None
+
+    anteriores = {}
+    if pk:
+        Venda.objects.select_for_update().filter(pk=pk).exists()
+        anteriores = {
+            produto_id: (quantidade, preco)
+            for produto_id, quantidade, preco in VendaItem.objects.filter(venda_id=pk).values_list(
+                'produto_id', 'quantidade', 'preco_unitario')
+        }
+
+    deltas = {produto_id: quantidade for produto_id, (_, quantidade) in linhas.items()}
+    for produto_id, (quantidade, _) in anteriores.items():
+        deltas[produto_id] = deltas.get(produto_id, 0) - quantidade
+    stock.movimentar(deltas)
+
+    itens = []
+    for produto_id, (produto, quantidade) in linhas.items():
+        # Itens que já estavam no pedido mantêm o preço da venda original.
+        preco = anteriores[produto_id][1] if produto_id in anteriores else produto.preco_venda
+        itens.append(VendaItem(produto=produto, quantidade=quantidade, preco_unitario=preco,
+                               valor_total=preco * quantidade))
+    venda.valor_total = sum((item.valor_total for item in itens), Decimal('0.00'))
+    venda.save()
+    stock.lancar(deltas, 'VENDA' if pk is None else 'ALTERACAO', venda)
+
+    if anteriores:
+        VendaItem.objects.filter(venda_id=pk).delete()
+    for item in itens:
+        item.venda = venda
+    VendaItem.objects.bulk_create(itens)
+    # bulk_create e o DELETE via queryset não disparam signals.
+    cache.bump_version(VendaItem)
+
+    sincronizar_conta_receber(venda, itens)
+    return venda
+
+
+@stock.atomic_com_retentativa
+def excluir_venda(venda):
+    """Delete an order, its lines and its receivable, returning every unit to stock."""
+    if not Venda.objects.select_for_update().filter(pk=venda.pk).exists():
+        return
+    itens = VendaItem.objects.filter(venda_id=venda.pk).values_list('produto_id', 'quantidade')
+    deltas = {produto_id: -quantidade for produto_id, quantidade in itens}
+    stock.movimentar(deltas)
+    stock.lancar(deltas, 'EXCLUSAO', venda)
+    for conta in ContaReceber.objects.filter(venda_id=venda.pk):
+        conta.delete()
+    venda.delete()
+    cache.bump_version(VendaItem)
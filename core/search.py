@@ -0,0 +1,139 @@
+import re
+from dataclasses import dataclass
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+
+from .models import Cliente, Fornecedor, Produto
+
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 100
+
+
+@dataclass(frozen=True)
+class Indice:
+    """FTS5 index over one model; ``pesos`` are the bm25 weights of ``colunas``, in order."""
+
+    tipo: str
+    model: type
+    colunas: tuple
+    pesos: tuple
+    titulo: str
+    detalhe: str
+    url_name: str
+
+    @property
+    def tabela(self):
+        return self.model._meta.db_table
+
+    @property
+    def fts(self):
+        return f'{self.tabela}_fts'
+
+
+# As tabelas virtuais, os gatilhos e a carga inicial são criados na migração 0005_busca_textual.
+INDICES = {
+    'produtos': Indice('produtos', Produto, ('nome', 'descricao'), (10.0, 1.0),
+                       'nome', 'descricao', 'produto_editar'),
+    'clientes': Indice('clientes', Cliente, ('nome', 'email', 'endereco'), (10.0, 5.0, 1.0),
+                       'nome', 'email', 'cliente_editar'),
+    'fornecedores': Indice('fornecedores', Fornecedor, ('nome_empresa', 'contato_nome'), (10.0, 5.0),
+                           'nome_empresa', 'contato_nome', 'fornecedor_editar'),
+}
+
+
+def disponivel():
+    return connection.vendor == 'sqlite'
+
+
+def limite(valor):
+    try:
+        return max(1, min(int(valor), LIMITE_MAXIMO))
+    except (TypeError, ValueError):
+        return LIMITE_PADRAO
+
+
+def termos(texto):
+    return re.findall(r'\w+', texto or '')
+
+
+def expressao_fts(texto):
+    """MATCH expression where every word of ``texto`` must appear as a prefix of some token.
+
+    Words are quoted, so FTS5 operators typed by the user (``OR``, ``NEAR``, ``-``) are plain text.
+    """
+    return ' '.join(f'"{termo}"*' for termo in termos(texto))
+
+
+def _selecao(indice):
+    pesos = ', '.join(str(peso) for peso in indice.pesos)
+    return (
+        f"SELECT '{indice.tipo}' AS tipo, t.id, t.{indice.titulo}, t.{indice.detalhe}, "
+        f"bm25({indice.fts}, {pesos}) AS rank "
+        f"FROM {indice.fts} JOIN {indice.tabela} t ON t.id = {indice.fts}.rowid "
+        f"WHERE {indice.fts} MATCH %s"
+    )
+
+
+def _resultado(tipo, pk, titulo, detalhe, rank):
+    indice = INDICES[tipo]
+    return {
+        'tipo': tipo,
+        'id': pk,
+        'texto': titulo,
+        'detalhe': detalhe or '',
+        'url': reverse(indice.url_name, kwargs={'pk': pk}),
+        'rank': round(rank, 4),
+    }
+
+
+def buscar(texto, tipos=None, quantidade=LIMITE_PADRAO):
+    """Ranked matches for ``texto`` across the indexed models (all of them unless ``tipos`` is given).
+
+    One UNION ALL over the FTS5 tables ordered by bm25; lower ``rank`` is a better match.
+    """
+    indices = [INDICES[tipo] for tipo in (tipos or INDICES)]
+    expressao = expressao_fts(texto)
+    if not expressao or not indices:
+        return []
+    if not disponivel():
+        return _buscar_sem_fts(texto, indices, quantidade)
+
+    sql = ' UNION ALL '.join(_selecao(indice) for indice in indices) + ' ORDER BY rank LIMIT %s'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [expressao] * len(indices) + [quantidade])
+        return [_resultado(*linha) for linha in cursor.fetchall()]
+
+
+def correspondencias(tipo, texto):
+    """Subquery with the primary keys of ``tipo`` matching ``texto``, for ``filter(pk__in=...)``."""
+    indice = INDICES[tipo]
+    return RawSQL(f"SELECT rowid FROM {indice.fts} WHERE {indice.fts} MATCH %s", [expressao_fts(texto)])
+
+
+def _buscar_sem_fts(texto, indices, quantidade):
+    # Outros bancos: sem ranking, todas as palavras precisam aparecer em alguma coluna.
+    resultados = []
+    for indice in indices:
+        condicao = Q()
+        for termo in termos(texto):
+            por_coluna = Q()
+            for coluna in indice.colunas:
+                por_coluna |= Q(**{f'{coluna}__icontains': termo})
+            condicao &= por_coluna
+        linhas = indice.model.objects.filter(condicao).values_list('id', indice.titulo, indice.detalhe)
+        resultados.extend(_resultado(indice.tipo, pk, titulo, detalhe, 0.0) for pk, titulo, detalhe in linhas[:quantidade])
+    return resultados[:quantidade]
+
+
+def rebuild():
+    """Repopulate every FTS5 table from its content table and merge the index segments."""
+    if not disponivel():
+        return []
+    with connection.cursor() as cursor:
+        for indice in INDICES.values():
+            cursor.execute(f"INSERT INTO {indice.fts}({indice.fts}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {indice.fts}({indice.fts}) VALUES ('optimize')")
+    return list(INDICES)
@@ -0,0 +1,143 @@
+import hashlib
+import json
+from dataclasses import dataclass
+
+from django.db import IntegrityError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import cache, rollups, stock
+from .models import ContaPagar, ContaReceber, LiquidacaoEmLote
+
+# Liquidação em lote: muitas contas pagas ou recebidas num único UPDATE condicionado a status em aberto,
+# com o resultado de cada id. Com uma chave de idempotência, a resposta fica guardada e um pedido
+# repetido (nova tentativa do navegador, duplo clique) recebe a mesma resposta sem liquidar de novo.
+
+LIMITE = 1000
+
+LIQUIDADA = 'liquidada'
+JA_LIQUIDADA = 'ja_liquidada'
+CANCELADA = 'cancelada'
+NAO_ENCONTRADA = 'nao_encontrada'
+
+
+@dataclass(frozen=True)
+class Lado:
+    model: type
+    origem: str
+    status: str             # status de liquidada
+    campo_data: str         # data da liquidação
+    chave: object           # chave do resumo diário: (status, vencimento, liquidação[, forma de pagamento])
+
+
+LADOS = {
+    'pagar': Lado(ContaPagar, rollups.ORIGEM_PAGAR, 'PAGO', 'data_pagamento', rollups.chave_conta_pagar),
+    'receber': Lado(ContaReceber, rollups.ORIGEM_RECEBER, 'RECEBIDO', 'data_recebimento', rollups.chave_conta_receber),
+}
+
+
+class PedidoInvalido(ValueError):
+    pass
+
+
+class ChaveReutilizada(Exception):
+    """The idempotency key was already used for a different set of accounts or date."""
+
+
+def ler_pedido(corpo):
+    """``(ids, data)`` from the request body ``{"ids": [...], "data": "AAAA-MM-DD"}``; the date defaults to today."""
+    ids = corpo.get('ids') if isinstance(corpo, dict) else None
+    if not isinstance(ids, list) or not ids:
+        raise PedidoInvalido("Informe a lista de contas em 'ids'.")
+    if not all(isinstance(pk, int) and not isinstance(pk, bool) and pk > 0 for pk in ids):
+        raise PedidoInvalido("Os ids das contas devem ser números inteiros positivos.")
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > LIMITE:
+        raise PedidoInvalido(f"No máximo {LIMITE} contas por pedido.")
+
+    data = corpo.get('data')
+    if data in (None, ''):
+        return ids, timezone.localdate()
+    try:
+        data = parse_date(data) if isinstance(data, str) else None
+    except ValueError:
+        data = None
+    if data is None:
+        raise PedidoInvalido("Informe a data da liquidação no formato AAAA-MM-DD.")
+    return ids, data
+
+
+def assinatura(ids, data):
+    pedido = json.dumps([sorted(ids), data.isoformat()], separators=(',', ':'))
+    return hashlib.sha256(pedido.encode()).hexdigest()
+
+
+@stock.atomic_com_retentativa
+def _liquidar(lado, ids, data, chave):
+    configuracao = LADOS[lado]
+    model = configuracao.model
+    campos = ['pk', 'status', 'valor', 'data_vencimento', configuracao.campo_data]
+    if model is ContaReceber:
+        campos.append('venda__forma_pagamento')
+    # O bloqueio (FOR UPDATE, onde existe) garante que o UPDATE abaixo alcança exatamente estas linhas.
+    atuais = {linha[0]: linha for linha in model.objects.select_for_update().filter(pk__in=ids).values_list(*campos)}
+
+    resultados, movimentos = [], []
+    for pk in ids:
+        linha = atuais.get(pk)
+        if linha is None:
+            resultado = NAO_ENCONTRADA
+        elif linha[1] in rollups.STATUS_EM_ABERTO:
+            resultado = LIQUIDADA
+            movimentos.append(_movimento(configuracao, linha, data))
+        else:
+            resultado = JA_LIQUIDADA if linha[1] == configuracao.status else CANCELADA
+        resultados.append({'id': pk, 'resultado': resultado})
+
+    elegiveis = [item['id'] for item in resultados if item['resultado'] == LIQUIDADA]
+    liquidadas = 0
+    if elegiveis:
+        liquidadas = model.objects.filter(pk__in=elegiveis, status__in=rollups.STATUS_EM_ABERTO).update(
+            status=configuracao.status, **{configuracao.campo_data: data})
+        # O UPDATE em lote não dispara sinais: resumos diários e versão dos dados mudam aqui.
+        rollups.mover_em_lote(movimentos)
+        cache.bump_version(model)
+
+    resposta = {'data': data.isoformat(), 'liquidadas': liquidadas, 'resultados': resultados}
+    if chave:
+        LiquidacaoEmLote.objects.create(lado=lado, chave=chave, assinatura=assinatura(ids, data), resposta=resposta)
+    return resposta
+
+
+def _movimento(configuracao, linha, data):
+    """``(antes, depois)`` rollup contributions of an open account settled on ``data``."""
+    _, status, valor, vencimento, liquidacao, *forma = linha
+    antes = configuracao.chave(status, vencimento, liquidacao, *forma)
+    depois = configuracao.chave(configuracao.status, vencimento, data, *forma)
+    return (antes, valor), (depois, valor)
+
+
+def liquidar(lado, ids, data, chave=None):
+    """Settle the open accounts among ``ids`` on ``data``; returns ``(resposta, repetida)``.
+
+    ``resposta`` has the outcome of each id, in the order given. With ``chave``, a repeated request
+    returns the stored response instead (``repetida`` True); reusing the key for other accounts or
+    another date raises :class:`ChaveReutilizada`.
+    """
+    if chave:
+        anterior = LiquidacaoEmLote.objects.filter(lado=lado, chave=chave).first()
+        if anterior is not None:
+            return _repetir(anterior, ids, data), True
+    try:
+        return _liquidar(lado, ids, data, chave), False
+    except IntegrityError:
+        # Outro pedido com a mesma chave terminou primeiro; esta transação foi desfeita por inteiro.
+        if not chave:
+            raise
+        return _repetir(LiquidacaoEmLote.objects.get(lado=lado, chave=chave), ids, data), True
+
+
+def _repetir(anterior, ids, data):
+    if anterior.assinatura != assinatura(ids, data):
+        raise ChaveReutilizada("Chave de idempotência já usada para outras contas ou outra data.")
+    return anterior.resposta
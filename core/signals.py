@@ -0,0 +1,140 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cache, rollups
+from .models import Categoria, Cliente, ContaPagar, ContaReceber, Fornecedor, MovimentoEstoque, Produto, Venda, chave_de_busca
+
+
+def _forma_pagamento_da_venda(venda_id):
+    if not venda_id:
+        return ''
+    return Venda.objects.filter(pk=venda_id).values_list('forma_pagamento', flat=True).first() or ''
+
+
+# --- Resumos financeiros diários ------------------------------------------------
+# O pre_save/pre_delete guarda a contribuição atual da linha no banco; o post_save/
+# post_delete move essa contribuição para a nova chave (ou a remove).
+
+@receiver(pre_save, sender=Venda, dispatch_uid='rollup_venda_pre_save')
+def rollup_venda_pre_save(sender, instance, **kwargs):
+    instance._rollup_antes = rollups.contribuicao_salva(Venda, instance.pk)
+    instance._forma_pagamento_antes = instance._rollup_antes[0][3] if instance._rollup_antes else None
+
+
+@receiver(post_save, sender=Venda, dispatch_uid='rollup_venda_post_save')
+def rollup_venda_post_save(sender, instance, **kwargs):
+    rollups.mover(getattr(instance, '_rollup_antes', None), rollups.contribuicao_venda(instance))
+
+    # A forma de pagamento também compõe a chave da conta a receber vinculada.
+    forma_antes = getattr(instance, '_forma_pagamento_antes', None)
+    if forma_antes is not None and forma_antes != instance.forma_pagamento:
+        conta = ContaReceber.objects.filter(venda_id=instance.pk).first()
+        if conta:
+            rollups.mover(
+                rollups.contribuicao_conta_receber(conta, forma_antes),
+                rollups.contribuicao_conta_receber(conta, instance.forma_pagamento),
+            )
+
+
+@receiver(pre_delete, sender=Venda, dispatch_uid='rollup_venda_pre_delete')
+def rollup_venda_pre_delete(sender, instance, **kwargs):
+    instance._rollup_antes = rollups.contribuicao_salva(Venda, instance.pk)
+
+
+@receiver(post_delete, sender=Venda, dispatch_uid='rollup_venda_post_delete')
+def rollup_venda_post_delete(sender, instance, **kwargs):
+    rollups.mover(getattr(instance, '_rollup_antes', None), None)
+
+
+@receiver(pre_save, sender=ContaReceber, dispatch_uid='rollup_conta_receber_pre_save')
+def rollup_conta_receber_pre_save(sender, instance, **kwargs):
+    instance._rollup_antes = rollups.contribuicao_salva(ContaReceber, instance.pk)
+
+
+@receiver(post_save, sender=ContaReceber, dispatch_uid='rollup_conta_receber_post_save')
+def rollup_conta_receber_post_save(sender, instance, **kwargs):
+    depois = rollups.contribuicao_conta_receber(instance, _forma_pagamento_da_venda(instance.venda_id))
+    rollups.mover(getattr(instance, '_rollup_antes', None), depois)
+
+
+@receiver(pre_delete, sender=ContaReceber, dispatch_uid='rollup_conta_receber_pre_delete')
+def rollup_conta_receber_pre_delete(sender, instance, **kwargs):
+    instance._rollup_antes = rollups.contribuicao_salva(ContaReceber, instance.pk)
+
+
+@receiver(post_delete, sender=ContaReceber, dispatch_uid='rollup_conta_receber_post_delete')
+def rollup_conta_receber_post_delete(sender, instance, **kwargs):
+    rollups.mover(getattr(instance, '_rollup_antes', None), None)
+
+
+@receiver(pre_save, sender=ContaPagar, dispatch_uid='rollup_conta_pagar_pre_save')
+def rollup_conta_pagar_pre_save(sender, instance, **kwargs):
+    instance._rollup_antes = rollups.contribuicao_salva(ContaPagar, instance.pk)
+
+
+@receiver(post_save, sender=ContaPagar, dispatch_uid='rollup_conta_pagar_post_save')
+def rollup_conta_pagar_post_save(sender, instance, **kwargs):
+    rollups.mover(getattr(instance, '_rollup_antes', None), rollups.contribuicao_conta_pagar(instance))
+
+
+@receiver(pre_delete, sender=ContaPagar, dispatch_uid='rollup_conta_pagar_pre_delete')
+def rollup_conta_pagar_pre_delete(sender, instance, **kwargs):
+    instance._rollup_antes = rollups.contribuicao_salva(ContaPagar, instance.pk)
+
+
+@receiver(post_delete, sender=ContaPagar, dispatch_uid='rollup_conta_pagar_post_delete')
+def rollup_conta_pagar_post_delete(sender, instance, **kwargs):
+    rollups.mover(getattr(instance, '_rollup_antes', None), None)
+
+
+# --- Razão de estoque -----------------------------------------------------------
+# Vendas movimentam o estoque por UPDATE (stock.movimentar) e lançam o próprio razão;
+# o que chega aqui são cadastros e ajustes feitos no formulário ou no admin.
+
+@receiver(pre_save, sender=Produto, dispatch_uid='razao_produto_pre_save')
+def razao_produto_pre_save(sender, instance, **kwargs):
+    instance._estoque_antes = Produto.objects.filter(pk=instance.pk).values_list(
+        'quantidade_estoque', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Produto, dispatch_uid='razao_produto_post_save')
+def razao_produto_post_save(sender, instance, **kwargs):
+    antes = getattr(instance, '_estoque_antes', None)
+    diferenca = instance.quantidade_estoque - (antes or 0)
+    if diferenca:
+        MovimentoEstoque.objects.create(produto=instance, motivo='INICIAL' if antes is None else 'AJUSTE',
+                                        quantidade=diferenca)
+
+
+# --- Chave de busca do autocomplete ---------------------------------------------
+# O save() dos modelos já calcula a chave; o loaddata grava em modo raw, sem passar por ele.
+
+CAMPOS_DE_BUSCA = {Fornecedor: 'nome_empresa', Cliente: 'nome', Produto: 'nome'}
+
+
+@receiver(pre_save, sender=Fornecedor, dispatch_uid='chave_busca_fornecedor_pre_save')
+@receiver(pre_save, sender=Cliente, dispatch_uid='chave_busca_cliente_pre_save')
+@receiver(pre_save, sender=Produto, dispatch_uid='chave_busca_produto_pre_save')
+def chave_de_busca_na_carga(sender, instance, raw=False, **kwargs):
+    if raw:
+        instance.chave_busca = chave_de_busca(getattr(instance, CAMPOS_DE_BUSCA[sender]))
+
+
+# --- Versões de dados para o cache --------------------------------------------
+
+@receiver(post_save, sender=Venda, dispatch_uid='versao_venda_post_save')
+@receiver(post_delete, sender=Venda, dispatch_uid='versao_venda_post_delete')
+@receiver(post_save, sender=ContaReceber, dispatch_uid='versao_conta_receber_post_save')
+@receiver(post_delete, sender=ContaReceber, dispatch_uid='versao_conta_receber_post_delete')
+@receiver(post_save, sender=ContaPagar, dispatch_uid='versao_conta_pagar_post_save')
+@receiver(post_delete, sender=ContaPagar, dispatch_uid='versao_conta_pagar_post_delete')
+@receiver(post_save, sender=Produto, dispatch_uid='versao_produto_post_save')
+@receiver(post_delete, sender=Produto, dispatch_uid='versao_produto_post_delete')
+@receiver(post_save, sender=Cliente, dispatch_uid='versao_cliente_post_save')
+@receiver(post_delete, sender=Cliente, dispatch_uid='versao_cliente_post_delete')
+@receiver(post_save, sender=Fornecedor, dispatch_uid='versao_fornecedor_post_save')
+@receiver(post_delete, sender=Fornecedor, dispatch_uid='versao_fornecedor_post_delete')
+@receiver(post_save, sender=Categoria, dispatch_uid='versao_categoria_post_save')
+@receiver(post_delete, sender=Categoria, dispatch_uid='versao_categoria_post_delete')
+def atualizar_versao_dos_dados(sender, **kwargs):
+    cache.bump_version(sender)
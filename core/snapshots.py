@@ -0,0 +1,193 @@
+import importlib.util
+import json
+import logging
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+from django.conf import settings
+
+from . import cache, dataframes, rollups
+from .models import Categoria, Cliente, ContaPagar, ContaReceber, Fornecedor, Produto, Venda, VendaItem
+
+logger = logging.getLogger(__name__)
+
+# Snapshots do assistente: a amostra do DataFrame e as métricas de uma mesma versão dos dados
+# ficam na memória do processo (e, opcionalmente, em Parquet no disco). Enquanto nenhum dos
+# models abaixo mudar, as perguntas seguintes não voltam ao banco.
+
+DEPENDENCIAS = (Venda, VendaItem, ContaReceber, ContaPagar, Produto, Cliente, Fornecedor, Categoria)
+
+MAXIMO_ENTRADAS = 4
+MAXIMO_MB = 256
+
+
+@dataclass
+class Snapshot:
+    versao: str
+    frames: dict
+    metricas: dict
+    tamanho: int = field(default=0, compare=False)
+
+    def __post_init__(self):
+        if not self.tamanho:
+            self.tamanho = sum(int(df.memory_usage(deep=True).sum()) for df in self.frames.values()) \
+                + len(json.dumps(self.metricas))
+
+
+def versao_atual():
+    """Data version of every model the snapshot is built from, as a single key."""
+    return '-'.join(str(versao) for versao in cache.data_version(*DEPENDENCIAS))
+
+
+def construir(versao):
+    return Snapshot(
+        versao=versao,
+        frames={'amostra': dataframes.combinado(limite=dataframes.LIMITE_CHAT)},
+        metricas=rollups.aggregated_metrics(),
+    )
+
+
+def parquet_disponivel():
+    return any(importlib.util.find_spec(motor) for motor in ('pyarrow', 'fastparquet'))
+
+
+class ArmazemParquet:
+    """One directory per data version holding ``<frame>.parquet`` files and ``metricas.json``."""
+
+    def __init__(self, diretorio, maximo_entradas=MAXIMO_ENTRADAS):
+        self.diretorio = Path(diretorio)
+        self.maximo_entradas = maximo_entradas
+
+    def ler(self, versao):
+        pasta = self.diretorio / versao
+        try:
+            metricas = json.loads((pasta / 'metricas.json').read_text(encoding='utf-8'))
+            frames = {arquivo.stem: pd.read_parquet(arquivo) for arquivo in pasta.glob('*.parquet')}
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.warning("snapshot %s ilegível em %s; será reconstruído", versao, pasta, exc_info=True)
+            return None
+        return Snapshot(versao=versao, frames=frames, metricas=metricas)
+
+    def gravar(self, snapshot):
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        destino = self.diretorio / snapshot.versao
+        temporaria = Path(tempfile.mkdtemp(prefix='.gravando-', dir=self.diretorio))
+        try:
+            for nome, df in snapshot.frames.items():
+                df.to_parquet(temporaria / f'{nome}.parquet', index=False)
+            # metricas.json por último: é ele que marca a pasta como completa.
+            (temporaria / 'metricas.json').write_text(json.dumps(snapshot.metricas), encoding='utf-8')
+            temporaria.rename(destino)
+        except Exception:
+            shutil.rmtree(temporaria, ignore_errors=True)
+            # Outro processo pode ter gravado a mesma versão primeiro.
+            if not (destino / 'metricas.json').exists():
+                logger.warning("não foi possível gravar o snapshot %s em %s", snapshot.versao, self.diretorio,
+                               exc_info=True)
+            return
+        self._podar()
+
+    def _podar(self):
+        pastas = sorted((pasta for pasta in self.diretorio.iterdir() if pasta.is_dir() and not pasta.name.startswith('.')),
+                        key=lambda pasta: pasta.stat().st_mtime, reverse=True)
+        for pasta in pastas[self.maximo_entradas:]:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+
+class CacheDeSnapshots:
+    """LRU of snapshots bounded by entry count and by the frames' in-memory size."""
+
+    def __init__(self, maximo_entradas=MAXIMO_ENTRADAS, maximo_bytes=MAXIMO_MB * 2 ** 20, armazem=None):
+        self.maximo_entradas = maximo_entradas
+        self.maximo_bytes = maximo_bytes
+        self.armazem = armazem
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = {'memoria': 0, 'disco': 0, 'construidos': 0, 'despejados': 0}
+
+    def obter(self, versao=None, construtor=construir):
+        """Snapshot of ``versao`` (default: the current one), built with ``construtor(versao)`` on a miss."""
+        versao = versao or versao_atual()
+        with self._lock:
+            snapshot = self._entradas.get(versao)
+            if snapshot is not None:
+                self._entradas.move_to_end(versao)
+                self._contadores['memoria'] += 1
+                return snapshot
+
+        snapshot = self.armazem.ler(versao) if self.armazem else None
+        if snapshot is not None:
+            origem = 'disco'
+        else:
+            snapshot = construtor(versao)
+            origem = 'construidos'
+            if self.armazem:
+                self.armazem.gravar(snapshot)
+
+        with self._lock:
+            self._contadores[origem] += 1
+            self._guardar(snapshot)
+        return snapshot
+
+    def _guardar(self, snapshot):
+        if snapshot.tamanho > self.maximo_bytes:
+            logger.info("snapshot %s (%d bytes) maior que o limite; não fica na memória", snapshot.versao, snapshot.tamanho)
+            return
+        self._entradas[snapshot.versao] = snapshot
+        self._entradas.move_to_end(snapshot.versao)
+        while len(self._entradas) > self.maximo_entradas or self.bytes_em_uso() > self.maximo_bytes:
+            self._entradas.popitem(last=False)
+            self._contadores['despejados'] += 1
+
+    def bytes_em_uso(self):
+        return sum(snapshot.tamanho for snapshot in self._entradas.values())
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            for chave in self._contadores:
+                self._contadores[chave] = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._contadores, entradas=len(self._entradas), bytes=self.bytes_em_uso())
+
+
+def _armazem_configurado():
+    diretorio = getattr(settings, 'ANALYTICS_SNAPSHOT_DIR', None)
+    if not diretorio:
+        return None
+    if not parquet_disponivel():
+        logger.warning("ANALYTICS_SNAPSHOT_DIR definido, mas pyarrow/fastparquet não está instalado; "
+                       "snapshots ficam só na memória")
+        return None
+    return ArmazemParquet(diretorio, getattr(settings, 'ANALYTICS_SNAPSHOT_MAX_ENTRIES', MAXIMO_ENTRADAS))
+
+
+_padrao = None
+_padrao_lock = threading.Lock()
+
+
+def padrao():
+    """The process-wide snapshot cache, configured from settings on first use."""
+    global _padrao
+    with _padrao_lock:
+        if _padrao is None:
+            _padrao = CacheDeSnapshots(
+                maximo_entradas=getattr(settings, 'ANALYTICS_SNAPSHOT_MAX_ENTRIES', MAXIMO_ENTRADAS),
+                maximo_bytes=getattr(settings, 'ANALYTICS_SNAPSHOT_MAX_MB', MAXIMO_MB) * 2 ** 20,
+                armazem=_armazem_configurado(),
+            )
+        return _padrao
+
+
+def atual():
+    """Snapshot for the current data version, from memory, disk or freshly built."""
+    return padrao().obter()
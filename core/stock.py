@@ -0,0 +1,214 @@
+import functools
+import logging
+import random
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import cache
+from .models import MovimentoEstoque, Produto, SaldoEstoque
+
+logger = logging.getLogger(__name__)
+
+TENTATIVAS = 8
+ESPERA_INICIAL = 0.05
+
+
+class EstoqueInsuficiente(Exception):
+    def __init__(self, produto_id, disponivel, solicitado, nome=None):
+        self.produto_id = produto_id
+        self.disponivel = disponivel
+        self.solicitado = solicitado
+        produto = f" para {nome}" if nome else ""
+        super().__init__(f"Estoque insuficiente{produto}. Apenas {disponivel} unidades disponíveis.")
+
+
+def _contencao(exc):
+    # SQLite: "database is locked" / "database table is locked"; PostgreSQL: conflitos de serialização
+    # e deadlocks chegam como OperationalError com SQLSTATE 40001/40P01.
+    mensagem = str(exc).lower()
+    return 'locked' in mensagem or getattr(exc.__cause__, 'pgcode', None) in ('40001', '40P01')
+
+
+def atomic_com_retentativa(func):
+    """Run ``func`` in its own transaction, retrying it with jittered backoff on lock contention.
+
+    When called inside an outer transaction there is nothing to retry safely, so the error propagates.
+    """
+    @functools.wraps(func)
+    def executar(*args, **kwargs):
+        if connection.in_atomic_block:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+
+        for tentativa in range(1, TENTATIVAS + 1):
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as exc:
+                if tentativa == TENTATIVAS or not _contencao(exc):
+                    raise
+                espera = ESPERA_INICIAL * 2 ** (tentativa - 1) * random.uniform(0.5, 1.5)
+                logger.info("Contenção em %s (tentativa %s); nova tentativa em %.3fs", func.__name__, tentativa, espera)
+                time.sleep(espera)
+    return executar
+
+
+def movimentar(deltas):
+    """Apply ``{produto_id: units to take out}`` (negative puts units back) in one conditional UPDATE.
+
+    Each product that loses units only matches while ``quantidade_estoque >= delta``, so concurrent
+    sales can never both pass the check. If any product falls short, nothing is applied and
+    ``EstoqueInsuficiente`` is raised for the first one.
+    """
+    deltas = {produto_id: delta for produto_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    condicao = Q()
+    for produto_id, delta in deltas.items():
+        if delta > 0:
+            condicao |= Q(pk=produto_id, quantidade_estoque__gte=delta)
+        else:
+            condicao |= Q(pk=produto_id)
+    novo_estoque = Case(
+        *[When(pk=produto_id, then=F('quantidade_estoque') - delta) for produto_id, delta in deltas.items()],
+        output_field=IntegerField(),
+    )
+    with transaction.atomic():
+        atualizados = Produto.objects.filter(condicao).update(quantidade_estoque=novo_estoque)
+        if atualizados != len(deltas):
+            _falta_de_estoque(deltas)
+    # UPDATE via queryset não dispara os signals de Produto.
+    cache.bump_version(Produto)
+
+
+def _falta_de_estoque(deltas):
+    produtos = {pk: (nome, estoque) for pk, nome, estoque in
+                Produto.objects.filter(pk__in=deltas).values_list('pk', 'nome', 'quantidade_estoque')}
+    for produto_id, delta in deltas.items():
+        nome, disponivel = produtos.get(produto_id, (None, 0))
+        if delta > 0 and disponivel < delta:
+            raise EstoqueInsuficiente(produto_id, disponivel, delta, nome)
+    raise EstoqueInsuficiente(next(iter(deltas)), 0, 0)
+
+
+def lancar(deltas, motivo, venda=None):
+    """Write the ledger rows of ``deltas`` (same sign convention as ``movimentar``) in one INSERT."""
+    MovimentoEstoque.objects.bulk_create(
+        MovimentoEstoque(produto_id=produto_id, venda=venda, motivo=motivo, quantidade=-delta)
+        for produto_id, delta in deltas.items() if delta
+    )
+
+
+def reservar(produto_id, quantidade, motivo='AJUSTE', venda=None):
+    """Take ``quantidade`` units of one product out of stock."""
+    movimentar({produto_id: quantidade})
+    lancar({produto_id: quantidade}, motivo, venda)
+
+
+def devolver(produto_id, quantidade, motivo='AJUSTE', venda=None):
+    """Put ``quantidade`` units back into stock."""
+    movimentar({produto_id: -quantidade})
+    lancar({produto_id: -quantidade}, motivo, venda)
+
+
+# --- Razão de estoque: saldos históricos ----------------------------------------
+# O saldo num instante é o último SaldoEstoque anterior a ele mais a cauda de movimentos
+# desde esse saldo; sem saldo gravado, a cauda é o histórico inteiro do produto.
+
+INICIO = datetime(1900, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def inicio_do_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, dt_time.min))
+
+
+def fim_do_dia(dia):
+    return inicio_do_dia(dia + timedelta(days=1))
+
+
+def _saldos(momento, produtos=None):
+    foto = SaldoEstoque.objects.filter(produto=OuterRef('pk'), data__lte=momento).order_by('-data')
+    cauda = MovimentoEstoque.objects.filter(
+        produto=OuterRef('pk'), data__lt=momento, data__gte=Coalesce(OuterRef('foto_data'), Value(INICIO))
+    ).order_by().values('produto')
+    queryset = Produto.objects.order_by().annotate(
+        foto_data=Subquery(foto.values('data')[:1]),
+        foto_quantidade=Coalesce(Subquery(foto.values('quantidade')[:1]), 0),
+        cauda=Coalesce(Subquery(cauda.annotate(total=Sum('quantidade')).values('total')), 0),
+        movimentos=Coalesce(Subquery(cauda.annotate(total=Count('id')).values('total')), 0),
+    )
+    if produtos is not None:
+        queryset = queryset.filter(pk__in=produtos)
+    return queryset
+
+
+def saldos_em(momento=None, produtos=None):
+    """``{produto_id: units in stock at momento}`` according to the ledger (now when omitted)."""
+    momento = momento or timezone.now()
+    return {
+        pk: foto + cauda
+        for pk, foto, cauda in _saldos(momento, produtos).values_list('pk', 'foto_quantidade', 'cauda')
+    }
+
+
+def movimentacao(inicio, fim, produtos=None):
+    """Per-product stock activity between ``inicio`` (inclusive) and ``fim`` (exclusive).
+
+    Returns ``{produto_id: {'saldo_inicial', 'entradas', 'saidas', 'saldo_final'}}``.
+    """
+    iniciais = saldos_em(inicio, produtos)
+    periodo = MovimentoEstoque.objects.filter(data__gte=inicio, data__lt=fim)
+    if produtos is not None:
+        periodo = periodo.filter(produto_id__in=produtos)
+    totais = {
+        linha['produto_id']: linha
+        for linha in periodo.order_by().values('produto_id').annotate(
+            entradas=Coalesce(Sum('quantidade', filter=Q(quantidade__gt=0)), 0),
+            saidas=Coalesce(-Sum('quantidade', filter=Q(quantidade__lt=0)), 0),
+        )
+    }
+    resultado = {}
+    for produto_id, saldo_inicial in iniciais.items():
+        linha = totais.get(produto_id, {'entradas': 0, 'saidas': 0})
+        resultado[produto_id] = {
+            'saldo_inicial': saldo_inicial,
+            'entradas': linha['entradas'],
+            'saidas': linha['saidas'],
+            'saldo_final': saldo_inicial + linha['entradas'] - linha['saidas'],
+        }
+    return resultado
+
+
+def registrar_saldos(momento):
+    """Snapshot the ledger balance at ``momento`` for every product that moved since its last snapshot."""
+    saldos = [
+        SaldoEstoque(produto_id=pk, data=momento, quantidade=foto + cauda)
+        for pk, foto, cauda in _saldos(momento).filter(movimentos__gt=0).values_list(
+            'pk', 'foto_quantidade', 'cauda')
+    ]
+    SaldoEstoque.objects.bulk_create(saldos, ignore_conflicts=True)
+    return len(saldos)
+
+
+@atomic_com_retentativa
+def reconciliar(corrigir=True):
+    """Compare ``quantidade_estoque`` with the ledger and, when ``corrigir``, set it from the ledger.
+
+    Returns the drifting products as ``(produto_id, nome, quantidade_estoque, saldo_no_razao)``.
+    """
+    livro = _saldos(timezone.now()).annotate(saldo=F('foto_quantidade') + F('cauda'))
+    divergentes = list(
+        livro.exclude(quantidade_estoque=F('saldo')).order_by('pk').values_list('pk', 'nome', 'quantidade_estoque', 'saldo')
+    )
+    if corrigir and divergentes:
+        Produto.objects.filter(pk__in=[pk for pk, *_ in divergentes]).update(quantidade_estoque=Case(
+            *[When(pk=pk, then=Value(saldo)) for pk, _, _, saldo in divergentes], output_field=IntegerField(),
+        ))
+        cache.bump_version(Produto)
+    return divergentes
@@ -1,3 +1,2075 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import time
+import threading
+import unittest
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+import tempfile
+
+from django.db import IntegrityError, connection, transaction
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import aging, analyst, analytics, answers, autocomplete, benchmarks, cache, cashflow, dataframes, history, imports, llm, overdue, recurring, rollups, sales, search, settlements, snapshots, stock, views
+from .metrics import cached_dashboard_metrics, compute_dashboard_metrics
+from .forms import VendaItemForm
+from .models import (
+    ChatMessage, Cliente, ContaPagar, ContaPagarRecorrente, ContaReceber, Fornecedor, LiquidacaoEmLote, MovimentoEstoque, Produto, ResumoConversa,
+    ResumoFinanceiroDiario, SaldoEstoque, VarreduraAtrasos, Venda, VendaItem,
+)
+
+
+def criar_produto(nome='Filtro de Óleo', preco=Decimal('10.00'), estoque=100, **kwargs):
+    return Produto.objects.create(
+        nome=nome, preco_compra=preco / 2, preco_venda=preco, quantidade_estoque=estoque, **kwargs
+    )
+
+
+def dados_venda(linhas, venda=None, **campos):
+    """POST do formulário de venda: ``linhas`` são pares (produto, quantidade) e substituem os itens da venda."""
+    quantidades = {produto.pk: quantidade for produto, quantidade in linhas}
+    existentes = list(venda.itens.values_list('pk', 'produto_id', 'quantidade')) if venda else []
+    formularios = [
+        (pk, produto_id, quantidades.get(produto_id, quantidade), produto_id not in quantidades)
+        for pk, produto_id, quantidade in existentes
+    ]
+    for _, produto_id, _ in existentes:
+        quantidades.pop(produto_id, None)
+    formularios += [('', produto_id, quantidade, False) for produto_id, quantidade in quantidades.items()]
+
+    dados = {
+        'status': 'CONCLUIDA', 'forma_pagamento': 'AV', **campos,
+        'itens-TOTAL_FORMS': len(formularios), 'itens-INITIAL_FORMS': len(existentes),
+        'itens-MIN_NUM_FORMS': 1, 'itens-MAX_NUM_FORMS': 1000,
+    }
+    for indice, (pk, produto_id, quantidade, remover) in enumerate(formularios):
+        dados.update({f'itens-{indice}-id': pk, f'itens-{indice}-produto': produto_id,
+                      f'itens-{indice}-quantidade': quantidade})
+        if remover:
+            dados[f'itens-{indice}-DELETE'] = 'on'
+    return dados
+
+
+def criar_venda(produto, quantidade=1, **kwargs):
+    # Grava a venda e seu item direto no banco, sem passar pelo serviço de estoque.
+    venda = Venda.objects.create(valor_total=produto.preco_venda * quantidade, **kwargs)
+    VendaItem.objects.create(venda=venda, produto=produto, quantidade=quantidade, preco_unitario=produto.preco_venda)
+    return venda
+
+
+class DashboardMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Cliente.objects.create(nome='Auto Peças Centro')
+        cls.fornecedor = Fornecedor.objects.create(nome_empresa='Hidráulica Total')
+        filtro = criar_produto()
+        vela = criar_produto(nome='Vela de Ignição', preco=Decimal('25.00'))
+
+        criar_venda(filtro, cliente=cls.cliente, quantidade=3, status='CONCLUIDA')
+        criar_venda(vela, quantidade=1, status='CONCLUIDA')
+        criar_venda(filtro, quantidade=2, status='PENDENTE')
+
+        hoje = date.today()
+        ContaReceber.objects.create(descricao='A', valor=Decimal('30.00'), data_vencimento=hoje,
+                                    status='RECEBIDO', data_recebimento=date(2025, 1, 10))
+        ContaReceber.objects.create(descricao='B', valor=Decimal('25.00'), data_vencimento=hoje,
+                                    status='RECEBIDO', data_recebimento=date(2025, 2, 3))
+        ContaReceber.objects.create(descricao='C', valor=Decimal('40.00'), data_vencimento=hoje, status='ABERTO')
+        ContaReceber.objects.create(descricao='D', valor=Decimal('15.00'), data_vencimento=hoje - timedelta(days=3),
+                                    status='ATRASADO')
+        ContaReceber.objects.create(descricao='E', valor=Decimal('99.00'), data_vencimento=hoje, status='CANCELADO')
+
+        ContaPagar.objects.create(fornecedor=cls.fornecedor, descricao='Aluguel', valor=Decimal('500.00'),
+                                  data_vencimento=hoje, status='ABERTO')
+        ContaPagar.objects.create(fornecedor=cls.fornecedor, descricao='Luz', valor=Decimal('80.00'),
+                                  data_vencimento=hoje, status='PAGO', data_pagamento=hoje)
+
+    def setUp(self):
+        # O rollback entre testes não incrementa as versões de dados.
+        cache.backend().clear()
+
+    def test_uma_consulta_por_tabela(self):
+        # Resumos diários (todos os cards e o gráfico) e Venda (top produtos).
+        with self.assertNumQueries(2):
+            compute_dashboard_metrics()
+
+    def test_valores_dos_kpis(self):
+        metrics = compute_dashboard_metrics()
+
+        self.assertEqual(metrics.total_vendas, 3)
+        self.assertEqual(metrics.vendas_concluidas_count, 2)
+        self.assertEqual(metrics.vendas_pendentes_count, 1)
+        self.assertEqual(metrics.receita_faturada, Decimal('55.00'))
+        self.assertEqual(metrics.receita_recebida, Decimal('55.00'))
+        self.assertEqual(metrics.contas_receber_em_aberto_valor, Decimal('55.00'))
+        self.assertEqual(metrics.contas_receber_em_aberto_count, 2)
+        self.assertEqual(metrics.contas_pagar_em_aberto_valor, Decimal('500.00'))
+        self.assertEqual(metrics.contas_pagar_em_aberto_count, 1)
+        self.assertEqual(metrics.chart_data(), {'labels': ['01/2025', '02/2025'], 'data': [30.0, 25.0]})
+        self.assertEqual(metrics.produtos_mais_vendidos[0],
+                         {'produto__nome': 'Filtro de Óleo', 'total_quantidade_vendida': 5})
+
+    def test_banco_vazio(self):
+        Venda.objects.all().delete()
+        ContaReceber.objects.all().delete()
+        ContaPagar.objects.all().delete()
+
+        metrics = compute_dashboard_metrics()
+
+        self.assertEqual(metrics.total_vendas, 0)
+        self.assertEqual(metrics.receita_faturada, Decimal('0.00'))
+        self.assertEqual(metrics.contas_pagar_em_aberto_valor, Decimal('0.00'))
+        self.assertEqual(metrics.chart_data(), {'labels': [], 'data': []})
+
+    def test_api_json(self):
+        user = User.objects.create_user('gestor', password='senha-segura')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('dashboard_api'))
+
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['total_vendas'], 3)
+        self.assertEqual(payload['receita_faturada'], 55.0)
+        self.assertEqual(payload['chart_data']['labels'], ['01/2025', '02/2025'])
+
+    def test_dashboard_html(self):
+        user = User.objects.create_user('gestor', password='senha-segura')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('dashboard'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '01/2025')
+
+
+def resumos_atuais():
+    return sorted(
+        (r.origem, r.dia, r.status, r.forma_pagamento, r.registros, r.valor)
+        for r in ResumoFinanceiroDiario.objects.all()
+    )
+
+
+class ResumoFinanceiroDiarioTests(TestCase):
+    def assertResumosConsistentes(self):
+        incrementais = resumos_atuais()
+        rollups.rebuild()
+        self.assertEqual(incrementais, resumos_atuais())
+
+    def test_ciclo_de_vida_de_venda_e_contas(self):
+        produto = criar_produto()
+        venda = criar_venda(produto, quantidade=2, status='PENDENTE', forma_pagamento='AP', condicao_prazo='7D')
+        conta = ContaReceber.objects.create(venda=venda, descricao='Venda', valor=venda.valor_total,
+                                            data_vencimento=date(2025, 3, 10))
+        self.assertResumosConsistentes()
+
+        venda.status = 'CONCLUIDA'
+        venda.valor_total = Decimal('40.00')
+        venda.save()
+        conta.status = 'RECEBIDO'
+        conta.data_recebimento = date(2025, 3, 12)
+        conta.save()
+        self.assertResumosConsistentes()
+
+        # Mudar a forma de pagamento move também o resumo da conta vinculada.
+        venda.forma_pagamento = 'AV'
+        venda.save()
+        self.assertResumosConsistentes()
+
+        pagar = ContaPagar.objects.create(descricao='Aluguel', valor=Decimal('500.00'),
+                                          data_vencimento=date(2025, 3, 5))
+        pagar.status = 'PAGO'
+        pagar.data_pagamento = date(2025, 3, 6)
+        pagar.save()
+        self.assertResumosConsistentes()
+
+        venda.delete()
+        pagar.delete()
+        self.assertEqual(resumos_atuais(), [])
+
+    def test_metricas_agregadas_do_analista(self):
+        produto = criar_produto(estoque=7)
+        criar_venda(produto, quantidade=3, status='CONCLUIDA')
+        ContaReceber.objects.create(descricao='A', valor=Decimal('12.50'), data_vencimento=date(2025, 5, 1),
+                                    status='ATRASADO')
+
+        metrics = rollups.aggregated_metrics()
+
+        self.assertEqual(metrics['total_vendas_concluidas'], 30.0)
+        self.assertEqual(metrics['quantidade_vendas_concluidas'], 1)
+        self.assertEqual(metrics['total_contas_receber_aberto_atrasado'], 12.5)
+        self.assertEqual(metrics['total_estoque_geral'], 7.0)
+        self.assertEqual(metrics['quantidade_total_produtos_cadastrados'], 1)
+
+    def test_comando_rebuild(self):
+        produto = criar_produto()
+        criar_venda(produto, quantidade=1, status='CONCLUIDA')
+        esperado = resumos_atuais()
+        ResumoFinanceiroDiario.objects.all().delete()
+
+        call_command('rebuild_rollups', stdout=StringIO())
+
+        self.assertEqual(resumos_atuais(), esperado)
+
+
+class MetricasEmCacheTests(TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+        caches_de_teste = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'metricas': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': self.diretorio.name,
+                'TIMEOUT': None,
+            },
+        }
+        configuracao = override_settings(CACHES=caches_de_teste)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        cache.reset_stats()
+        self.produto = criar_produto()
+
+    def test_leituras_repetidas_vem_do_cache(self):
+        primeira = cached_dashboard_metrics()
+        with self.assertNumQueries(0):
+            segunda = cached_dashboard_metrics()
+
+        self.assertEqual(primeira, segunda)
+        self.assertEqual(cache.stats()['dashboard'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_escrita_invalida_o_cache(self):
+        self.assertEqual(cached_dashboard_metrics().total_vendas, 0)
+
+        criar_venda(self.produto, quantidade=1, status='CONCLUIDA')
+
+        self.assertEqual(cached_dashboard_metrics().total_vendas, 1)
+        self.assertEqual(cache.stats()['dashboard']['misses'], 2)
+
+    def test_escrita_em_produto_invalida_metricas_do_analista(self):
+        self.assertEqual(rollups.aggregated_metrics()['total_estoque_geral'], 100.0)
+
+        self.produto.quantidade_estoque = 40
+        self.produto.save()
+
+        self.assertEqual(rollups.aggregated_metrics()['total_estoque_geral'], 40.0)
+
+
+class PaginacaoKeysetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('gestor', password='senha-segura')
+        cls.cliente = Cliente.objects.create(nome='Auto Peças Centro')
+        fornecedor = Fornecedor.objects.create(nome_empresa='Hidráulica Total')
+        produto = criar_produto(estoque=1000)
+        for i in range(7):
+            criar_venda(produto, quantidade=1, status='CONCLUIDA' if i % 2 else 'PENDENTE',
+                        cliente=cls.cliente if i < 3 else None)
+        # Vencimentos repetidos exercitam o desempate pela pk.
+        for i in range(9):
+            ContaPagar.objects.create(fornecedor=fornecedor if i < 4 else None, descricao=f'Conta {i}',
+                                      valor=Decimal('10.00'), data_vencimento=date(2025, 1, 1 + i // 3))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def percorrer(self, url, nome_contexto, **params):
+        vistos = []
+        paginas = []
+        response = self.client.get(url, {'por_pagina': 2, **params})
+        while True:
+            pagina = response.context['pagina']
+            paginas.append([obj.pk for obj in response.context[nome_contexto]])
+            vistos.extend(paginas[-1])
+            if not pagina.tem_proxima:
+                break
+            response = self.client.get(url + pagina.url_proxima)
+        return vistos, paginas, response
+
+    def test_percorre_todas_as_vendas_sem_repetir(self):
+        vistos, paginas, _ = self.percorrer(reverse('lista_vendas'), 'vendas')
+
+        esperado = list(Venda.objects.order_by('-data_venda', '-pk').values_list('pk', flat=True))
+        self.assertEqual(vistos, esperado)
+        self.assertEqual(len(paginas), 4)
+
+    def test_empates_no_vencimento_e_volta_de_pagina(self):
+        vistos, paginas, ultima = self.percorrer(reverse('lista_contas_pagar'), 'contas_pagar', ordem='vencimento')
+
+        esperado = list(ContaPagar.objects.order_by('data_vencimento', 'pk').values_list('pk', flat=True))
+        self.assertEqual(vistos, esperado)
+
+        anterior = self.client.get(reverse('lista_contas_pagar') + ultima.context['pagina'].url_anterior)
+        self.assertEqual([c.pk for c in anterior.context['contas_pagar']], paginas[-2])
+
+    def test_filtros(self):
+        response = self.client.get(reverse('lista_vendas'), {'cliente': self.cliente.pk, 'status': 'PENDENTE'})
+
+        vendas = list(response.context['vendas'])
+        self.assertEqual(len(vendas), 2)
+        self.assertTrue(all(v.cliente_id == self.cliente.pk and v.status == 'PENDENTE' for v in vendas))
+        self.assertContains(response, 'filter-chip')
+
+        response = self.client.get(reverse('lista_contas_pagar'), {'data_inicio': '2025-01-02', 'data_fim': 'abc'})
+        self.assertEqual(len(response.context['contas_pagar']), 6)
+
+        response = self.client.get(reverse('lista_vendas'), {'data_fim': '9999-12-31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('data_fim', response.context['filtros'])
+
+    def test_cursor_invalido_volta_para_primeira_pagina(self):
+        response = self.client.get(reverse('lista_clientes'), {'cursor': 'nao-e-um-cursor'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['pagina'].tem_anterior)
+
+    def test_listagens_respondem(self):
+        for nome in ('lista_produtos', 'lista_fornecedores', 'lista_contas_receber'):
+            self.assertEqual(self.client.get(reverse(nome)).status_code, 200)
+
+
+class ExportacaoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('contador', password='senha-segura')
+        cls.fornecedor = Fornecedor.objects.create(nome_empresa='Borrachas Sul')
+        ContaPagar.objects.create(fornecedor=cls.fornecedor, descricao='Mangueiras, lote 1', valor=Decimal('150.25'),
+                                  data_vencimento=date(2025, 4, 10))
+        ContaPagar.objects.create(descricao='Aluguel', valor=Decimal('900.00'), data_vencimento=date(2025, 4, 5),
+                                  status='PAGO', data_pagamento=date(2025, 4, 5))
+        produto = criar_produto()
+        criar_venda(produto, quantidade=2, status='CONCLUIDA')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_csv_em_streaming_com_filtros(self):
+        response = self.client.get(reverse('exportar_contas_pagar'), {'formato': 'csv', 'status': 'ABERTO'})
+
+        self.assertTrue(response.streaming)
+        conteudo = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(conteudo[0], 'ID,Descrição,Fornecedor,Valor,Lançamento,Vencimento,Pagamento,Status')
+        self.assertEqual(len(conteudo), 2)
+        self.assertIn('"Mangueiras, lote 1",Borrachas Sul,150.25', conteudo[1])
+        self.assertTrue(conteudo[1].endswith(',2025-04-10,,Aberto'))
+
+    def test_xlsx_valido(self):
+        response = self.client.get(reverse('exportar_vendas'), {'formato': 'xlsx'})
+
+        self.assertTrue(response.streaming)
+        arquivo = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(arquivo.testzip())
+        planilha = arquivo.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('Filtro de Óleo', planilha)
+        self.assertEqual(planilha.count('<row>'), 2)
+        self.assertIn('attachment; filename="vendas_', response['Content-Disposition'])
+
+    def test_contas_receber_csv_vazio(self):
+        response = self.client.get(reverse('exportar_contas_receber'))
+
+        conteudo = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(conteudo), 1)
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('vendedor', password='senha-segura')
+        cls.fornecedor = Fornecedor.objects.create(nome_empresa='Filtros Brasil', contato_nome='Ana')
+        cls.filtro_oleo = criar_produto('Filtro de Óleo', preco=Decimal('25.50'), estoque=7)
+        cls.filtro_ar = criar_produto('filtro de ar', preco=Decimal('40.00'), estoque=3)
+        criar_produto('Pastilha de Freio')
+        for indice in range(15):
+            criar_produto(f'Filtro de Combustível {indice:02d}')
+        cls.cliente = Cliente.objects.create(nome='Oficina Central', email='oficina@example.com')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def buscar(self, fonte, **params):
+        response = self.client.get(reverse('autocomplete', kwargs={'fonte': fonte}), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['resultados']
+
+    def test_prefixo_sem_diferenciar_maiusculas(self):
+        resultados = self.buscar('produtos', q='FILTRO DE', limite=2)
+
+        self.assertEqual([item['texto'] for item in resultados], ['filtro de ar', 'Filtro de Combustível 00'])
+        self.assertEqual(resultados[0], {
+            'id': self.filtro_ar.pk, 'texto': 'filtro de ar', 'preco_venda': 40.0, 'quantidade_estoque': 3,
+        })
+
+    def test_prefixo_sem_diferenciar_acentos(self):
+        agua = criar_produto('Água Mineral')
+        erica = Cliente.objects.create(nome='Érica Souza')
+
+        for termo in ('á', 'Á', 'agua', 'ÁGUA MIN'):
+            self.assertEqual([item['id'] for item in self.buscar('produtos', q=termo)], [agua.pk], termo)
+        self.assertEqual([item['texto'] for item in self.buscar('clientes', q='eri')], ['Érica Souza'])
+        self.assertEqual([item['id'] for item in self.buscar('clientes', q='É')], [erica.pk])
+        # A chave acompanha o nome, inclusive num save com update_fields.
+        erica.nome = 'Élida Souza'
+        erica.save(update_fields=['nome'])
+        self.assertEqual(self.buscar('clientes', q='eri'), [])
+        self.assertEqual([item['id'] for item in self.buscar('clientes', q='éli')], [erica.pk])
+
+    def test_dados_de_exemplo_e_benchmarks_tem_chave(self):
+        call_command('loaddata', 'vendas', verbosity=0)
+        self.assertTrue(autocomplete.buscar(autocomplete.FONTES['produtos'], 'mang'))
+        self.assertFalse(Fornecedor.objects.filter(chave_busca='').exists())
+        benchmarks._cadastros(2, 2)
+        self.assertEqual(len(autocomplete.buscar(autocomplete.FONTES['clientes'], 'cliente bench')), 2)
+
+    def test_limite(self):
+        self.assertEqual(len(self.buscar('produtos', q='filtro')), 10)
+        self.assertEqual(len(self.buscar('produtos', q='filtro', limite=500)), 17)
+        self.assertEqual(self.buscar('produtos', q='correia'), [])
+
+    def test_clientes_e_fornecedores(self):
+        self.assertEqual(self.buscar('clientes', q='ofi')[0]['email'], 'oficina@example.com')
+        self.assertEqual(self.buscar('fornecedores', q='filtros')[0]['contato_nome'], 'Ana')
+
+    def test_fonte_desconhecida(self):
+        response = self.client.get(reverse('autocomplete', kwargs={'fonte': 'usuarios'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_formulario_de_venda_nao_lista_produtos(self):
+        venda = criar_venda(self.filtro_oleo, cliente=self.cliente, quantidade=1)
+
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('venda_editar', kwargs={'pk': venda.pk}))
+
+        self.assertNotContains(response, 'Pastilha de Freio')
+        self.assertContains(response, 'value="Filtro de Óleo"')
+        self.assertContains(response, reverse('autocomplete', kwargs={'fonte': 'produtos'}))
+
+    def test_linha_em_branco_nao_e_obrigatoria(self):
+        self.assertIn(' required>', str(VendaItemForm()['produto']))
+
+        html = self.client.get(reverse('venda_nova')).content.decode()
+
+        self.assertIn('id="id_itens-0-produto_busca"', html)
+        self.assertNotRegex(html, r'id="id_itens-(0|__prefix__)-produto_busca"[^>]* required>')
+
+    def test_formulario_de_venda_salva_pelo_id(self):
+        response = self.client.post(reverse('venda_nova'), dados_venda(
+            [(self.filtro_ar, 2)], cliente=self.cliente.pk, status='PENDENTE'
+        ))
+
+        self.assertRedirects(response, reverse('lista_vendas'))
+        self.filtro_ar.refresh_from_db()
+        self.assertEqual(self.filtro_ar.quantidade_estoque, 1)
+
+
+class BuscaTextualTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('gerente', password='senha-segura')
+        cls.fornecedor = Fornecedor.objects.create(nome_empresa='Distribuidora Freios Minas', contato_nome='Márcia')
+        cls.pastilha = criar_produto('Pastilha de Freio', descricao='Jogo dianteiro cerâmico', fornecedor=cls.fornecedor)
+        cls.disco = criar_produto('Disco Ventilado', descricao='Compatível com pastilha cerâmica')
+        criar_produto('Filtro de Óleo')
+        cls.cliente = Cliente.objects.create(nome='João Mecânico', email='joao@oficinafreios.com.br',
+                                             endereco='Rua das Pastilhas, 10')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_ranking_entre_tabelas(self):
+        resultados = search.buscar('pastilha')
+
+        self.assertEqual((resultados[0]['tipo'], resultados[0]['id']), ('produtos', self.pastilha.pk))
+        self.assertCountEqual([(item['tipo'], item['id']) for item in resultados[1:]],
+                              [('produtos', self.disco.pk), ('clientes', self.cliente.pk)])
+        self.assertEqual([item['rank'] for item in resultados], sorted(item['rank'] for item in resultados))
+
+    def test_prefixo_acentos_e_email(self):
+        self.assertEqual(search.buscar('ceram', tipos=['produtos'])[0]['id'], self.pastilha.pk)
+        self.assertEqual(search.buscar('marcia')[0]['id'], self.fornecedor.pk)
+        self.assertEqual(search.buscar('oficinafreios')[0]['tipo'], 'clientes')
+        self.assertEqual(search.buscar('OR "pastilha'), [])
+
+    def test_gatilhos_mantem_indice(self):
+        self.pastilha.nome = 'Lona de Freio'
+        self.pastilha.save()
+        Produto.objects.filter(pk=self.disco.pk).update(quantidade_estoque=1)
+        self.cliente.delete()
+
+        self.assertEqual([item['id'] for item in search.buscar('lona')], [self.pastilha.pk])
+        self.assertEqual([item['tipo'] for item in search.buscar('joao')], [])
+        self.assertEqual([item['id'] for item in search.buscar('disco')], [self.disco.pk])
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('busca_api'), {'q': 'freio', 'tipo': 'fornecedores'})
+
+        self.assertEqual(response.json()['resultados'][0], {
+            'tipo': 'fornecedores', 'id': self.fornecedor.pk, 'texto': 'Distribuidora Freios Minas',
+            'detalhe': 'Márcia', 'url': reverse('fornecedor_editar', kwargs={'pk': self.fornecedor.pk}),
+            'rank': response.json()['resultados'][0]['rank'],
+        })
+        self.assertEqual(self.client.get(reverse('busca_api'), {'q': '  '}).json(), {'resultados': []})
+
+    def test_busca_do_admin(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+
+        response = self.client.get(reverse('admin:core_produto_changelist'), {'q': 'minas'})
+
+        self.assertContains(response, 'Pastilha de Freio')
+        self.assertNotContains(response, 'Filtro de Óleo')
+
+    def test_comando_rebuild(self):
+        saida = StringIO()
+        call_command('rebuild_search_index', stdout=saida)
+        self.assertIn('produtos', saida.getvalue())
+        self.assertEqual(len(search.buscar('pastilha')), 3)
+
+
+class EstoqueEVendaTests(TestCase):
+    def setUp(self):
+        cache.backend().clear()
+        self.user = User.objects.create_user('caixa', password='senha-segura')
+        self.client.force_login(self.user)
+        self.produto = criar_produto(estoque=10)
+        self.outro = criar_produto('Correia Dentada', preco=Decimal('80.00'), estoque=2)
+
+    def vender(self, linhas=None, venda=None, **campos):
+        url = reverse('venda_editar', kwargs={'pk': venda.pk}) if venda else reverse('venda_nova')
+        return self.client.post(url, dados_venda(linhas or [(self.produto, 1)], venda, **campos))
+
+    def estoque(self, produto):
+        produto.refresh_from_db()
+        return produto.quantidade_estoque
+
+    def test_venda_a_prazo_reserva_estoque_e_cria_conta(self):
+        self.vender([(self.produto, 4)], forma_pagamento='AP', condicao_prazo='14D')
+
+        venda = Venda.objects.get()
+        conta = ContaReceber.objects.get(venda=venda)
+        self.assertEqual(self.estoque(self.produto), 6)
+        self.assertEqual(conta.valor, Decimal('40.00'))
+        self.assertEqual((conta.status, conta.data_vencimento), ('ABERTO', timezone.localdate() + timedelta(days=14)))
+
+    def test_pedido_com_varios_itens(self):
+        self.vender([(self.produto, 3), (self.outro, 2)])
+
+        venda = Venda.objects.get()
+        self.assertEqual(venda.valor_total, Decimal('190.00'))
+        self.assertEqual(list(venda.itens.values_list('produto__nome', 'quantidade', 'valor_total')), [
+            ('Filtro de Óleo', 3, Decimal('30.00')), ('Correia Dentada', 2, Decimal('160.00')),
+        ])
+        self.assertEqual((self.estoque(self.produto), self.estoque(self.outro)), (7, 0))
+        conta = ContaReceber.objects.get()
+        self.assertEqual((conta.valor, conta.descricao), (Decimal('190.00'), f'Recebimento de Venda #{venda.pk} - 2 itens'))
+
+    def test_gravacao_nao_cresce_com_o_tamanho_do_pedido(self):
+        produtos = [criar_produto(f'Peça {indice}') for indice in range(20)]
+        # Primeira venda do dia cria as linhas de resumo; as seguintes só as atualizam.
+        sales.salvar_venda(Venda(status='CONCLUIDA'), [(self.produto, 1)])
+        with CaptureQueriesContext(connection) as um_item:
+            sales.salvar_venda(Venda(status='CONCLUIDA'), [(produtos[0], 1)])
+        with CaptureQueriesContext(connection) as vinte_itens:
+            sales.salvar_venda(Venda(status='CONCLUIDA'), [(produto, 2) for produto in produtos])
+
+        self.assertEqual(len(vinte_itens), len(um_item))
+        self.assertEqual(VendaItem.objects.count(), 22)
+
+    def test_estoque_insuficiente_nao_grava_nada(self):
+        response = self.vender([(self.produto, 5), (self.outro, 3)])
+
+        self.assertContains(response, 'Estoque insuficiente para Correia Dentada. Apenas 2 unidades disponíveis.')
+        self.assertEqual((self.estoque(self.produto), self.estoque(self.outro)), (10, 2))
+        self.assertFalse(Venda.objects.exists())
+        self.assertFalse(ContaReceber.objects.exists())
+
+    def test_edicao_troca_de_produto_e_volta_para_pendente(self):
+        self.vender([(self.produto, 3)])
+        venda = Venda.objects.get()
+        Produto.objects.filter(pk=self.produto.pk).update(preco_venda=Decimal('99.00'))
+
+        self.vender([(self.outro, 2)], venda, status='PENDENTE')
+
+        self.assertEqual((self.estoque(self.produto), self.estoque(self.outro)), (10, 0))
+        self.assertFalse(ContaReceber.objects.exists())
+        self.assertContains(self.vender([(self.outro, 3)], venda), 'Apenas 0 unidades')
+        self.assertEqual(Venda.objects.get().quantidade_total, 2)
+
+        # Itens mantidos na edição conservam o preço da venda original.
+        self.vender([(self.outro, 1), (self.produto, 1)], venda)
+        self.assertEqual(Venda.objects.get().valor_total, Decimal('179.00'))
+        self.vender([(self.outro, 2), (self.produto, 1)], venda)
+        self.assertEqual(Venda.objects.get().valor_total, Decimal('259.00'))
+        self.assertEqual((self.estoque(self.produto), self.estoque(self.outro)), (9, 0))
+
+    def test_exclusao_devolve_estoque(self):
+        self.vender([(self.produto, 5), (self.outro, 1)])
+        venda = Venda.objects.get()
+
+        self.client.post(reverse('venda_deletar', kwargs={'pk': venda.pk}))
+
+        self.assertEqual((self.estoque(self.produto), self.estoque(self.outro)), (10, 2))
+        self.assertFalse(VendaItem.objects.exists())
+        self.assertFalse(ContaReceber.objects.exists())
+        self.assertEqual(resumos_atuais(), [])
+
+    def test_reserva_invalida_metricas_em_cache(self):
+        antes = rollups.aggregated_metrics()['total_estoque_geral']
+        stock.reservar(self.produto.pk, 4)
+        self.assertEqual(rollups.aggregated_metrics()['total_estoque_geral'], antes - 4)
+
+
+class ImportacaoVendasTests(TestCase):
+    def setUp(self):
+        cache.backend().clear()
+        self.produto = criar_produto(estoque=10)
+        self.outro = criar_produto('Correia Dentada', preco=Decimal('80.00'), estoque=3)
+        self.cliente = Cliente.objects.create(nome='Oficina Central')
+
+    def csv(self, *linhas):
+        cabecalho = 'pedido,produto_id,quantidade,cliente_id,status,forma_pagamento,condicao_prazo,data_venda'
+        return io.BytesIO('\n'.join((cabecalho,) + linhas).encode())
+
+    def estoque(self, produto):
+        produto.refresh_from_db()
+        return produto.quantidade_estoque
+
+    def test_importa_pedidos_com_estoque_e_contas(self):
+        p, o, c = self.produto.pk, self.outro.pk, self.cliente.pk
+        relatorio = imports.importar_arquivo(self.csv(
+            f'A1,{p},2,{c},CONCLUIDA,AV,,2025-03-10',
+            f'A1,{o},1,{c},CONCLUIDA,AV,,2025-03-10',
+            f',{p},3,,CONCLUIDA,AP,14D,2025-03-11',
+            f',{o},1,,PENDENTE,AV,,',
+        ))
+
+        self.assertEqual(relatorio.erros, [])
+        self.assertEqual((relatorio.linhas, relatorio.vendas, relatorio.itens, relatorio.contas_receber), (4, 3, 4, 2))
+        self.assertEqual((self.estoque(self.produto), self.estoque(self.outro)), (5, 1))
+
+        pedido = Venda.objects.get(cliente=self.cliente)
+        self.assertEqual(pedido.valor_total, Decimal('100.00'))
+        self.assertEqual(timezone.localdate(pedido.data_venda), date(2025, 3, 10))
+        self.assertEqual(pedido.itens.count(), 2)
+        self.assertEqual(
+            sorted(ContaReceber.objects.values_list('valor', 'status', 'data_vencimento', 'data_recebimento')),
+            [(Decimal('30.00'), 'ABERTO', date(2025, 3, 25), None),
+             (Decimal('100.00'), 'RECEBIDO', date(2025, 3, 10), date(2025, 3, 10))],
+        )
+
+        incrementais = resumos_atuais()
+        rollups.rebuild()
+        self.assertEqual(incrementais, resumos_atuais())
+
+    def test_relatorio_de_erros_por_linha(self):
+        p, o = self.produto.pk, self.outro.pk
+        relatorio = imports.importar_arquivo(self.csv(
+            f'B1,{p},1,,CONCLUIDA,AV,,',
+            f'B1,{o},zero,,CONCLUIDA,AV,,',
+            f',999,1,,CONCLUIDA,AV,,',
+            f',{p},1,,CONCLUIDA,AP,,',
+            f',{o},2,,CONCLUIDA,AV,,',
+            f',{o},2,,CONCLUIDA,AV,,',
+            f',{p},1,424242,CONCLUIDA,AV,,',
+        ))
+
+        erros = {erro['linha']: erro['erro'] for erro in relatorio.erros}
+        self.assertEqual(sorted(erros), [2, 3, 4, 5, 7, 8])
+        self.assertIn('recusado', erros[2])
+        self.assertIn("'quantidade'", erros[3])
+        self.assertIn('Produto 999', erros[4])
+        self.assertIn('condicao_prazo', erros[5])
+        # O estoque é reservado na ordem do arquivo: a segunda venda de 2 correias já não cabe.
+        self.assertEqual(erros[7], 'Estoque insuficiente para Correia Dentada. Apenas 1 unidades disponíveis.')
+        self.assertIn('Cliente 424242', erros[8])
+        self.assertEqual((relatorio.vendas, self.estoque(self.produto), self.estoque(self.outro)), (1, 10, 1))
+
+    def test_jsonl_e_lotes_com_consultas_constantes(self):
+        def jsonl(quantidade):
+            linhas = [json.dumps({'pedido': f'J{i // 2}', 'produto_id': self.produto.pk, 'quantidade': 1})
+                      for i in range(quantidade)]
+            return io.BytesIO(('\n'.join(linhas) + '\n\n{quebrado\n').encode())
+
+        Produto.objects.filter(pk=self.produto.pk).update(quantidade_estoque=100)
+        relatorio = imports.importar_arquivo(jsonl(2), 'jsonl')
+        # A primeira importação do dia cria as linhas de resumo; as seguintes só as atualizam.
+        with CaptureQueriesContext(connection) as poucas:
+            imports.importar_arquivo(jsonl(2), 'jsonl')
+        with CaptureQueriesContext(connection) as muitas:
+            imports.importar_arquivo(jsonl(8), 'jsonl')
+
+        self.assertEqual(relatorio.erros, [{'linha': 4, 'erro': 'Linha não é um objeto JSON válido.'}])
+        self.assertEqual(len(poucas), len(muitas))
+        self.assertEqual(Venda.objects.count(), 1 + 1 + 4)
+        # Itens repetidos no mesmo pedido viram um item só.
+        self.assertEqual(set(VendaItem.objects.values_list('quantidade', flat=True)), {2})
+
+        imports.importar_arquivo(jsonl(6), 'jsonl', tamanho_lote=2)
+        self.assertEqual(Venda.objects.count(), 6 + 3)
+
+    def test_endpoint_e_comando(self):
+        self.client.force_login(User.objects.create_user('gerente', password='senha-segura'))
+        url = reverse('importar_vendas_api')
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url).status_code, 400)
+
+        arquivo = SimpleUploadedFile('vendas.csv', self.csv(f',{self.produto.pk},2,,CONCLUIDA,AV,,').getvalue())
+        resposta = self.client.post(url, {'arquivo': arquivo}).json()
+        self.assertEqual((resposta['status'], resposta['vendas_criadas'], resposta['erros']), ('success', 1, []))
+
+        with tempfile.NamedTemporaryFile(suffix='.jsonl') as arquivo:
+            arquivo.write(json.dumps({'produto_id': self.outro.pk, 'quantidade': 9}).encode())
+            arquivo.flush()
+            saida, erros = StringIO(), StringIO()
+            call_command('import_sales', arquivo.name, stdout=saida, stderr=erros)
+        self.assertIn('0 vendas', saida.getvalue())
+        self.assertIn('Linha 1: Estoque insuficiente', erros.getvalue())
+
+    def test_benchmark_de_importacao(self):
+        resultado = benchmarks.importacao(linhas=30, produtos=5, clientes=2, comparar=6)
+
+        self.assertEqual((resultado['linhas'], resultado['erros']), (30, 0))
+        self.assertGreater(resultado['linhas_por_segundo'], 0)
+        self.assertIn('linhas_por_segundo_venda_a_venda', resultado)
+
+
+class DataFramesTests(TestCase):
+    def setUp(self):
+        self.produto = criar_produto()
+        self.outro = criar_produto('Correia Dentada', preco=Decimal('80.00'))
+        self.cliente = Cliente.objects.create(nome='Oficina Central')
+        self.venda = sales.salvar_venda(
+            Venda(cliente=self.cliente, status='CONCLUIDA', forma_pagamento='AP', condicao_prazo='28D'),
+            [(self.produto, 2), (self.outro, 1)],
+        )
+        criar_venda(self.produto, status='PENDENTE')
+        ContaPagar.objects.create(descricao='Aluguel', valor=Decimal('500.00'), data_vencimento=date(2025, 3, 5))
+
+    def test_tabelas_tipadas(self):
+        tabelas = dataframes.tabelas()
+
+        vendas = tabelas['Venda']
+        self.assertEqual(str(vendas['status_venda_code'].dtype), 'category')
+        self.assertEqual(str(vendas['data_transacao'].dtype), 'datetime64[ns]')
+        linha = vendas.set_index('id_origem').loc[self.venda.pk]
+        self.assertEqual(linha['produto_nome'], 'Filtro de Óleo, Correia Dentada')
+        self.assertEqual((linha['quantidade_vendida'], linha['valor_total_venda']), (3, 100.0))
+        self.assertEqual((linha['cliente_nome'], linha['forma_pagamento'], linha['condicao_prazo']),
+                         ('Oficina Central', 'A Prazo', '28 Dias'))
+        self.assertEqual(linha['data_transacao'].date(), timezone.localdate(self.venda.data_venda))
+
+        contas = tabelas['ContaReceber']
+        self.assertEqual(contas['status_conta_receber'].tolist(), ['ABERTO'])
+        self.assertEqual(contas['data_vencimento_receber'].dt.date.tolist(), [timezone.localdate() + timedelta(days=28)])
+        self.assertEqual(tabelas['ContaPagar']['status_conta_pagar_display'].tolist(), ['Aberto'])
+        self.assertEqual(sorted(tabelas['Produto']['preco_venda_unitario']), [10.0, 80.0])
+
+    def test_visao_combinada(self):
+        df = dataframes.combinado()
+
+        self.assertEqual(list(df.columns), dataframes.COLUNAS)
+        self.assertEqual(df['tipo_registro'].value_counts().to_dict(),
+                         {'Venda': 2, 'ContaReceber': 1, 'ContaPagar': 1, 'Produto': 2})
+        conta = df[df['tipo_registro'] == 'ContaReceber'].iloc[0]
+        self.assertEqual((conta['produto_nome'], conta['status_venda_code'], conta['valor_conta_receber']),
+                         ('Filtro de Óleo, Correia Dentada', 'CONCLUIDA', 100.0))
+        self.assertEqual(df.loc[df['tipo_registro'] == 'ContaPagar', 'quantidade_vendida'].tolist(), [0])
+
+        # Com limite só as primeiras linhas são lidas: vendas e itens, contas e as vendas (e itens) de origem.
+        with CaptureQueriesContext(connection) as consultas:
+            amostra = dataframes.combinado(limite=3)
+        self.assertEqual(amostra['tipo_registro'].tolist(), ['Venda', 'Venda', 'ContaReceber'])
+        self.assertEqual(len(consultas), 5)
+        self.assertEqual(str(amostra['data_vencimento_pagar'].dtype), 'datetime64[ns]')
+
+    def test_sem_vendas_de_origem(self):
+        VendaItem.objects.all().delete()
+        Venda.objects.all().delete()
+        ContaReceber.objects.create(descricao='Serviço avulso', valor=Decimal('40.00'), data_vencimento=date(2025, 3, 5))
+
+        df = dataframes.combinado()
+        conta = df[df['tipo_registro'] == 'ContaReceber'].iloc[0]
+        self.assertEqual((conta['produto_nome'], conta['cliente_nome'], conta['valor_conta_receber']),
+                         ('N/A', 'Consumidor Final', 40.0))
+
+    def test_benchmark_de_dataframe(self):
+        resultado = benchmarks.dataframe(linhas=30)
+        self.assertEqual(resultado['vendas'], 30)
+        self.assertGreater(resultado['combinado_pico_mib'], 0)
+
+
+class SnapshotsTests(TestCase):
+    def setUp(self):
+        cache.backend().clear()
+        snapshots.padrao().limpar()
+        self.produto = criar_produto()
+        self.venda = criar_venda(self.produto, status='CONCLUIDA')
+
+    def test_pergunta_seguinte_nao_consulta_o_banco(self):
+        primeiro = snapshots.atual()
+        self.assertEqual(primeiro.frames['amostra']['tipo_registro'].tolist(), ['Venda', 'Produto'])
+        self.assertEqual(primeiro.metricas['quantidade_vendas_concluidas'], 1)
+
+        with self.assertNumQueries(0):
+            segundo = snapshots.atual()
+        self.assertIs(segundo, primeiro)
+        self.assertEqual(snapshots.padrao().stats()['memoria'], 1)
+
+    def test_escrita_gera_nova_versao(self):
+        primeiro = snapshots.atual()
+
+        Cliente.objects.create(nome='Auto Peças Sul')
+        self.assertIsNot(snapshots.atual(), primeiro)
+
+        criar_venda(self.produto, status='PENDENTE')
+        snapshot = snapshots.atual()
+        self.assertEqual(snapshot.metricas['quantidade_vendas_pendentes'], 1)
+        self.assertEqual((snapshot.frames['amostra']['tipo_registro'] == 'Venda').sum(), 2)
+
+    def test_lru_por_entradas_e_por_tamanho(self):
+        def construtor(versao):
+            return snapshots.Snapshot(versao=versao, frames={}, metricas={}, tamanho=40)
+
+        lru = snapshots.CacheDeSnapshots(maximo_entradas=2, maximo_bytes=100)
+        for versao in ['a', 'b', 'a', 'c']:
+            lru.obter(versao, construtor)
+        self.assertEqual(list(lru._entradas), ['a', 'c'])
+
+        lru.obter('d', lambda versao: snapshots.Snapshot(versao=versao, frames={}, metricas={}, tamanho=90))
+        self.assertEqual(list(lru._entradas), ['d'])
+        lru.obter('e', lambda versao: snapshots.Snapshot(versao=versao, frames={}, metricas={}, tamanho=500))
+        self.assertEqual(list(lru._entradas), ['d'])
+        self.assertEqual(lru.stats()['construidos'], 5)
+        self.assertEqual(lru.stats()['despejados'], 3)
+
+    @unittest.skipUnless(snapshots.parquet_disponivel(), 'pyarrow/fastparquet não instalado')
+    def test_snapshot_persistido_em_parquet(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            armazem = snapshots.ArmazemParquet(diretorio, maximo_entradas=1)
+            original = snapshots.CacheDeSnapshots(armazem=armazem).obter()
+
+            # Outro processo, com a memória vazia, lê do disco.
+            outro = snapshots.CacheDeSnapshots(armazem=armazem)
+            with self.assertNumQueries(0):
+                lido = outro.obter(original.versao)
+            self.assertEqual(outro.stats()['disco'], 1)
+            self.assertEqual(lido.metricas, original.metricas)
+            self.assertEqual(lido.frames['amostra']['produto_nome'].tolist(),
+                             original.frames['amostra']['produto_nome'].tolist())
+
+
+class MotorAnaliticoTests(TestCase):
+    def setUp(self):
+        cache.backend().clear()
+        self.produto = criar_produto()
+        self.outro = criar_produto('Correia Dentada', preco=Decimal('80.00'))
+        self.cliente = Cliente.objects.create(nome='Oficina Central')
+        criar_venda(self.produto, 3, status='CONCLUIDA', cliente=self.cliente)
+        criar_venda(self.outro, 1, status='PENDENTE')
+        ContaReceber.objects.create(descricao='Serviço', valor=Decimal('30.00'), data_vencimento=date(2025, 2, 1),
+                                    data_recebimento=date(2025, 2, 10), status='RECEBIDO')
+        ContaReceber.objects.create(cliente=self.cliente, descricao='Revisão', valor=Decimal('50.00'),
+                                    data_vencimento=date(2025, 1, 1))
+        ContaPagar.objects.create(descricao='Aluguel', valor=Decimal('100.00'), data_vencimento=date(2024, 12, 1),
+                                  status='ATRASADO')
+        ContaPagar.objects.create(descricao='Energia', valor=Decimal('70.00'), data_vencimento=date(2025, 4, 1))
+
+    def test_consultas_conferem_com_os_resumos(self):
+        with analytics.conectar() as motor:
+            self.assertEqual(motor.fonte, 'banco')
+            totais = motor.totais_por_status().set_index(['origem', 'status'])
+            mensal = motor.receita_mensal()
+            ranking = motor.produtos_mais_vendidos(limite=5)
+
+        resumos = rollups.monthly_totals()
+        for (origem, status), linha in totais.iterrows():
+            self.assertEqual((linha['registros'], linha['valor']),
+                             tuple(map(float, rollups.somar(resumos, origem, status))))
+        dashboard = compute_dashboard_metrics()
+        self.assertEqual(list(zip(mensal['mes'].dt.date, mensal['valor'])),
+                         [(mes, float(valor)) for mes, valor in dashboard.receita_por_mes])
+        self.assertEqual(
+            ranking[['produto_nome', 'quantidade']].to_dict('records'),
+            [{'produto_nome': item['produto__nome'], 'quantidade': item['total_quantidade_vendida']}
+             for item in dashboard.produtos_mais_vendidos],
+        )
+
+    def test_contas_vencidas(self):
+        with analytics.conectar() as motor:
+            vencidas = motor.contas_vencidas(hoje=date(2025, 3, 1))
+            faixas = motor.vencidas_por_faixa(hoje=date(2025, 3, 1))
+
+        self.assertEqual(vencidas[['origem', 'nome', 'valor', 'dias_em_atraso']].values.tolist(),
+                         [['PAGAR', 'N/A', 100.0, 90], ['RECEBER', 'Oficina Central', 50.0, 59]])
+        self.assertEqual(faixas[['origem', 'faixa']].values.tolist(), [['PAGAR', '61-90'], ['RECEBER', '31-60']])
+
+    def test_exportacao_parquet(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            with analytics.conectar() as motor:
+                esperado = motor.totais_por_status()
+                motor.exportar(diretorio)
+            with analytics.conectar(diretorio=diretorio) as motor:
+                self.assertEqual(motor.fonte, 'parquet')
+                self.assertTrue(motor.totais_por_status().equals(esperado))
+                self.assertEqual(motor.produtos_mais_vendidos(limite=1)['produto_nome'].tolist(), ['Filtro de Óleo'])
+
+            saida = StringIO()
+            call_command('analytics_report', parquet=diretorio, stdout=saida)
+            self.assertIn('Fonte: parquet', saida.getvalue())
+            self.assertIn('Correia Dentada', saida.getvalue())
+
+    def test_fonte_indisponivel(self):
+        # O banco de teste fica em memória: não há arquivo para anexar.
+        with self.assertRaises(analytics.FonteIndisponivel):
+            analytics.conectar('sqlite')
+        with tempfile.TemporaryDirectory() as diretorio, self.assertRaises(analytics.FonteIndisponivel):
+            analytics.conectar('parquet', diretorio)
+
+    def test_benchmark_analitico(self):
+        resultado = benchmarks.analitico(linhas=30)
+        self.assertIn('parquet_totais_por_status_segundos', resultado)
+
+
+def resposta_final(texto='Pronto.', **dados):
+    return json.dumps({'resposta_final': texto, 'diagnostico': '', 'plano_de_acao': '', 'dados_analisados': dados})
+
+
+@override_settings(ANALYST_THREADS=0)
+class AnalistaTests(TestCase):
+    def setUp(self):
+        cache.backend().clear()
+        snapshots.padrao().limpar()
+        answers.padrao().limpar()
+        self.produto = criar_produto()
+        self.cliente = Cliente.objects.create(nome='Oficina Central')
+        criar_venda(self.produto, 4, status='CONCLUIDA', cliente=self.cliente)
+
+    def perguntar(self, modelo, **dados):
+        with mock.patch.object(views, 'model', modelo):
+            return self.client.post(reverse('ask_api'), json.dumps({
+                'question': 'Quais produtos mais venderam?', 'session_id': 'sessao-1', **dados,
+            }), content_type='application/json')
+
+    def test_modo_ferramentas(self):
+        def responder_com_resultado(texto):
+            resultado = analyst.extrair_json(texto)['resultados'][0]['resultado']
+            return resposta_final(f"{resultado[0]['produto']}: {resultado[0]['quantidade']} unidades")
+
+        modelo = analyst.ModeloRoteirizado([
+            '```json\n{"chamadas": [{"ferramenta": "vendas_por_produto", "argumentos": {"limite": 3}}]}\n```',
+            responder_com_resultado,
+        ])
+        resposta = self.perguntar(modelo, modo='ferramentas')
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['answer'], 'Filtro de Óleo: 4 unidades')
+        metricas = resposta.json()['metricas']
+        self.assertEqual((metricas['modo'], metricas['rodadas'], metricas['chamadas_ferramenta']), ('ferramentas', 2, 1))
+        # Nenhuma linha do banco vai no primeiro prompt, só o catálogo de ferramentas.
+        self.assertIn('vendas_por_produto', modelo.enviadas[0])
+        self.assertNotIn('Oficina Central', modelo.enviadas[0])
+        self.assertEqual(metricas['caracteres_prompt'], sum(len(texto) for texto in modelo.enviadas))
+        self.assertTrue(ChatMessage.objects.filter(session_id='sessao-1', role='assistant').exists())
+
+    def test_modo_prompt_manda_amostra(self):
+        modelo = analyst.ModeloRoteirizado([resposta_final()])
+        resposta = self.perguntar(modelo, modo='prompt')
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('Oficina Central', modelo.enviadas[0])
+        self.assertEqual(resposta.json()['metricas']['rodadas'], 1)
+
+        ferramentas = analyst.ModeloRoteirizado([resposta_final()])
+        self.perguntar(ferramentas, modo='ferramentas')
+        self.assertLess(len(ferramentas.enviadas[0]), len(modelo.enviadas[0]))
+
+    def test_modo_invalido(self):
+        resposta = self.perguntar(analyst.ModeloRoteirizado([]), modo='sql')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_ferramentas_validam_argumentos(self):
+        self.assertIn('erro', analyst.executar({'ferramenta': 'apagar_tudo'}))
+        self.assertIn('erro', analyst.executar({'ferramenta': 'vendas_por_periodo', 'argumentos': {'inicio': 'ontem'}}))
+        self.assertIn('erro', analyst.executar({'ferramenta': 'vendas_por_periodo', 'argumentos': {'inicio': '2024-02-30'}}))
+        self.assertIn('erro', analyst.executar({'ferramenta': 'contas_por_status', 'argumentos': {'tipo': 'caixa'}}))
+
+        hoje = timezone.localdate().isoformat()
+        resultado = analyst.executar({'ferramenta': 'vendas_por_cliente', 'argumentos': {'inicio': hoje, 'limite': 999}})
+        self.assertEqual(resultado['resultado'], [{'cliente': 'Oficina Central', 'vendas': 1, 'valor': 40.0}])
+        periodo = analyst.executar({'ferramenta': 'vendas_por_periodo', 'argumentos': {'agrupamento': 'dia'}})
+        self.assertEqual(periodo['resultado'][0]['periodo'], hoje)
+
+    def test_limite_de_rodadas(self):
+        chamada = json.dumps({'ferramenta': 'contas_por_status', 'argumentos': {}})
+        modelo = analyst.ModeloRoteirizado([chamada] * analyst.MAXIMO_RODADAS + [resposta_final()])
+
+        texto, medicao = analyst.responder(modelo.start_chat(), 'Pergunta', analyst.MODO_FERRAMENTAS)
+
+        self.assertEqual(analyst.extrair_json(texto)['resposta_final'], 'Pronto.')
+        self.assertEqual((medicao.rodadas, medicao.chamadas_ferramenta), (analyst.MAXIMO_RODADAS + 1, 3))
+        self.assertIn('Limite de ferramentas', modelo.enviadas[-1])
+
+    def test_campo_parcial(self):
+        texto = '```json\n' + json.dumps({'diagnostico': 'x', 'resposta_final': 'Olá "mundo"\nfim'})
+        finais = [analyst.campo_parcial(texto[:fim], 'resposta_final') for fim in range(len(texto) + 1)]
+
+        self.assertIsNone(finais[texto.index('resposta_final')])
+        self.assertEqual(finais[-1], 'Olá "mundo"\nfim')
+        # Cada prefixo decodificado é prefixo do valor final, mesmo com escapes pela metade.
+        self.assertTrue(all('Olá "mundo"\nfim'.startswith(parcial) for parcial in finais if parcial is not None))
+
+    def test_benchmark_do_analista(self):
+        resultado = benchmarks.analista(linhas=30)
+        self.assertGreater(resultado['prompt_caracteres_prompt'], resultado['ferramentas_caracteres_prompt'])
+
+
+class CacheDeRespostasTests(TestCase):
+    def setUp(self):
+        cache.backend().clear()
+        snapshots.padrao().limpar()
+        answers.padrao().limpar()
+        self.produto = criar_produto()
+
+    def test_normalizar(self):
+        self.assertEqual(answers.normalizar('  Quanto   VENDEMOS este mês?! '), 'quanto vendemos este mes')
+
+    def test_ttl_lru_e_taxa_de_acerto(self):
+        agora = [0.0]
+        respostas = answers.CacheDeRespostas(ttl=60, maximo_entradas=2, relogio=lambda: agora[0])
+        for indice in range(3):
+            respostas.guardar(f'Pergunta {indice}', 'prompt', {'answer': str(indice)}, versao='v1')
+
+        self.assertIsNone(respostas.obter('Pergunta 0', 'prompt', versao='v1'))
+        self.assertEqual(respostas.obter('pergunta 2?', 'prompt', versao='v1'), {'answer': '2'})
+        self.assertIsNone(respostas.obter('Pergunta 2', 'ferramentas', versao='v1'))
+        agora[0] = 61
+        self.assertIsNone(respostas.obter('Pergunta 2', 'prompt', versao='v1'))
+        self.assertEqual(respostas.stats(), {
+            'acertos': 1, 'faltas': 3, 'expirados': 1, 'despejados': 1, 'ignorados': 0, 'entradas': 1, 'taxa_acerto': 0.25,
+        })
+
+    def test_escrita_vence_as_respostas(self):
+        respostas = answers.CacheDeRespostas()
+        respostas.guardar('Quanto vendemos?', 'prompt', {'answer': 'Nada.'})
+        self.assertEqual(respostas.obter('Quanto vendemos?', 'prompt'), {'answer': 'Nada.'})
+
+        criar_venda(self.produto, 1)
+
+        self.assertIsNone(respostas.obter('Quanto vendemos?', 'prompt'))
+
+    @override_settings(ANALYST_THREADS=0)
+    def test_pergunta_repetida_nao_chama_o_modelo(self):
+        modelo = analyst.ModeloRoteirizado([resposta_final('Uma venda.'), resposta_final('Duas vendas.')])
+
+        def perguntar(session_id, **dados):
+            with mock.patch.object(views, 'model', modelo):
+                return self.client.post(reverse('ask_api'), json.dumps({
+                    'question': 'Quanto vendemos hoje?', 'session_id': session_id, 'modo': 'prompt', **dados,
+                }), content_type='application/json').json()
+
+        primeira, repetida = perguntar('gerente'), perguntar('caixa', question='quanto vendemos hoje')
+        self.assertEqual((primeira['answer'], primeira['metricas']['cache']), ('Uma venda.', False))
+        self.assertEqual((repetida['answer'], repetida['metricas']), ('Uma venda.', {'modo': 'prompt', 'cache': True}))
+        self.assertEqual(len(modelo.enviadas), 1)
+        self.assertEqual(ChatMessage.objects.filter(session_id='caixa').count(), 2)
+
+        self.assertEqual(perguntar('dono', sem_cache=True)['answer'], 'Duas vendas.')
+        self.assertEqual(answers.padrao().stats()['ignorados'], 1)
+
+    @override_settings(ANALYST_THREADS=0)
+    def test_pergunta_com_historico_nao_usa_o_cache(self):
+        modelo = analyst.ModeloRoteirizado([resposta_final('Uma venda.'), resposta_final('E ontem, duas.')])
+
+        def perguntar(question, session_id):
+            with mock.patch.object(views, 'model', modelo):
+                return self.client.post(reverse('ask_api'), json.dumps({
+                    'question': question, 'session_id': session_id, 'modo': 'prompt',
+                }), content_type='application/json').json()
+
+        perguntar('Quanto vendemos hoje?', 'gerente')
+        seguinte = perguntar('E ontem?', 'gerente')
+
+        self.assertEqual((seguinte['answer'], seguinte['metricas']['cache']), ('E ontem, duas.', False))
+        # A resposta da segunda pergunta dependia do histórico e não foi guardada.
+        self.assertEqual(answers.padrao().stats()['entradas'], 1)
+        self.assertEqual(answers.padrao().stats()['ignorados'], 1)
+
+
+class ClienteDoModeloTests(TestCase):
+    @staticmethod
+    def cliente(modelo, **politica):
+        return llm.Cliente(modelo, llm.Politica(espera_inicial=0, **politica), dormir=lambda segundos: None)
+
+    @staticmethod
+    def falhar(erro):
+        def passo(texto):
+            raise erro
+        return passo
+
+    def test_repete_falhas_transitorias(self):
+        cliente = self.cliente(analyst.ModeloRoteirizado([self.falhar(llm.ErroTransitorio('503')), 'ok']))
+
+        self.assertEqual(cliente.start_chat().send_message('oi').text, 'ok')
+        self.assertEqual((cliente.stats()['repeticoes'], cliente.stats()['sucessos']), (1, 1))
+
+    def test_erro_definitivo_nao_repete(self):
+        modelo = analyst.ModeloRoteirizado([self.falhar(ValueError('pedido inválido')), 'ok'])
+        cliente = self.cliente(modelo)
+
+        with self.assertRaises(ValueError):
+            cliente.start_chat().send_message('oi')
+        self.assertEqual(len(modelo.enviadas), 1)
+        self.assertEqual(cliente.disjuntor.estado, llm.Disjuntor.FECHADO)
+
+    def test_disjuntor(self):
+        agora = [0.0]
+        disjuntor = llm.Disjuntor(falhas_para_abrir=2, segundos_aberto=10, relogio=lambda: agora[0])
+        modelo = analyst.ModeloRoteirizado([self.falhar(llm.ErroTransitorio('503'))] * 3 + ['ok'])
+        cliente = llm.Cliente(modelo, llm.Politica(tentativas=2, espera_inicial=0), disjuntor=disjuntor,
+                              dormir=lambda segundos: None)
+
+        with self.assertRaises(llm.ErroTransitorio):
+            cliente.start_chat().send_message('oi')
+        with self.assertRaises(llm.CircuitoAberto):
+            cliente.start_chat().send_message('oi')
+        self.assertEqual(len(modelo.enviadas), 2)
+
+        # Passada a pausa, uma chamada de teste: se falhar, o circuito volta a abrir e nem a repetição passa.
+        agora[0] = 10
+        with self.assertRaises(llm.CircuitoAberto):
+            cliente.start_chat().send_message('oi')
+        self.assertEqual((disjuntor.estado, len(modelo.enviadas)), (llm.Disjuntor.ABERTO, 3))
+        agora[0] = 20
+        self.assertEqual(cliente.start_chat().send_message('oi').text, 'ok')
+        self.assertEqual(disjuntor.estado, llm.Disjuntor.FECHADO)
+        self.assertEqual(cliente.stats()['recusadas'], 2)
+
+    def test_chamada_de_teste_sem_veredito_nao_trava_o_circuito(self):
+        agora = [0.0]
+        disjuntor = llm.Disjuntor(falhas_para_abrir=1, segundos_aberto=10, relogio=lambda: agora[0])
+        modelo = analyst.ModeloRoteirizado([self.falhar(llm.ErroTransitorio('503')), self.falhar(ValueError('pedido inválido')),
+                                            'ok'])
+        cliente = llm.Cliente(modelo, llm.Politica(tentativas=1, espera_inicial=0), disjuntor=disjuntor,
+                              dormir=lambda segundos: None)
+
+        with self.assertRaises(llm.ErroTransitorio):
+            cliente.start_chat().send_message('oi')
+        agora[0] = 10
+        # A chamada de teste termina num erro definitivo: não diz nada do modelo, e a próxima testa de novo.
+        with self.assertRaises(ValueError):
+            cliente.start_chat().send_message('oi')
+        self.assertEqual(disjuntor.estado, llm.Disjuntor.ABERTO)
+        self.assertEqual(cliente.start_chat().send_message('oi').text, 'ok')
+        self.assertEqual(disjuntor.estado, llm.Disjuntor.FECHADO)
+
+    async def test_chamada_de_teste_cancelada_nao_trava_o_circuito(self):
+        disjuntor = llm.Disjuntor(falhas_para_abrir=1, segundos_aberto=0)
+        disjuntor.estado = llm.Disjuntor.ABERTO
+        cliente = llm.Cliente(llm.ModeloLocal(latencia=1), llm.Politica(espera_inicial=0), disjuntor=disjuntor)
+
+        tarefa = asyncio.ensure_future(cliente.start_chat().send_message_async('oi'))
+        await asyncio.sleep(0.05)
+        self.assertEqual(disjuntor.estado, llm.Disjuntor.MEIO_ABERTO)
+        tarefa.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await tarefa
+
+        self.assertEqual(disjuntor.estado, llm.Disjuntor.ABERTO)
+        cliente.backend.latencia = 0
+        await cliente.start_chat().send_message_async('oi')
+        self.assertEqual(disjuntor.estado, llm.Disjuntor.FECHADO)
+
+    async def test_tempo_limite_por_chamada(self):
+        cliente = self.cliente(analyst.ModeloRoteirizado(['lenta'] * 2, atraso=1), timeout=0.05, tentativas=2)
+
+        inicio = time.perf_counter()
+        with self.assertRaises(llm.TempoEsgotado):
+            await cliente.start_chat().send_message_async('oi')
+
+        self.assertLess(time.perf_counter() - inicio, 0.5)
+        self.assertEqual(cliente.stats()['tempos_esgotados'], 2)
+
+    async def test_limite_de_chamadas_simultaneas(self):
+        cliente = self.cliente(llm.ModeloLocal(latencia=0.1), concorrencia=2)
+
+        inicio = time.perf_counter()
+        respostas = await asyncio.gather(*[cliente.start_chat().send_message_async('oi') for _ in range(6)])
+
+        # Seis chamadas de 0,1s, duas por vez.
+        self.assertGreaterEqual(time.perf_counter() - inicio, 0.3)
+        self.assertEqual(len({resposta.text for resposta in respostas}), 1)
+
+    def test_modelo_local_resume_o_historico(self):
+        pedido = history.Resumidor(None).pedido('', [ChatMessage(role='user', content='Meta: R$ 50.000')], 100)
+        self.assertEqual(llm.ModeloLocal().responder(pedido), 'Usuário: Meta: R$ 50.000')
+
+    def test_sessao_local_guarda_o_historico(self):
+        sessao = llm.construir(llm.BACKEND_LOCAL).start_chat(history=[{'role': 'user', 'parts': ['antes']}])
+
+        resposta = analyst.extrair_json(sessao.send_message('Ferramentas: ...').text)
+
+        self.assertEqual(resposta['chamadas'][0]['ferramenta'], 'vendas_por_produto')
+        self.assertEqual(len(sessao.sessao.history), 3)
+        with self.assertRaises(ValueError):
+            llm.construir('openai')
+
+    @override_settings(ANALYST_THREADS=0)
+    def test_chat_de_ponta_a_ponta_com_o_modelo_local(self):
+        criar_venda(criar_produto(), 3, status='CONCLUIDA')
+        cliente = self.cliente(llm.ModeloLocal(resposta='Filtro de Óleo lidera.'))
+
+        with mock.patch.object(views, 'model', cliente):
+            resposta = self.client.post(reverse('ask_api'), json.dumps({
+                'question': 'Quais produtos mais venderam?', 'session_id': 'local', 'modo': 'ferramentas',
+            }), content_type='application/json')
+
+        self.assertEqual(resposta.json()['answer'], 'Filtro de Óleo lidera.')
+        self.assertEqual(resposta.json()['metricas']['chamadas_ferramenta'], 1)
+        self.assertEqual(cliente.stats()['chamadas'], 2)
+
+    @override_settings(ANALYST_THREADS=0)
+    def test_circuito_aberto_vira_503(self):
+        cliente = self.cliente(llm.ModeloLocal())
+        cliente.disjuntor.estado = llm.Disjuntor.ABERTO
+        cliente.disjuntor._aberto_em = time.monotonic()
+
+        with mock.patch.object(views, 'model', cliente):
+            resposta = self.client.post(reverse('ask_api'), json.dumps({
+                'question': 'Quanto vendemos?', 'session_id': 'fora', 'sem_cache': True,
+            }), content_type='application/json')
+
+        self.assertEqual(resposta.status_code, 503)
+        self.assertEqual(ChatMessage.objects.get(role='assistant').content, 'Erro: Serviço de IA indisponível.')
+
+    @override_settings(ANALYST_THREADS=0)
+    def test_benchmark_do_chat(self):
+        resultado = benchmarks.chat(linhas=20, perguntas=4, simultaneas=2, latencia=0)
+        self.assertEqual(resultado['modelo_falhas'], 0)
+        # Prompt: uma rodada por pergunta; ferramentas: duas; cache: só as duas primeiras, simultâneas, vão ao modelo.
+        self.assertEqual(resultado['modelo_chamadas'], 4 + 4 * 2 + 2 * 2)
+
+
+class VarreduraDeAtrasosTests(TestCase):
+    def setUp(self):
+        self.hoje = timezone.localdate()
+        self.fornecedor = Fornecedor.objects.create(nome_empresa='Distribuidora Sul')
+
+    def pagar(self, dias, status='ABERTO'):
+        return ContaPagar.objects.create(fornecedor=self.fornecedor, descricao='Compra', valor=Decimal('10.00'),
+                                         data_vencimento=self.hoje + timedelta(days=dias), status=status)
+
+    def receber(self, dias, status='ABERTO'):
+        return ContaReceber.objects.create(descricao='Venda', valor=Decimal('7.00'),
+                                           data_vencimento=self.hoje + timedelta(days=dias), status=status)
+
+    @staticmethod
+    def resumos():
+        return sorted(ResumoFinanceiroDiario.objects.values_list('origem', 'dia', 'status', 'forma_pagamento', 'registros', 'valor'))
+
+    def test_marca_atrasadas_e_move_os_resumos(self):
+        vencidas = [self.pagar(-3), self.pagar(-1), self.receber(-1)]
+        intactas = [self.pagar(0), self.pagar(-5, status='PAGO'), self.receber(2), self.receber(-2, status='CANCELADO')]
+        ContaPagar.objects.create(fornecedor=self.fornecedor, descricao='Atrasada', valor=Decimal('4.00'),
+                                  data_vencimento=self.hoje - timedelta(days=3), status='ATRASADO')
+        versao = cache.data_version(ContaPagar, ContaReceber)
+
+        varredura = overdue.varrer(self.hoje)
+
+        self.assertEqual((varredura.contas_pagar, varredura.contas_receber), (2, 1))
+        for conta in vencidas:
+            conta.refresh_from_db()
+            self.assertEqual(conta.status, 'ATRASADO')
+        self.assertEqual([type(conta).objects.get(pk=conta.pk).status for conta in intactas],
+                         ['ABERTO', 'PAGO', 'ABERTO', 'CANCELADO'])
+        # Os resumos ficam iguais aos de um recálculo completo, inclusive o dia que já tinha atrasadas.
+        resumos = self.resumos()
+        rollups.rebuild()
+        self.assertEqual(resumos, self.resumos())
+        self.assertNotEqual(cache.data_version(ContaPagar, ContaReceber), versao)
+
+    def test_conta_retroativa_lancada_entre_execucoes(self):
+        overdue.varrer(self.hoje)
+        self.assertIsNone(overdue.varrer(self.hoje))
+
+        # Lançada (ou importada) depois da varredura, com vencimento anterior a ela.
+        vence_hoje = self.pagar(0)
+        retroativa = self.receber(-10)
+        amanha = self.hoje + timedelta(days=1)
+        # Quantidade fixa de comandos, seja qual for o volume: por tabela, um UPDATE nas contas e três nos resumos.
+        with self.assertNumQueries(19):
+            varredura = overdue.varrer(amanha)
+
+        self.assertEqual((varredura.contas_pagar, varredura.contas_receber), (1, 1))
+        vence_hoje.refresh_from_db()
+        retroativa.refresh_from_db()
+        self.assertEqual((vence_hoje.status, retroativa.status), ('ATRASADO', 'ATRASADO'))
+        resumos = self.resumos()
+        rollups.rebuild()
+        self.assertEqual(resumos, self.resumos())
+        self.assertEqual(VarreduraAtrasos.objects.count(), 2)
+
+    def test_uma_varredura_por_referencia_entre_processos(self):
+        # Outra worker gravou a varredura de hoje depois que esta leu a última execução.
+        self.pagar(-1)
+        VarreduraAtrasos.objects.create(referencia=self.hoje)
+
+        with mock.patch.object(overdue, 'ultima', return_value=None):
+            self.assertIsNone(overdue.varrer(self.hoje))
+
+        self.assertEqual(VarreduraAtrasos.objects.count(), 1)
+        self.assertEqual(ContaPagar.objects.get().status, 'ABERTO')  # nada foi varrido em dobro
+
+    def test_comando(self):
+        self.pagar(-1)
+        saida = StringIO()
+
+        call_command('sweep_overdue', stdout=saida)
+        call_command('sweep_overdue', stdout=saida)
+
+        self.assertIn('1 contas a pagar e 0 a receber em atraso', saida.getvalue())
+        self.assertIn('Nada a varrer', saida.getvalue())
+        self.assertIsNone(overdue.iniciar_agendador(intervalo=0))
+
+    def test_benchmark_de_atrasos(self):
+        resultado = benchmarks.atrasos(linhas=200, lote=50)
+        self.assertGreater(resultado['primeira_alteradas'], 0)
+        self.assertEqual(resultado['abertas_vencidas_restantes'], 0)
+
+
+class FluxoDeCaixaTests(TestCase):
+    def setUp(self):
+        self.hoje = timezone.localdate()
+        self.fornecedor = Fornecedor.objects.create(nome_empresa='Distribuidora Sul')
+        self.user = User.objects.create_user('caixa', password='senha')
+
+    def pagar(self, dias, valor, status='ABERTO'):
+        ContaPagar.objects.create(fornecedor=self.fornecedor, descricao='Compra', valor=Decimal(valor),
+                                  data_vencimento=self.hoje + timedelta(days=dias), status=status)
+
+    def receber(self, dias, valor, status='ABERTO'):
+        ContaReceber.objects.create(descricao='Venda', valor=Decimal(valor),
+                                    data_vencimento=self.hoje + timedelta(days=dias), status=status)
+
+    def test_distribui_por_dia_e_acumula_o_saldo(self):
+        self.receber(0, '100.00')
+        self.receber(2, '50.25')
+        self.receber(2, '0.10')
+        self.receber(-4, '20.00', status='ATRASADO')
+        self.receber(1, '999.00', status='RECEBIDO')
+        self.receber(30, '70.00')  # fora do horizonte de 30 dias
+        self.pagar(1, '80.00')
+        self.pagar(-1, '5.00')
+        self.pagar(3, '300.00', status='PAGO')
+        produto = criar_produto()
+        criar_venda(produto, 4, status='PENDENTE', forma_pagamento='AP', condicao_prazo='7D')
+        criar_venda(produto, 1, status='PENDENTE')
+        criar_venda(produto, 9, status='CONCLUIDA')
+
+        projecao = cashflow.projetar(self.hoje, 30)
+
+        self.assertEqual(projecao.dias, 30)
+        self.assertEqual(projecao.receber[:3].tolist(), [12000, 0, 5035])
+        self.assertEqual(projecao.vendas[[0, 7]].tolist(), [1000, 4000])
+        self.assertEqual(projecao.pagar[:2].tolist(), [500, 8000])
+        self.assertEqual(projecao.vencidos, {'receber': 2000, 'vendas': 0, 'pagar': 500})
+        self.assertEqual(int(projecao.entradas.sum()), 12000 + 5035 + 5000)
+
+        dados = projecao.as_json(Decimal('10.00'))
+        self.assertEqual(dados['datas'][:2], [self.hoje.isoformat(), (self.hoje + timedelta(days=1)).isoformat()])
+        self.assertEqual(dados['saldo'][:3], [135.0, 55.0, 105.35])
+        self.assertEqual(dados['totais'], {'entradas': 220.35, 'saidas': 85.0, 'saldo_final': 145.35})
+        self.assertEqual(dados['menor_saldo'], {'data': (self.hoje + timedelta(days=1)).isoformat(), 'valor': 55.0})
+
+    def test_endpoint(self):
+        self.client.force_login(self.user)
+        self.receber(5, '40.00')
+        self.pagar(100, '15.00')
+        url = reverse('fluxo_caixa_api')
+
+        resposta = self.client.get(url).json()
+        self.assertEqual((resposta['dias'], resposta['totais']['saidas']), (30, 0.0))
+
+        resposta = self.client.get(url, {'dias': 180, 'saldo_inicial': '1000,50'}).json()
+        self.assertEqual(len(resposta['saldo']), 180)
+        self.assertEqual(resposta['totais']['saldo_final'], 1000.5 + 40 - 15)
+
+        for parametros in ({'dias': 45}, {'dias': 'x'}, {'saldo_inicial': 'abc'}, {'saldo_inicial': 'NaN'}):
+            self.assertEqual(self.client.get(url, parametros).status_code, 400)
+
+    def test_projecao_em_cache_ate_mudarem_os_dados(self):
+        self.receber(1, '10.00')
+        self.assertEqual(int(cashflow.projecao(90).receber.sum()), 1000)
+        with self.assertNumQueries(0):
+            cashflow.projecao(90)
+
+        self.receber(2, '5.00')
+        self.assertEqual(int(cashflow.projecao(90).receber.sum()), 1500)
+
+    def test_benchmark_de_fluxo_de_caixa(self):
+        resultado = benchmarks.fluxo_caixa(linhas=400, lote=100)
+        self.assertTrue(resultado['confere_com_linha_a_linha'])
+
+
+class RelatorioDeVencimentosTests(TestCase):
+    def setUp(self):
+        self.hoje = timezone.localdate()
+        self.user = User.objects.create_user('cobranca', password='senha')
+        self.ana = Cliente.objects.create(nome='Ana')
+        self.bruno = Cliente.objects.create(nome='Bruno')
+
+    def receber(self, cliente, atraso, valor, status='ABERTO'):
+        return ContaReceber.objects.create(cliente=cliente, descricao='Venda', valor=Decimal(valor), status=status,
+                                           data_vencimento=self.hoje - timedelta(days=atraso))
+
+    def test_faixas_por_cliente_numa_consulta(self):
+        self.receber(self.ana, -5, '10.00')
+        self.receber(self.ana, 0, '1.00')
+        self.receber(self.ana, 1, '2.00')
+        self.receber(self.ana, 30, '3.00', status='ATRASADO')
+        self.receber(self.ana, 31, '4.00')
+        self.receber(self.ana, 90, '5.00')
+        self.receber(self.ana, 91, '6.00')
+        self.receber(self.ana, 200, '99.00', status='RECEBIDO')
+        self.receber(self.bruno, 45, '50.00')
+        self.receber(None, 2, '7.00')
+
+        with self.assertNumQueries(1):
+            linhas = aging.relatorio('receber', self.hoje)
+
+        self.assertEqual([linha['contraparte'] for linha in linhas], ['Bruno', 'Ana', None])
+        ana = linhas[1]
+        self.assertEqual(ana['faixas'], {'a_vencer': Decimal('11.00'), 'ate_30': Decimal('5.00'),
+                                         'ate_60': Decimal('4.00'), 'ate_90': Decimal('5.00'),
+                                         'acima_90': Decimal('6.00')})
+        self.assertEqual((ana['registros'], ana['total'], ana['vencido']), (7, Decimal('31.00'), Decimal('20.00')))
+        self.assertEqual(aging.totais(linhas)['faixas']['ate_60'], Decimal('54.00'))
+
+    def test_detalhamento_lista_as_contas_da_faixa(self):
+        self.client.force_login(self.user)
+        dentro = self.receber(self.ana, 40, '4.00')
+        self.receber(self.ana, 40, '4.00', status='RECEBIDO')
+        self.receber(self.ana, 10, '1.00')
+        self.receber(self.bruno, 40, '8.00')
+        sem_cliente = self.receber(None, 40, '2.00')
+
+        parametros = aging.detalhamento('receber', self.ana.pk, 'ate_60', self.hoje)
+        resposta = self.client.get(reverse('lista_contas_receber'), parametros)
+        self.assertEqual([conta.pk for conta in resposta.context['contas']], [dentro.pk])
+
+        parametros = aging.detalhamento('receber', None, None, self.hoje)
+        resposta = self.client.get(reverse('lista_contas_receber'), parametros)
+        self.assertEqual([conta.pk for conta in resposta.context['contas']], [sem_cliente.pk])
+        self.assertContains(resposta, 'Sem cliente')
+
+    def test_pagina_e_api_paginadas_e_em_cache(self):
+        self.client.force_login(self.user)
+        fornecedores = [Fornecedor.objects.create(nome_empresa=f'Fornecedor {indice}') for indice in range(3)]
+        for indice, fornecedor in enumerate(fornecedores):
+            ContaPagar.objects.create(fornecedor=fornecedor, descricao='Compra', valor=Decimal(10 + indice),
+                                      data_vencimento=self.hoje - timedelta(days=15))
+
+        url = reverse('aging_api', args=['pagar'])
+        resposta = self.client.get(url, {'por_pagina': 2})
+        dados = resposta.json()
+        self.assertEqual([linha['contraparte'] for linha in dados['contrapartes']], ['Fornecedor 2', 'Fornecedor 1'])
+        self.assertEqual(dados['totais']['faixas']['ate_30'], 33.0)
+        self.assertIn('situacao=em_aberto', dados['contrapartes'][0]['detalhamento']['ate_30'])
+        self.assertIsNone(dados['anterior'])
+
+        with self.assertNumQueries(2):  # sessão e usuário: o relatório vem do cache
+            dados = self.client.get(url + dados['proxima']).json()
+        self.assertEqual([linha['contraparte'] for linha in dados['contrapartes']], ['Fornecedor 0'])
+        self.assertIsNone(dados['proxima'])
+
+        ContaPagar.objects.filter(fornecedor=fornecedores[0]).first().delete()
+        self.assertEqual(len(self.client.get(url).json()['contrapartes']), 2)
+
+        resposta = self.client.get(reverse('aging', args=['pagar']))
+        self.assertContains(resposta, 'Fornecedor 2')
+        self.assertContains(resposta, '31–60 dias')
+        self.assertEqual(self.client.get(reverse('aging', args=['outro'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('aging_api', args=['outro'])).status_code, 404)
+
+
+class LiquidacaoEmLoteTests(TestCase):
+    def setUp(self):
+        self.hoje = timezone.localdate()
+        self.user = User.objects.create_user('financeiro', password='senha')
+        self.client.force_login(self.user)
+        self.fornecedor = Fornecedor.objects.create(nome_empresa='Distribuidora Sul')
+
+    def pagar(self, status='ABERTO', dias=-3, valor='10.00'):
+        return ContaPagar.objects.create(fornecedor=self.fornecedor, descricao='Compra', valor=Decimal(valor),
+                                         data_vencimento=self.hoje + timedelta(days=dias), status=status)
+
+    def liquidar(self, url, corpo, chave=None):
+        cabecalhos = {'HTTP_IDEMPOTENCY_KEY': chave} if chave else {}
+        return self.client.post(reverse(url), json.dumps(corpo), content_type='application/json', **cabecalhos)
+
+    @staticmethod
+    def resumos():
+        return sorted(ResumoFinanceiroDiario.objects.values_list('origem', 'dia', 'status', 'forma_pagamento', 'registros', 'valor'))
+
+    def test_resultado_por_conta_num_update(self):
+        abertas = [self.pagar(), self.pagar(dias=5), self.pagar('ATRASADO', dias=-40, valor='7.50')]
+        paga, cancelada = self.pagar('PAGO'), self.pagar('CANCELADO')
+        ids = [conta.pk for conta in abertas] + [paga.pk, cancelada.pk, 999999]
+        data = self.hoje - timedelta(days=1)
+
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.liquidar('liquidar_contas_pagar', {'ids': ids + [ids[0]], 'data': data.isoformat()})
+
+        self.assertEqual(resposta.status_code, 200)
+        dados = resposta.json()
+        self.assertEqual(dados['liquidadas'], 3)
+        self.assertEqual([item['resultado'] for item in dados['resultados']],
+                         ['liquidada'] * 3 + ['ja_liquidada', 'cancelada', 'nao_encontrada'])
+        self.assertEqual([consulta['sql'].startswith('UPDATE "core_contapagar"') for consulta in consultas].count(True), 1)
+        self.assertEqual(set(ContaPagar.objects.filter(pk__in=[c.pk for c in abertas]).values_list('status', 'data_pagamento')),
+                         {('PAGO', data)})
+        # Os resumos ficam iguais aos de um recálculo completo.
+        resumos = self.resumos()
+        rollups.rebuild()
+        self.assertEqual(resumos, self.resumos())
+
+    def test_chave_de_idempotencia(self):
+        conta = self.pagar()
+        corpo = {'ids': [conta.pk]}
+        primeira = self.liquidar('liquidar_contas_pagar', corpo, chave='lote-1')
+        ContaPagar.objects.filter(pk=conta.pk).update(status='ABERTO', data_pagamento=None)
+
+        repetida = self.liquidar('liquidar_contas_pagar', corpo, chave='lote-1')
+
+        self.assertEqual(repetida.json(), primeira.json())
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        conta.refresh_from_db()
+        self.assertEqual(conta.status, 'ABERTO')  # a repetição não liquida de novo
+        self.assertEqual(LiquidacaoEmLote.objects.count(), 1)
+        self.assertEqual(self.liquidar('liquidar_contas_pagar', {'ids': [conta.pk, 5]}, chave='lote-1').status_code, 409)
+        # A mesma chave vale por lado.
+        self.assertEqual(self.liquidar('liquidar_contas_receber', corpo, chave='lote-1').json()['resultados'],
+                         [{'id': conta.pk, 'resultado': 'nao_encontrada'}])
+
+    def test_chave_gravada_por_pedido_concorrente(self):
+        conta = self.pagar()
+        LiquidacaoEmLote.objects.create(lado='pagar', chave='lote-2', assinatura=settlements.assinatura([conta.pk], self.hoje),
+                                        resposta={'gravada': True})
+        with mock.patch.object(LiquidacaoEmLote.objects, 'filter', return_value=LiquidacaoEmLote.objects.none()):
+            resposta, repetida = settlements.liquidar('pagar', [conta.pk], self.hoje, chave='lote-2')
+        self.assertEqual((resposta, repetida), ({'gravada': True}, True))
+        conta.refresh_from_db()
+        self.assertEqual(conta.status, 'ABERTO')
+
+    def test_contas_a_receber_e_validacao(self):
+        produto = criar_produto()
+        self.client.post(reverse('venda_nova'), dados_venda([(produto, 2)], forma_pagamento='AP', condicao_prazo='7D'))
+        conta = ContaReceber.objects.get()
+
+        dados = self.liquidar('liquidar_contas_receber', {'ids': [conta.pk]}).json()
+
+        self.assertEqual(dados['resultados'], [{'id': conta.pk, 'resultado': 'liquidada'}])
+        conta.refresh_from_db()
+        self.assertEqual((conta.status, conta.data_recebimento), ('RECEBIDO', self.hoje))
+        resumos = self.resumos()
+        rollups.rebuild()
+        self.assertEqual(resumos, self.resumos())
+
+        for corpo in ({}, {'ids': []}, {'ids': ['1']}, {'ids': [True]}, {'ids': [1], 'data': '31/12/2024'},
+                      {'ids': list(range(1, settlements.LIMITE + 2))}):
+            self.assertEqual(self.liquidar('liquidar_contas_receber', corpo).status_code, 400, corpo)
+        self.assertEqual(self.client.get(reverse('liquidar_contas_receber')).status_code, 405)
+        # A marcação individual não muda nada num GET.
+        self.assertEqual(self.client.get(reverse('marcar_conta_receber_recebida', args=[conta.pk])).status_code, 405)
+
+    def test_listagens_com_selecao(self):
+        aberta, paga = self.pagar(), self.pagar('PAGO')
+        resposta = self.client.get(reverse('lista_contas_pagar'))
+        self.assertContains(resposta, f'class="selecionar-conta" value="{aberta.pk}">')
+        self.assertContains(resposta, f'class="selecionar-conta" value="{paga.pk}" disabled>')
+        self.assertContains(resposta, reverse('liquidar_contas_pagar'))
+        self.assertContains(self.client.get(reverse('lista_contas_receber')), reverse('liquidar_contas_receber'))
+
+
+class ContasRecorrentesTests(TestCase):
+    def setUp(self):
+        self.hoje = date(2025, 1, 15)
+        self.fornecedor = Fornecedor.objects.create(nome_empresa='Imobiliária Centro')
+
+    def recorrencia(self, **campos):
+        campos = {'fornecedor': self.fornecedor, 'descricao': 'Aluguel', 'valor': Decimal('1500.00'),
+                  'dia_vencimento': 31, 'inicio': date(2025, 1, 1), **campos}
+        return ContaPagarRecorrente.objects.create(**campos)
+
+    def vencimentos(self, recorrencia):
+        return list(recorrencia.contas.order_by('data_vencimento').values_list('data_vencimento', flat=True))
+
+    @staticmethod
+    def resumos():
+        return sorted(ResumoFinanceiroDiario.objects.values_list('origem', 'dia', 'status', 'forma_pagamento', 'registros', 'valor'))
+
+    def test_ocorrencias_no_fim_do_mes_e_por_frequencia(self):
+        mensal = self.recorrencia()
+        self.assertEqual(recurring.ocorrencias(mensal, date(2024, 1, 1), date(2025, 4, 30)),
+                         [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31), date(2025, 4, 30)])
+        # Bimestral conta a partir do mês de início, não de janeiro; o fim limita os vencimentos.
+        bimestral = self.recorrencia(frequencia='BIMESTRAL', dia_vencimento=10, inicio=date(2024, 12, 20),
+                                     fim=date(2025, 8, 9))
+        self.assertEqual(recurring.ocorrencias(bimestral, date(2025, 1, 1), date(2025, 12, 31)),
+                         [date(2025, 2, 10), date(2025, 4, 10), date(2025, 6, 10)])
+        self.assertEqual(recurring.ocorrencias(self.recorrencia(frequencia='ANUAL', dia_vencimento=29, inicio=date(2024, 2, 1)),
+                                               date(2024, 1, 1), date(2026, 12, 31)),
+                         [date(2024, 2, 29), date(2025, 2, 28), date(2026, 2, 28)])
+
+    def test_geracao_em_lote_e_idempotente(self):
+        aluguel = self.recorrencia()
+        trimestral = self.recorrencia(descricao='Contador', frequencia='TRIMESTRAL', dia_vencimento=5, inicio=date(2024, 11, 1))
+        self.recorrencia(descricao='Encerrada', fim=date(2024, 12, 31))
+        self.recorrencia(descricao='Pausada', ativa=False)
+
+        geracao = recurring.gerar(dias=90, hoje=self.hoje)
+
+        self.assertEqual((geracao.recorrencias, geracao.criadas), (2, 4))
+        self.assertEqual(self.vencimentos(aluguel), [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31)])
+        self.assertEqual(self.vencimentos(trimestral), [date(2025, 2, 5)])
+        conta = aluguel.contas.first()
+        self.assertEqual((conta.fornecedor, conta.descricao, conta.valor, conta.status),
+                         (self.fornecedor, 'Aluguel', Decimal('1500.00'), 'ABERTO'))
+        aluguel.refresh_from_db()
+        self.assertEqual(aluguel.gerada_ate, date(2025, 4, 15))
+        # bulk_create não dispara signals, mas os resumos ficam iguais aos de um recálculo completo.
+        resumos = self.resumos()
+        rollups.rebuild()
+        self.assertEqual(resumos, self.resumos())
+
+        # Rodar de novo no mesmo dia não consulta nem grava contas; no dia seguinte, só completa o horizonte.
+        with self.assertNumQueries(1):
+            self.assertEqual(recurring.gerar(dias=90, hoje=self.hoje).criadas, 0)
+        self.assertEqual(recurring.gerar(dias=90, hoje=self.hoje + timedelta(days=17)).criadas, 1)
+        self.assertEqual(self.vencimentos(aluguel)[-1], date(2025, 4, 30))
+        self.assertEqual(ContaPagar.objects.count(), 5)
+
+    def test_nao_duplica_contas_ja_existentes(self):
+        aluguel = self.recorrencia()
+        ContaPagar.objects.create(recorrencia=aluguel, fornecedor=self.fornecedor, descricao='Aluguel',
+                                  valor=Decimal('1500.00'), data_vencimento=date(2025, 2, 28), status='PAGO')
+
+        geracao = recurring.gerar(dias=60, hoje=self.hoje)
+
+        self.assertEqual((geracao.criadas, geracao.existentes), (1, 1))
+        self.assertEqual(self.vencimentos(aluguel), [date(2025, 1, 31), date(2025, 2, 28)])
+        # Mesmo que a marca se perca, a restrição única impede a duplicata no banco.
+        ContaPagarRecorrente.objects.filter(pk=aluguel.pk).update(gerada_ate=None)
+        self.assertEqual(recurring.gerar(dias=60, hoje=self.hoje).criadas, 0)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ContaPagar.objects.create(recorrencia=aluguel, descricao='Aluguel', valor=Decimal('1.00'),
+                                      data_vencimento=date(2025, 1, 31))
+
+    def test_edicao_refaz_as_contas_futuras_em_aberto(self):
+        aluguel = self.recorrencia(dia_vencimento=10)
+        recurring.gerar(dias=90, hoje=date(2025, 1, 1))
+        ContaPagar.objects.filter(recorrencia=aluguel, data_vencimento=date(2025, 3, 10)).update(
+            status='PAGO', data_pagamento=date(2025, 1, 20))
+        rollups.rebuild()
+
+        aluguel.descricao, aluguel.valor = 'Aluguel reajustado', Decimal('1650.00')
+        aluguel.save()
+        removidas, geracao = recurring.regenerar(aluguel, dias=90, hoje=date(2025, 2, 1))
+
+        # A vencida e a já paga ficam; as futuras em aberto voltam com os novos termos.
+        self.assertEqual((removidas, geracao.criadas, geracao.existentes), (1, 2, 1))
+        self.assertEqual(list(aluguel.contas.order_by('data_vencimento').values_list('data_vencimento', 'valor', 'status')), [
+            (date(2025, 1, 10), Decimal('1500.00'), 'ABERTO'),
+            (date(2025, 2, 10), Decimal('1650.00'), 'ABERTO'),
+            (date(2025, 3, 10), Decimal('1500.00'), 'PAGO'),
+            (date(2025, 4, 10), Decimal('1650.00'), 'ABERTO'),
+        ])
+        resumos = self.resumos()
+        rollups.rebuild()
+        self.assertEqual(resumos, self.resumos())
+
+        # Desativada, as futuras em aberto saem e nada é gerado.
+        aluguel.ativa = False
+        aluguel.save()
+        removidas, geracao = recurring.regenerar(aluguel, dias=90, hoje=date(2025, 2, 1))
+        self.assertEqual((removidas, geracao.criadas), (2, 0))
+
+    def test_tela_de_edicao_regenera_so_quando_muda(self):
+        self.client.force_login(User.objects.create_user('financeiro', password='senha'))
+        aluguel = self.recorrencia()
+        dados = {'fornecedor': self.fornecedor.pk, 'descricao': 'Aluguel', 'valor': '1500.00', 'frequencia': 'MENSAL',
+                 'dia_vencimento': 31, 'inicio': '2025-01-01', 'ativa': 'on'}
+        url = reverse('conta_pagar_recorrente_editar', args=[aluguel.pk])
+
+        with mock.patch.object(recurring, 'regenerar') as regenerar:
+            self.client.post(url, dados)
+            regenerar.assert_not_called()
+            self.client.post(url, {**dados, 'valor': '1650.00'})
+            regenerar.assert_called_once()
+
+    def test_comando_e_telas(self):
+        self.recorrencia(inicio=date(2000, 1, 1))
+        saida = StringIO()
+        call_command('generate_recurring_payables', dias=45, stdout=saida)
+        self.assertIn('criadas', saida.getvalue())
+        self.assertTrue(ContaPagar.objects.filter(recorrencia__isnull=False).exists())
+        with self.assertRaises(CommandError):
+            call_command('generate_recurring_payables', data='31/12/2025', stdout=StringIO())
+
+        self.client.force_login(User.objects.create_user('financeiro', password='senha'))
+        self.assertContains(self.client.get(reverse('lista_contas_pagar_recorrentes')), 'Aluguel')
+        resposta = self.client.post(reverse('conta_pagar_recorrente_nova'), {
+            'fornecedor': self.fornecedor.pk, 'descricao': 'Internet', 'valor': '99.90', 'frequencia': 'MENSAL',
+            'dia_vencimento': 10, 'inicio': timezone.localdate().isoformat(), 'ativa': 'on',
+        })
+        self.assertRedirects(resposta, reverse('lista_contas_pagar_recorrentes'))
+        internet = ContaPagarRecorrente.objects.get(descricao='Internet')
+        self.assertTrue(internet.contas.exists())  # gerada ao salvar, sem esperar o comando
+        self.assertEqual(self.client.post(reverse('conta_pagar_recorrente_nova'), {
+            'descricao': 'Errada', 'valor': '1', 'frequencia': 'MENSAL', 'dia_vencimento': 32,
+            'inicio': '2025-02-01', 'fim': '2025-01-01', 'ativa': 'on',
+        }).status_code, 200)
+        self.assertRedirects(self.client.post(reverse('gerar_contas_recorrentes')), reverse('lista_contas_pagar_recorrentes'))
+
+    def test_benchmark_de_recorrentes(self):
+        resultado = benchmarks.recorrentes(linhas=20, comparar=3)
+        self.assertGreater(resultado['primeira_criadas'], 0)
+        self.assertEqual(resultado['segunda_criadas'], 0)
+        self.assertTrue(resultado['resumos_conferem'])
+
+
+class RazaoDeEstoqueTests(TestCase):
+    def setUp(self):
+        cache.backend().clear()
+        self.produto = criar_produto(estoque=10)
+
+    def razao(self):
+        return list(MovimentoEstoque.objects.filter(produto=self.produto).values_list('motivo', 'quantidade'))
+
+    def assertRazaoConfere(self):
+        self.produto.refresh_from_db()
+        self.assertEqual(stock.saldos_em(produtos=[self.produto.pk]), {self.produto.pk: self.produto.quantidade_estoque})
+
+    def test_vendas_e_ajustes_entram_no_razao(self):
+        venda = sales.salvar_venda(Venda(status='CONCLUIDA'), [(self.produto, 3)])
+        self.assertRazaoConfere()
+        sales.salvar_venda(venda, [(self.produto, 5)])
+        self.assertRazaoConfere()
+        sales.excluir_venda(venda)
+        self.assertRazaoConfere()
+
+        self.produto.quantidade_estoque = 4
+        self.produto.save()
+        self.assertRazaoConfere()
+        self.assertEqual(self.razao(), [
+            ('INICIAL', 10), ('VENDA', -3), ('ALTERACAO', -2), ('EXCLUSAO', 5), ('AJUSTE', -6),
+        ])
+
+        imports.importar_vendas([(1, {'produto_id': self.produto.pk, 'quantidade': 2})])
+        self.assertRazaoConfere()
+        self.assertEqual(MovimentoEstoque.objects.filter(motivo='VENDA').last().venda, Venda.objects.get())
+
+        with self.assertRaises(ValueError):
+            MovimentoEstoque.objects.first().save()
+
+    def test_saldos_historicos_com_snapshot(self):
+        MovimentoEstoque.objects.filter(produto=self.produto).delete()
+        dias = [timezone.make_aware(timezone.datetime(2025, 3, dia, 12)) for dia in range(1, 6)]
+        for data, quantidade in zip(dias, [10, -2, -3, 4, -1]):
+            MovimentoEstoque.objects.create(produto=self.produto, motivo='AJUSTE', quantidade=quantidade, data=data)
+
+        corte = stock.inicio_do_dia(date(2025, 3, 3))
+        self.assertEqual(stock.registrar_saldos(corte), 1)
+        self.assertEqual(stock.registrar_saldos(corte), 0)
+        self.assertEqual(SaldoEstoque.objects.get().quantidade, 8)
+
+        esperados = {date(2025, 2, 28): 0, date(2025, 3, 2): 8, date(2025, 3, 3): 5, date(2025, 3, 5): 8}
+        for dia, saldo in esperados.items():
+            self.assertEqual(stock.saldos_em(stock.fim_do_dia(dia))[self.produto.pk], saldo)
+
+        # Depois do corte, a consulta parte do saldo gravado e só soma a cauda.
+        SaldoEstoque.objects.update(quantidade=100)
+        self.assertEqual(stock.saldos_em(stock.fim_do_dia(date(2025, 3, 4)))[self.produto.pk], 101)
+        self.assertEqual(stock.saldos_em(stock.fim_do_dia(date(2025, 3, 1)))[self.produto.pk], 10)
+        SaldoEstoque.objects.update(quantidade=8)
+
+        periodo = stock.movimentacao(stock.inicio_do_dia(date(2025, 3, 2)), stock.fim_do_dia(date(2025, 3, 4)))
+        self.assertEqual(periodo[self.produto.pk], {'saldo_inicial': 10, 'entradas': 4, 'saidas': 5, 'saldo_final': 9})
+
+        self.client.force_login(User.objects.create_user('estoquista', password='senha-segura'))
+        resposta = self.client.get(reverse('estoque_api'), {'data': '2025-03-03', 'produto': self.produto.pk}).json()
+        self.assertEqual(resposta['produtos'], [{'produto_id': self.produto.pk, 'quantidade': 5}])
+        resposta = self.client.get(reverse('estoque_api'), {'inicio': '2025-03-02', 'fim': '2025-03-04'}).json()
+        self.assertEqual(resposta['produtos'][0]['saldo_final'], 9)
+        self.assertEqual(self.client.get(reverse('estoque_api'), {'inicio': '2025-03-40'}).status_code, 400)
+
+    def test_comandos_de_snapshot_e_reconciliacao(self):
+        MovimentoEstoque.objects.update(data=timezone.now() - timedelta(days=1))
+        saida = StringIO()
+        call_command('snapshot_stock', stdout=saida)
+        self.assertIn('1 saldos', saida.getvalue())
+
+        # Um UPDATE por fora do serviço de estoque deixa o produto divergente do razão.
+        Produto.objects.filter(pk=self.produto.pk).update(quantidade_estoque=15)
+        saida = StringIO()
+        call_command('reconcile_stock', '--apenas-relatorio', stdout=saida)
+        self.assertIn('estoque 15, razão 10 (diferença +5)', saida.getvalue())
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade_estoque, 15)
+
+        call_command('reconcile_stock', stdout=StringIO())
+        self.assertRazaoConfere()
+        self.assertEqual(stock.reconciliar(), [])
+
+
+class VendasConcorrentesTests(TransactionTestCase):
+    def test_vendas_paralelas_nao_perdem_estoque(self):
+        produto = criar_produto(estoque=30)
+        resultados = []
+        barreira = threading.Barrier(8)
+
+        def caixa():
+            try:
+                barreira.wait()
+                for _ in range(5):
+                    try:
+                        sales.salvar_venda(Venda(status='CONCLUIDA'), [(produto, 1)])
+                        resultados.append('ok')
+                    except stock.EstoqueInsuficiente:
+                        resultados.append('sem estoque')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=caixa) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        produto.refresh_from_db()
+        self.assertEqual(resultados.count('ok'), 30)
+        self.assertEqual(resultados.count('sem estoque'), 10)
+        self.assertEqual(produto.quantidade_estoque, 0)
+        self.assertEqual(Venda.objects.count(), 30)
+        self.assertEqual(ContaReceber.objects.count(), 30)
+
+
+class HistoricoDoChatTests(TestCase):
+    def conversa(self, sessao, turnos, resposta='Resposta.'):
+        for indice in range(turnos):
+            ChatMessage.objects.create(session_id=sessao, role='user', content=f'Pergunta {indice}')
+            ChatMessage.objects.create(session_id=sessao, role='assistant', content=resposta)
+
+    def test_sessao_curta_vai_inteira(self):
+        self.conversa('curta', 2)
+
+        janela = history.janela('curta', turnos=3)
+
+        self.assertEqual(janela.resumo, '')
+        self.assertEqual([item['role'] for item in janela.historico()], ['user', 'model'] * 2)
+        self.assertFalse(ResumoConversa.objects.exists())
+
+    def test_mensagens_antigas_viram_resumo(self):
+        self.conversa('longa', 10)
+
+        janela = history.janela('longa', turnos=3)
+
+        self.assertEqual([mensagem.content for mensagem in janela.mensagens][::2], ['Pergunta 7', 'Pergunta 8', 'Pergunta 9'])
+        self.assertEqual(janela.resumidas, 14)
+        self.assertTrue(janela.resumo.startswith('Usuário: Pergunta 0\nAssistente: Resposta.'))
+        historico = janela.historico()
+        self.assertIn('Pergunta 6', historico[0]['parts'][0])
+        self.assertEqual(historico[1], {'role': 'model', 'parts': ['Entendido.']})
+        self.assertEqual(len(historico), 8)
+
+    def test_resumo_incremental_com_custo_constante(self):
+        self.conversa('incremental', 10)
+        history.janela('incremental', turnos=3)
+        self.conversa('incremental', 1)
+
+        # Resumo, janela, o que saiu dela e a gravação do resumo, qualquer que seja o tamanho da sessão.
+        with self.assertNumQueries(4):
+            janela = history.janela('incremental', turnos=3)
+
+        resumo = ResumoConversa.objects.get(session_id='incremental')
+        self.assertEqual((janela.resumidas, resumo.mensagens), (16, 16))
+        self.assertEqual(resumo.texto.count('Usuário:'), 8)
+        self.assertEqual(resumo.ate, ChatMessage.objects.filter(session_id='incremental').order_by('timestamp')[15].timestamp)
+
+    def test_orcamento_de_tokens(self):
+        self.conversa('cara', 4, resposta='x' * 2000)
+
+        janela = history.janela('cara', turnos=4, maximo_tokens=1200, maximo_tokens_resumo=200)
+
+        self.assertLessEqual(janela.tokens, 1200)
+        self.assertEqual([mensagem.content for mensagem in janela.mensagens], ['Pergunta 3', 'x' * 2000])
+        # O resumo não passa do seu limite e descarta as linhas mais antigas primeiro.
+        self.assertLessEqual(history.estimar_tokens(janela.resumo), 200)
+        self.assertIn('Pergunta 2', janela.resumo)
+        self.assertNotIn('Pergunta 0', janela.resumo)
+
+    def test_resumo_pelo_modelo_guarda_os_fatos_antigos(self):
+        # Os fatos ficam no fim de mensagens longas, onde a transcrição truncada os cortaria.
+        ChatMessage.objects.create(session_id='fatos', role='user',
+                                   content='Contexto: ' + 'detalhe ' * 60 + 'Nossa meta de março é R$ 50.000.')
+        ChatMessage.objects.create(session_id='fatos', role='assistant',
+                                   content='Análise: ' + 'dado ' * 80 + 'O cliente que mais compra é a Oficina Central.')
+        self.conversa('fatos', 3)
+
+        def resumir(texto):
+            self.assertIn('R$ 50.000', texto)
+            self.assertIn('Oficina Central', texto)
+            return 'Meta de março: R$ 50.000. Maior cliente: Oficina Central.'
+        modelo = analyst.ModeloRoteirizado([resumir])
+
+        janela = history.janela('fatos', turnos=3, resumidor=history.Resumidor(modelo))
+
+        self.assertEqual(len(modelo.enviadas), 1)
+        self.assertEqual(janela.resumo, 'Meta de março: R$ 50.000. Maior cliente: Oficina Central.')
+        self.assertIn('Oficina Central', janela.historico()[0]['parts'][0])
+        self.assertEqual(ResumoConversa.objects.get(session_id='fatos').texto, janela.resumo)
+        # Sem mensagens saindo da janela, o modelo não é chamado de novo.
+        history.janela('fatos', turnos=3, resumidor=history.Resumidor(modelo))
+        self.assertEqual(len(modelo.enviadas), 1)
+
+        # O resumo seguinte parte do anterior.
+        self.conversa('fatos', 1)
+        modelo.roteiro.append('Resumo novo.')
+        self.assertEqual(history.janela('fatos', turnos=3, resumidor=history.Resumidor(modelo)).resumo, 'Resumo novo.')
+        self.assertIn('Resumo até aqui:\nMeta de março: R$ 50.000. Maior cliente: Oficina Central.', modelo.enviadas[-1])
+
+    def test_falha_do_modelo_guarda_a_transcricao(self):
+        self.conversa('falha', 5)
+        modelo = analyst.ModeloRoteirizado([])  # roteiro vazio: a chamada falha
+
+        with self.assertLogs('core.history', 'ERROR'):
+            janela = history.janela('falha', turnos=3, resumidor=history.Resumidor(modelo))
+
+        self.assertTrue(janela.resumo.startswith('Usuário: Pergunta 0\nAssistente: Resposta.'))
+
+    def test_janela_comeca_numa_pergunta(self):
+        for indice in range(2):
+            ChatMessage.objects.create(session_id='pergunta', role='user', content=f'{indice}' * 1600)
+            ChatMessage.objects.create(session_id='pergunta', role='assistant', content='ok')
+
+        # Cabem a última pergunta e as duas respostas, mas a janela não começa na resposta órfã.
+        janela = history.janela('pergunta', turnos=2, maximo_tokens=600, maximo_tokens_resumo=100)
+
+        self.assertEqual([mensagem.role for mensagem in janela.mensagens], ['user', 'assistant'])
+        self.assertEqual(janela.resumidas, 2)
+
+
+class ChatAssincronoTests(TransactionTestCase):
+    def setUp(self):
+        cache.backend().clear()
+        snapshots.padrao().limpar()
+        answers.padrao().limpar()
+        criar_venda(criar_produto(), 2, status='CONCLUIDA')
+
+    @staticmethod
+    def modelo(atraso, respostas=1):
+        def responder(texto):
+            if 'Ferramentas:' in texto:
+                return json.dumps({'chamadas': [{'ferramenta': 'vendas_por_produto', 'argumentos': {}}]})
+            return resposta_final(str(analyst.extrair_json(texto)['resultados'][0]['resultado'][0]['quantidade']))
+        return analyst.ModeloRoteirizado([responder] * respostas * 2, atraso=atraso)
+
+    @staticmethod
+    def corpo(sessao):
+        return json.dumps({'question': 'Quanto vendemos?', 'session_id': sessao, 'modo': 'ferramentas'})
+
+    async def test_conversas_simultaneas_nao_se_bloqueiam(self):
+        with mock.patch.object(views, 'model', self.modelo(atraso=0.2, respostas=8)):
+            inicio = time.perf_counter()
+            respostas = await asyncio.gather(*[
+                self.async_client.post(reverse('ask_api'), self.corpo(f'sessao-{indice}'), content_type='application/json')
+                for indice in range(8)
+            ])
+            segundos = time.perf_counter() - inicio
+
+        self.assertEqual([resposta.json()['answer'] for resposta in respostas], ['2'] * 8)
+        # Oito conversas de duas rodadas de 0,2s cada: em série levariam 3,2s.
+        self.assertLess(segundos, 1.6)
+        self.assertEqual(await ChatMessage.objects.filter(role='assistant').acount(), 8)
+
+    @override_settings(ANALYST_TIMEOUT=0.1)
+    def test_tempo_esgotado(self):
+        with mock.patch.object(views, 'model', self.modelo(atraso=1)):
+            resposta = self.client.post(reverse('ask_api'), self.corpo('lenta'), content_type='application/json')
+
+        self.assertEqual(resposta.status_code, 504)
+        self.assertEqual(ChatMessage.objects.get(role='assistant').content, 'Erro: Tempo esgotado aguardando a IA.')
+
+    async def test_cliente_desconectado(self):
+        request = AsyncRequestFactory().post(reverse('ask_api'), self.corpo('abandonada'), content_type='application/json')
+        with mock.patch.object(views, 'model', self.modelo(atraso=1)):
+            tarefa = asyncio.create_task(views.ask_api_view(request))
+            await asyncio.sleep(0.2)
+            tarefa.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await tarefa
+
+        self.assertTrue(await ChatMessage.objects.filter(role='user').aexists())
+        self.assertFalse(await ChatMessage.objects.filter(role='assistant').aexists())
+
+    @staticmethod
+    def eventos(pedacos):
+        blocos = b''.join(pedacos).decode().strip().split('\n\n')
+        return [(evento[len('event: '):], json.loads(dados[len('data: '):]))
+                for evento, dados in (bloco.split('\n') for bloco in blocos)]
+
+    async def test_resposta_em_fluxo(self):
+        modelo = self.modelo(atraso=0)
+        resposta_longa = modelo.roteiro[1]
+        modelo.roteiro[1] = lambda texto: resposta_final(f"Vendemos {json.loads(resposta_longa(texto))['resposta_final']} unidades.")
+        modelo.trecho, modelo.intervalo = 8, 0.05
+        with mock.patch.object(views, 'model', modelo):
+            inicio = time.perf_counter()
+            resposta = await self.async_client.post(reverse('ask_stream_api'), self.corpo('fluxo'),
+                                                    content_type='application/json')
+            pedacos = []
+            async for pedaco in resposta.streaming_content:
+                if not pedacos:
+                    primeiro_byte = time.perf_counter() - inicio
+                pedacos.append(pedaco)
+            segundos = time.perf_counter() - inicio
+
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+        eventos = self.eventos(pedacos)
+        self.assertEqual(eventos[0], ('inicio', {'modo': 'ferramentas'}))
+        parciais = [dados['resposta_final'] for nome, dados in eventos if nome == 'parcial']
+        self.assertGreater(len(parciais), 1)
+        self.assertEqual(parciais[-1], 'Vendemos 2 unidades.')
+        nome, final = eventos[-1]
+        self.assertEqual((nome, final['status'], final['answer']), ('resposta', 200, 'Vendemos 2 unidades.'))
+        self.assertEqual(final['metricas']['rodadas'], 2)
+        self.assertLess(primeiro_byte, segundos / 2)
+        self.assertEqual((await ChatMessage.objects.aget(role='assistant')).content, 'Vendemos 2 unidades.')
+
+    @override_settings(ANALYST_TIMEOUT=0.1)
+    async def test_fluxo_tempo_esgotado(self):
+        with mock.patch.object(views, 'model', self.modelo(atraso=1)):
+            resposta = await self.async_client.post(reverse('ask_stream_api'), self.corpo('lenta'),
+                                                    content_type='application/json')
+            eventos = self.eventos([pedaco async for pedaco in resposta.streaming_content])
+
+        self.assertEqual([nome for nome, _ in eventos], ['inicio', 'erro'])
+        self.assertEqual(eventos[-1][1]['status'], 504)
+        self.assertEqual((await ChatMessage.objects.aget(role='assistant')).content, 'Erro: Tempo esgotado aguardando a IA.')
+
+    async def test_fluxo_valida_antes_de_abrir(self):
+        resposta = await self.async_client.post(reverse('ask_stream_api'), json.dumps({'question': 'Oi'}),
+                                                content_type='application/json')
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(await ChatMessage.objects.aexists())
@@ -19,6 +19,7 @@ urlpatterns = [
     
     # URLs de Venda
     path('vendas/', views.lista_vendas_view, name='lista_vendas'),
+    path('vendas/exportar/', views.exportar_vendas_view, name='exportar_vendas'),
     path('vendas/nova/', views.venda_form_view, name='venda_nova'),
     path('vendas/<int:pk>/editar/', views.venda_form_view, name='venda_editar'), 
     path('vendas/<int:pk>/deletar/', views.venda_delete_view, name='venda_deletar'), 
@@ -37,20 +38,52 @@ urlpatterns = [
     
     # URLs de Conta a Pagar
     path('contas-a-pagar/', views.lista_contas_pagar_view, name='lista_contas_pagar'),
+    path('contas-a-pagar/exportar/', views.exportar_contas_pagar_view, name='exportar_contas_pagar'),
     path('contas-a-pagar/nova/', views.conta_pagar_form_view, name='conta_pagar_nova'),
     path('contas-a-pagar/<int:pk>/editar/', views.conta_pagar_form_view, name='conta_pagar_editar'),
     path('contas-a-pagar/<int:pk>/pagar/', views.marcar_conta_pagar_paga, name='marcar_conta_pagar_paga'),
+    path('contas-a-pagar/liquidar/', views.liquidar_contas_view, {'lado': 'pagar'}, name='liquidar_contas_pagar'),
+    path('contas-a-pagar/recorrentes/', views.lista_contas_pagar_recorrentes_view, name='lista_contas_pagar_recorrentes'),
+    path('contas-a-pagar/recorrentes/nova/', views.conta_pagar_recorrente_form_view, name='conta_pagar_recorrente_nova'),
+    path('contas-a-pagar/recorrentes/gerar/', views.gerar_contas_recorrentes_view, name='gerar_contas_recorrentes'),
+    path('contas-a-pagar/recorrentes/<int:pk>/editar/', views.conta_pagar_recorrente_form_view, name='conta_pagar_recorrente_editar'),
+    path('contas-a-pagar/recorrentes/<int:pk>/deletar/', views.conta_pagar_recorrente_delete_view, name='conta_pagar_recorrente_deletar'),
     path('contas-a-pagar/<int:pk>/deletar/', views.conta_pagar_delete_view, name='conta_pagar_deletar'), 
     
     # URLs de Conta a Receber
     path('contas-a-receber/', views.lista_contas_receber_view, name='lista_contas_receber'),
+    path('contas-a-receber/exportar/', views.exportar_contas_receber_view, name='exportar_contas_receber'),
     path('contas-a-receber/nova/', views.conta_receber_form_view, name='conta_receber_nova'),
     path('contas-a-receber/<int:pk>/editar/', views.conta_receber_form_view, name='conta_receber_editar'),
     path('contas-a-receber/<int:pk>/receber/', views.marcar_conta_receber_recebida, name='marcar_conta_receber_recebida'),
+    path('contas-a-receber/liquidar/', views.liquidar_contas_view, {'lado': 'receber'}, name='liquidar_contas_receber'),
     path('contas-a-receber/<int:pk>/deletar/', views.conta_receber_delete_view, name='conta_receber_deletar'), 
     
+    # URL da API do Dashboard
+    path('api/dashboard/', views.dashboard_api_view, name='dashboard_api'),
+
+    # URLs do relatório de vencimentos (aging) por cliente ou fornecedor: receber ou pagar
+    path('vencimentos/<slug:lado>/', views.aging_view, name='aging'),
+    path('api/vencimentos/<slug:lado>/', views.aging_api_view, name='aging_api'),
+
+    # URL da projeção do fluxo de caixa (30, 90 ou 180 dias)
+    path('api/fluxo-caixa/', views.fluxo_caixa_api_view, name='fluxo_caixa_api'),
+
+    # URL das buscas incrementais (autocomplete)
+    path('api/autocomplete/<slug:fonte>/', views.autocomplete_view, name='autocomplete'),
+
+    # URL da busca textual global
+    path('api/busca/', views.busca_api_view, name='busca_api'),
+
+    # URL dos saldos de estoque por data ou período (razão de movimentos)
+    path('api/estoque/', views.estoque_api_view, name='estoque_api'),
+
+    # URL da importação de vendas em lote (CSV/JSONL)
+    path('api/vendas/importar/', views.importar_vendas_api_view, name='importar_vendas_api'),
+
     # URL da API do Chatbot
     path('api/ask/', views.ask_api_view, name='ask_api'),
+    path('api/ask/stream/', views.ask_stream_api_view, name='ask_stream_api'),
     # URL de login e logout
     path('sair/', views.logout_view, name='logout_view'),
     # URL Análise Financeira